@@ -0,0 +1,5 @@
+"""
+Latency benchmarks for the ML serving path.
+
+Run from the backend/ directory, e.g. `python -m benchmarks.bench_forest_engine`.
+"""
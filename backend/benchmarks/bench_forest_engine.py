@@ -0,0 +1,60 @@
+"""
+Compares RandomForestClassifier.predict_proba with the packed flat-array engine.
+
+Usage (from backend/):
+    python -m benchmarks.bench_forest_engine [--repeat 200]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from heartproject.ml_model import DATA_PATH, MODEL_VARIANTS, model_registry
+
+
+def best_of(fn, repeat):
+    """Median wall time of `repeat` calls, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    df = pd.read_csv(DATA_PATH)
+    print(f"{'variant':<8} {'rows':>6} {'sklearn ms':>11} {'packed ms':>10} {'speedup':>8}")
+    for variant in MODEL_VARIANTS:
+        loaded = model_registry.get(variant)
+        if loaded.handles_missing:
+            continue
+        raw = df[list(loaded.feature_columns)].values
+        # A folded packed forest takes raw rows; the sklearn model always takes scaled ones
+        X_packed_all = loaded.model_input(raw)
+        X_sklearn_all = loaded.scaler.transform(raw)
+        packed = loaded.packed_forest
+
+        for rows in (1, 100, len(raw)):
+            X_packed, X_sklearn = X_packed_all[:rows], X_sklearn_all[:rows]
+            repeat = args.repeat if rows == 1 else max(5, args.repeat // 10)
+            sklearn_ms = best_of(lambda: loaded.model.predict_proba(X_sklearn), repeat)
+            packed_ms = best_of(lambda: packed.predict_proba(X_packed), repeat)
+            # sklearn accumulates trees in thread completion order when n_jobs != 1,
+            # so compare against the deterministic single-threaded order
+            n_jobs = loaded.model.n_jobs
+            loaded.model.n_jobs = 1
+            expected = loaded.model.predict_proba(X_sklearn)
+            loaded.model.n_jobs = n_jobs
+            assert np.array_equal(expected, packed.predict_proba(X_packed)), \
+                f"packed forest disagrees with sklearn for {variant} on {rows} rows"
+            print(f"{variant:<8} {rows:>6} {sklearn_ms:>11.3f} {packed_ms:>10.3f} {sklearn_ms / packed_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
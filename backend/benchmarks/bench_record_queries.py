@@ -0,0 +1,163 @@
+"""
+Query plans and latency of the MedicalRecord / Patient access paths, before
+and after the composite indexes of migration 0010.
+
+A throwaway SQLite database is migrated to 0009 (no composite indexes) and
+filled with synthetic doctors, patients and records. Every endpoint query is
+EXPLAINed and timed. The database is then migrated to the latest state and
+measured again.
+
+Usage (from backend/):
+    python -m benchmarks.bench_record_queries [--records 1000000] [--patients 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def setup_django(db_path):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'heartproject.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = db_path
+
+    import django
+    django.setup()
+
+
+def populate(n_records, n_patients, patients_per_doctor, seed=0):
+    from django.db import connection, transaction
+
+    rng = random.Random(seed)
+    n_doctors = max(1, n_patients // patients_per_doctor)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    user_rows = [
+        (i, 'pbkdf2_sha256$x', f'user{i}@example.com', f'user{i}@example.com', 'First', 'Last', False, False, True, now.isoformat())
+        for i in range(1, n_doctors + n_patients + 1)
+    ]
+    doctors = list(range(1, n_doctors + 1))
+    patients = list(range(n_doctors + 1, n_doctors + n_patients + 1))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO auth_user (id, password, username, email, first_name, last_name, '
+            'is_superuser, is_staff, is_active, date_joined) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
+            user_rows
+        )
+        cursor.executemany(
+            'INSERT INTO predictor_patient (doctor_id, user_id, created_at) VALUES (%s, %s, %s)',
+            [(doctors[i % n_doctors], user_id, (now + timedelta(minutes=i)).isoformat()) for i, user_id in enumerate(patients)]
+        )
+
+        batch = []
+        for i in range(n_records):
+            created = now + timedelta(seconds=i)
+            batch.append((
+                rng.choice(patients), rng.randint(20, 90), rng.choice('01'), rng.randint(50, 130),
+                rng.randint(90, 180), rng.randint(50, 110), rng.uniform(70, 300), rng.uniform(0, 20),
+                rng.uniform(0, 2), rng.uniform(0, 100), created.isoformat()
+            ))
+            if len(batch) == 50000 or i == n_records - 1:
+                cursor.executemany(
+                    'INSERT INTO predictor_medicalrecord (user_id, age, gender, heart_rate, systolic_bp, '
+                    'diastolic_bp, blood_sugar, ck_mb, troponin, result, created_at) '
+                    'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
+                    batch
+                )
+                batch = []
+        cursor.execute('ANALYZE')
+    return doctors, patients
+
+
+def endpoint_queries(apps, doctor_id, patient_user_id, patient_id, record_id):
+    """
+    The queries behind each endpoint, as lazy querysets over the models of
+    `apps` (the migrated schema's historical models before the migration).
+    """
+    MedicalRecord = apps.get_model('predictor', 'MedicalRecord')
+    Patient = apps.get_model('predictor', 'Patient')
+
+    records = MedicalRecord.objects.filter(user_id=patient_user_id)
+    return {
+        'get_patient_history': records.order_by('-created_at')[:10],
+        'get_assessment_detail (record)': MedicalRecord.objects.filter(id=record_id),
+        'get_assessment_detail (history)': records.order_by('created_at').values('id', 'created_at', 'result'),
+        'get_specific_patient_history (patient)': Patient.objects.filter(id=patient_id, doctor_id=doctor_id),
+        'get_specific_patient_history (records)': records.order_by('-created_at'),
+        'get_doctor_patients': Patient.objects.filter(doctor_id=doctor_id)
+            .select_related('user', 'user__risk_summary').order_by('-created_at'),
+        'doctor/patient link check': Patient.objects.filter(doctor_id=doctor_id, user_id=patient_user_id),
+    }
+
+
+def measure(apps, samples, repeat):
+    results = {}
+    for args in samples:
+        for name, queryset in endpoint_queries(apps, *args).items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - start)
+            entry = results.setdefault(name, {'timings': [], 'plan': queryset.explain()})
+            entry['timings'].extend(timings)
+    return {
+        name: {'median_ms': statistics.median(entry['timings']) * 1000, 'plan': entry['plan']}
+        for name, entry in results.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=1_000_000)
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--patients-per-doctor', type=int, default=40)
+    parser.add_argument('--samples', type=int, default=20, help="Random patients queried per phase")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        from django.apps import apps
+        from django.core.management import call_command
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+
+        call_command('migrate', 'predictor', '0009', verbosity=0)
+        call_command('migrate', 'token_blacklist', verbosity=0)
+        # The current models select columns added by later migrations; query 0009 with its historical models
+        before_apps = MigrationExecutor(connection).loader.project_state(('predictor', '0009_patientrisksummary')).apps
+        MedicalRecord = before_apps.get_model('predictor', 'MedicalRecord')
+        Patient = before_apps.get_model('predictor', 'Patient')
+
+        start = time.perf_counter()
+        populate(args.records, args.patients, args.patients_per_doctor)
+        print(f"Loaded {args.records} records for {args.patients} patients in {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(1)
+        patients = list(Patient.objects.values_list('doctor_id', 'user_id', 'id'))
+        samples = []
+        for doctor_id, user_id, patient_id in rng.sample(patients, min(args.samples, len(patients))):
+            record_id = MedicalRecord.objects.filter(user_id=user_id).values_list('id', flat=True).first()
+            samples.append((doctor_id, user_id, patient_id, record_id))
+
+        before = measure(before_apps, samples, args.repeat)
+        start = time.perf_counter()
+        call_command('migrate', verbosity=0)
+        print(f"Applied index migration in {time.perf_counter() - start:.1f}s\n")
+        after = measure(apps, samples, args.repeat)
+
+        print(f"{'query':<42} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+        for name in before:
+            b, a = before[name]['median_ms'], after[name]['median_ms']
+            print(f"{name:<42} {b:>10.3f} {a:>10.3f} {b / a:>7.1f}x")
+
+        for name in before:
+            print(f"\n== {name}\n-- before:\n{before[name]['plan']}\n-- after:\n{after[name]['plan']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Micro-benchmark suite for the ML serving path: artifact loading, scaling,
+inference and SHAP for the full and reduced models at batch sizes 1 to 10k.
+sklearn/shap cases are timed next to the in-tree packed forest and native
+TreeSHAP engines that serve requests by default.
+
+Every case is timed until --min-time has elapsed (at least --min-repeat
+calls). The results are written as JSON so two commits can be compared.
+Batches larger than the dataset are drawn from it with replacement.
+
+Usage (from backend/):
+    python -m benchmarks.bench_serving run [--output results.json] [--sizes 1,10,100,1000,10000]
+                                           [--cases predict_proba,shap_values] [--min-time 0.5]
+    python -m benchmarks.bench_serving compare baseline.json candidate.json [--threshold 0.1]
+
+compare prints the time ratio (median by default, --metric min_ms is
+steadier on noisy machines) of every case in both files. It exits with
+status 1 when a case is slower than the baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+import shap
+import sklearn
+
+from heartproject.ml_model import (
+    DATA_PATH, MODEL_VARIANTS, load_model_and_scaler, positive_class_shap, predict_risk, prediction_cache
+)
+from heartproject.forest_engine import PackedForest
+from heartproject.tree_shap import NativeTreeShap
+
+FORMAT_VERSION = 1
+DEFAULT_SIZES = (1, 10, 100, 1000, 10000)
+
+
+def measure(fn, min_time, min_repeat, max_repeat=10000):
+    """Calls fn until min_time seconds and min_repeat calls have passed; returns timings in seconds."""
+    timings = []
+    total = 0.0
+    while len(timings) < max_repeat and (len(timings) < min_repeat or total < min_time):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+        total += elapsed
+    return timings
+
+
+def summarize(name, variant, batch_size, timings):
+    ms = np.asarray(timings) * 1000
+    median = float(np.median(ms))
+    return {
+        'name': name,
+        'variant': variant,
+        'batch_size': batch_size,
+        'repeat': len(ms),
+        'median_ms': median,
+        'min_ms': float(ms.min()),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'per_row_us': median * 1000 / batch_size if batch_size else None,
+    }
+
+
+def batch(X_all, size, rng):
+    if size <= len(X_all):
+        return X_all[:size]
+    return X_all[rng.integers(0, len(X_all), size)]
+
+
+def variant_cases(variant, sizes, X_raw):
+    """Yields (name, batch_size, fn) for one model variant."""
+    feature_columns, model_path, scaler_path = MODEL_VARIANTS[variant]
+    model, scaler = load_model_and_scaler(model_path, scaler_path)
+    # Single-threaded like the serving path (see forest_engine.PackedForest)
+    model.n_jobs = 1
+    packed = PackedForest.from_sklearn(model)
+    native = NativeTreeShap.from_sklearn(model)
+    folded = packed.fold_scaler(scaler.mean_, scaler.scale_)
+    folded_native = native.fold_scaler(scaler.mean_, scaler.scale_)
+    explainer = shap.TreeExplainer(model)
+    sample = dict(zip(feature_columns, X_raw[0].tolist()))
+
+    yield 'load_model_and_scaler', None, lambda: load_model_and_scaler(model_path, scaler_path)
+    yield 'load_model', None, lambda: joblib.load(model_path)
+    yield 'tree_explainer_build', None, lambda: shap.TreeExplainer(model)
+    yield 'native_explainer_build', None, lambda: NativeTreeShap.from_sklearn(model)
+
+    def uncached_predict_risk():
+        prediction_cache.clear()
+        predict_risk(sample, use_reduced_model=variant == 'reduced')
+    yield 'predict_risk', 1, uncached_predict_risk
+
+    for size in sizes:
+        X = X_raw[:size]
+        scaled = scaler.transform(X)
+        yield 'scaler_transform', size, lambda X=X: scaler.transform(X)
+        yield 'predict_proba', size, lambda X=scaled: model.predict_proba(X)
+        yield 'packed_predict_proba', size, lambda X=scaled: packed.predict_proba(X)
+        yield 'shap_values', size, lambda X=scaled: positive_class_shap(explainer, X)
+        yield 'native_shap_values', size, lambda X=scaled: native.shap_values(X)
+        yield 'folded_predict_proba', size, lambda X=X: folded.predict_proba(X)
+        yield 'folded_shap_values', size, lambda X=X: folded_native.shap_values(X)
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__,
+        'shap': shap.__version__,
+    }
+
+
+def run(args):
+    sizes = [int(s) for s in args.sizes.split(',')]
+    wanted = set(args.cases.split(',')) if args.cases else None
+    rng = np.random.default_rng(0)
+    df = pd.read_csv(DATA_PATH)
+
+    results = []
+    print(f"{'case':<24} {'variant':<8} {'batch':>6} {'median ms':>10} {'p95 ms':>10} {'us/row':>9} {'n':>5}")
+    for variant in args.variants.split(','):
+        feature_columns = MODEL_VARIANTS[variant][0]
+        X_raw = batch(df[list(feature_columns)].values.astype(float), max(sizes), rng)
+        for name, size, fn in variant_cases(variant, sizes, X_raw):
+            if wanted and name not in wanted:
+                continue
+            result = summarize(name, variant, size, measure(fn, args.min_time, args.min_repeat))
+            results.append(result)
+            per_row = f"{result['per_row_us']:>9.2f}" if result['per_row_us'] is not None else f"{'-':>9}"
+            print(
+                f"{name:<24} {variant:<8} {size or '-':>6} {result['median_ms']:>10.3f} "
+                f"{result['p95_ms']:>10.3f} {per_row} {result['repeat']:>5}"
+            )
+
+    report = {'format_version': FORMAT_VERSION, 'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+    return 0
+
+
+def _keyed(report):
+    return {(r['name'], r['variant'], r['batch_size']): r for r in report['results']}
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    base, cand = _keyed(baseline), _keyed(candidate)
+
+    print(f"baseline  {baseline['environment'].get('commit')}")
+    print(f"candidate {candidate['environment'].get('commit')}")
+    print(f"{'case':<24} {'variant':<8} {'batch':>6} {'base ms':>10} {'new ms':>10} {'ratio':>7}")
+    metric = args.metric
+    regressions = []
+    for key in sorted(base.keys() & cand.keys(), key=lambda k: (k[1], k[0], k[2] or 0)):
+        name, variant, size = key
+        ratio = cand[key][metric] / base[key][metric]
+        flag = ''
+        if ratio > 1 + args.threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        elif ratio < 1 - args.threshold:
+            flag = '  improved'
+        print(
+            f"{name:<24} {variant:<8} {size or '-':>6} {base[key][metric]:>10.3f} "
+            f"{cand[key][metric]:>10.3f} {ratio:>6.2f}x{flag}"
+        )
+
+    for key in sorted(base.keys() ^ cand.keys(), key=str):
+        print(f"only in {'baseline' if key in base else 'candidate'}: {key}")
+    print(f"{len(regressions)} regressions beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the benchmarks")
+    run_parser.add_argument('--output', help="Write the results as JSON to this path")
+    run_parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="Comma-separated batch sizes")
+    run_parser.add_argument('--variants', default=','.join(MODEL_VARIANTS), help="Comma-separated model variants")
+    run_parser.add_argument('--cases', help="Comma-separated case names to run (default: all)")
+    run_parser.add_argument('--min-time', type=float, default=0.5, help="Seconds spent timing each case")
+    run_parser.add_argument('--min-repeat', type=int, default=3, help="Minimum calls per case")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser('compare', help="Compare two JSON result files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help="Relative slowdown counted as a regression")
+    compare_parser.add_argument('--metric', choices=('median_ms', 'min_ms', 'p95_ms'), default='median_ms')
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+
+if __name__ == '__main__':
+    main()
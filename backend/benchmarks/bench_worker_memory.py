@@ -0,0 +1,114 @@
+"""
+Per-worker memory of N forked workers serving both model variants.
+
+Each scenario runs in a fresh interpreter that forks `--workers` children,
+the way a pre-forking WSGI server does. Every child scores one full and one
+partial reading, then reports RSS, PSS (RSS with shared pages divided among
+the processes mapping them) and USS (private pages) from
+/proc/self/smaps_rollup while all children are still alive.
+
+Scenarios:
+    joblib          every worker unpickles its own copy after fork (default)
+    joblib-preload  master loads the joblib artifacts before fork
+    mmap            every worker maps the packed .npy artifacts after fork
+    mmap-preload    master maps the packed artifacts before fork
+
+Usage (from backend/, Linux only):
+    python -m heartproject.packed_artifacts        # once, for the mmap scenarios
+    python -m benchmarks.bench_worker_memory [--workers 4]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SCENARIOS = ('joblib', 'joblib-preload', 'mmap', 'mmap-preload')
+
+FULL_INPUT = {
+    'Age': 50, 'Gender': 1, 'Heart rate': 70, 'Systolic blood pressure': 120,
+    'Diastolic blood pressure': 80, 'Blood sugar': 100, 'CK-MB': 2.5, 'Troponin': 0.02
+}
+
+
+def memory_kb():
+    values = {}
+    with open('/proc/self/smaps_rollup') as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1])
+    return {
+        'rss': values.get('Rss', 0),
+        'pss': values.get('Pss', 0),
+        'uss': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def serve():
+    from heartproject import ml_model
+
+    ml_model.warm_up()
+    ml_model.predict_risk(FULL_INPUT)
+    ml_model.predict_risk(FULL_INPUT, use_reduced_model=True)
+
+
+def run_scenario(scenario, workers):
+    if scenario.endswith('-preload'):
+        from heartproject.ml_model import preload_for_fork
+        preload_for_fork()
+
+    children = []
+    for _ in range(workers):
+        ready_r, ready_w = os.pipe()
+        go_r, go_w = os.pipe()
+        result_r, result_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            serve()
+            os.write(ready_w, b'1')
+            os.read(go_r, 1)
+            os.write(result_w, json.dumps(memory_kb()).encode())
+            os._exit(0)
+        children.append((pid, ready_r, go_w, result_r))
+
+    for _, ready_r, _, _ in children:
+        os.read(ready_r, 1)
+    for _, _, go_w, _ in children:
+        os.write(go_w, b'1')
+
+    results = []
+    for pid, _, _, result_r in children:
+        results.append(json.loads(os.read(result_r, 4096)))
+        os.waitpid(pid, 0)
+
+    summary = {key: sum(r[key] for r in results) / len(results) for key in ('rss', 'pss', 'uss')}
+    summary['total_pss'] = sum(r['pss'] for r in results)
+    print(json.dumps(summary))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--scenario', choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args.scenario, args.workers)
+        return
+
+    print(f"{args.workers} workers, per-worker averages in MiB")
+    print(f"{'scenario':<16} {'RSS':>8} {'PSS':>8} {'USS':>8} {'total PSS':>10}")
+    for scenario in SCENARIOS:
+        env = dict(os.environ, HEART_ARTIFACT_FORMAT=scenario.split('-')[0], PYTHONWARNINGS='ignore')
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_worker_memory', '--scenario', scenario, '--workers', str(args.workers)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        summary = json.loads(output.strip().splitlines()[-1])
+        print(f"{scenario:<16} {summary['rss'] / 1024:>8.1f} {summary['pss'] / 1024:>8.1f} "
+              f"{summary['uss'] / 1024:>8.1f} {summary['total_pss'] / 1024:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class HeartprojectConfig(AppConfig):
+    name = 'heartproject'
+
+    def ready(self):
+        from .authentication import connect_signals
+        connect_signals()
@@ -0,0 +1,116 @@
+"""
+DRF authentication classes.
+
+TimedJWTAuthentication is simplejwt's database-backed authentication. It
+is timed as the 'auth' phase of Server-Timing.
+
+StatelessJWTAuthentication (opt-in with HEART_STATELESS_JWT=1) skips the
+per-request User fetch. request.user is built from the signed claims that
+api_login adds to the tokens (see token_claims). It is a real User instance
+whose other fields are deferred, so ORM filters and foreign keys work
+unchanged, and a field that is not in the token is loaded only when a view
+reads it. Revocation is honoured through a cached set of users, see
+revoked_users().
+"""
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max
+from django.db.models.signals import post_save
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .ml_model import timed_phase
+
+# User fields carried in the token and set on the stateless request.user
+CLAIM_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+REVOCATIONS_CACHE_KEY = 'jwt-revoked-users'
+REVOCATIONS_TTL = 30  # seconds
+
+
+def token_claims(user, role):
+    """Claims added to a user's refresh token; access tokens inherit them."""
+    claims = {field: getattr(user, field) for field in CLAIM_FIELDS}
+    claims['name'] = user.get_full_name().strip()
+    claims['role'] = role
+    return claims
+
+
+def token_user_id(validated_token):
+    # simplejwt stores the id claim as a string
+    return User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+
+
+def claims_user(validated_token):
+    """A User built from token claims with every other field deferred (no query)."""
+    values = {'id': token_user_id(validated_token)}
+    values.update((field, validated_token[field]) for field in CLAIM_FIELDS)
+    fields = [f.attname for f in User._meta.concrete_fields if f.attname in values]
+    user = User.from_db(DEFAULT_DB_ALIAS, fields, [values[name] for name in fields])
+    user.token_role = validated_token.get('role')
+    return user
+
+
+def revoked_users():
+    """
+    {user id: unix time} of users whose tokens issued before that time are
+    no longer accepted. A blacklisted refresh token revokes its user's
+    access tokens issued before the blacklisting, and an inactive user is
+    revoked outright. Only blacklistings recent enough to matter for a live
+    access token are kept. The result is cached for REVOCATIONS_TTL seconds,
+    and blacklisting a token or saving a user clears it.
+    """
+    revoked = cache.get(REVOCATIONS_CACHE_KEY)
+    if revoked is None:
+        since = datetime.now(timezone.utc) - api_settings.ACCESS_TOKEN_LIFETIME
+        blacklisted = (
+            BlacklistedToken.objects.filter(blacklisted_at__gte=since, token__user__isnull=False)
+            .values('token__user_id').annotate(at=Max('blacklisted_at')).values_list('token__user_id', 'at')
+        )
+        revoked = {user_id: at.timestamp() for user_id, at in blacklisted}
+        inactive = User.objects.filter(is_active=False).values_list('id', flat=True)
+        revoked.update((user_id, float('inf')) for user_id in inactive)
+        cache.set(REVOCATIONS_CACHE_KEY, revoked, REVOCATIONS_TTL)
+    return revoked
+
+
+def _clear_revocations(sender, update_fields=None, **kwargs):
+    # Logins save only last_login; that cannot revoke anything
+    if sender is User and update_fields is not None and 'is_active' not in update_fields:
+        return
+    cache.delete(REVOCATIONS_CACHE_KEY)
+
+
+def connect_signals():
+    post_save.connect(_clear_revocations, sender=BlacklistedToken, dispatch_uid='jwt_revocations_blacklisted')
+    post_save.connect(_clear_revocations, sender=User, dispatch_uid='jwt_revocations_user_saved')
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """simplejwt authentication, reported as the 'auth' phase of Server-Timing."""
+
+    def authenticate(self, request):
+        with timed_phase('auth'):
+            return super().authenticate(request)
+
+
+class StatelessJWTAuthentication(TimedJWTAuthentication):
+    """Authenticates from token claims alone; see the module docstring."""
+
+    def get_user(self, validated_token):
+        if not all(field in validated_token for field in CLAIM_FIELDS):
+            # Issued before the claims were added: fall back to the DB lookup
+            return super().get_user(validated_token)
+
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        revoked_at = revoked_users().get(token_user_id(validated_token))
+        if revoked_at is not None and validated_token.get('iat', 0) < revoked_at:
+            raise AuthenticationFailed("Token has been revoked", code='token_revoked')
+        return claims_user(validated_token)
@@ -0,0 +1,362 @@
+"""
+Post-training forest compression under an accuracy budget.
+
+    python -m heartproject.compression [--variants full,reduced] [--tolerance 0.005]
+                                       [--collapse-tolerance 0.002] [--no-compact] [--publish]
+
+Three steps shrink the live model of each variant. The held-out split that
+training.py scores candidates on is halved (stratified): a step is kept
+only if the AUC and accuracy on the validation half stay within
+`tolerance` of the original forest's, and tree selection stops on that
+half too. The reported AUC and accuracy come from the test half, which no
+decision sees.
+
+1. Split collapsing: a split over two leaves is replaced by one leaf when
+   merging them changes the tree's expected output by at most
+   `collapse_tolerance`, weighted by the share of training samples that
+   reach the leaves. This repeats bottom-up, so deep branches fitted to a
+   handful of samples fold away. A tolerance of 0 only merges identical
+   leaves.
+2. Tree selection: trees are added greedily, each time the one that brings
+   the subset's probabilities closest to the whole forest's on every
+   dataset row outside the test half (no labels used). This stops once the
+   validation AUC and accuracy are within the tolerance and the predicted class matches the
+   forest on all but a `tolerance` share of the rows.
+3. float32 packing: the packed forest stores thresholds rounded down to
+   float32, which changes no split decision, and float32 leaf
+   probabilities (see PackedForest.compact). With ml_model.FOLD_SCALER
+   (the default) the thresholds are folded raw-feature values and stay
+   float64, so only the leaf probabilities shrink.
+
+Each step is reported with trees, nodes, joblib and packed sizes, load
+time, single-row inference/SHAP latency, AUC and accuracy, all measured
+on the packed forest as it is served (folded with FOLD_SCALER). The
+report is written to data/training/. With --publish, the compressed model
+becomes the variant's current version (see model_store.py).
+"""
+import argparse
+import copy
+import io
+import json
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.tree._tree import Tree
+
+from .forest_engine import PackedForest
+from .ml_model import FOLD_SCALER, MODEL_VARIANTS, ModelRegistry
+from .model_store import ModelStore
+from .packed_artifacts import export_packed, load_packed
+from .training import LATENCY_ROWS, REPORT_DIR, cache_dataset, load_xy, measure_serving
+
+TOLERANCE = 0.005
+COLLAPSE_TOLERANCE = 0.002
+
+# sklearn's markers for leaf nodes (tree/_tree.pyx)
+TREE_LEAF = -1
+TREE_UNDEFINED = -2
+
+
+def scores(proba, y):
+    """(AUC, accuracy) of positive-class probabilities; accuracy thresholds like predict()."""
+    return float(roc_auc_score(y, proba)), float(np.mean((proba > 0.5) == y))
+
+
+def holdout_splits(dataset_dir, feature_columns, test_size=0.2, random_state=42):
+    """
+    Raw-feature rows for compress(): the rows outside the test half, the
+    validation half (X, y) and the test half (X, y) of training.py's
+    held-out split.
+    """
+    X, y = load_xy(dataset_dir, feature_columns)
+    X_train, X_holdout, _, y_holdout = train_test_split(
+        X.to_numpy(dtype=float), y, test_size=test_size, random_state=random_state, stratify=y
+    )
+    X_val, X_test, y_val, y_test = train_test_split(
+        X_holdout, y_holdout, test_size=0.5, random_state=random_state, stratify=y_holdout
+    )
+    return np.vstack([X_train, X_val]), (X_val, y_val), (X_test, y_test)
+
+
+def per_tree_proba(model, X):
+    """Positive-class probability of every tree for every row, shape (n_trees, n_samples)."""
+    forest = PackedForest.from_sklearn(model)
+    return forest.leaf_proba[forest.apply(X).T][:, :, 1]
+
+
+def select_trees(model, X, y, X_fit=None, tolerance=TOLERANCE, target=None):
+    """
+    Greedy forward selection of the trees that best reproduce the forest's
+    probabilities on X_fit (default X). Returns the sorted indices of the
+    first subset whose AUC and accuracy on (X, y) are within `tolerance` of
+    `target` (default: the whole forest's) and whose predicted class agrees
+    with the forest's on at least 1 - tolerance of X_fit.
+    """
+    X_fit = X if X_fit is None else X_fit
+    tree_proba = per_tree_proba(model, X)
+    fit_proba = per_tree_proba(model, X_fit)
+    forest_fit = fit_proba.mean(axis=0)
+    target_auc, target_accuracy = target or scores(tree_proba.mean(axis=0), y)
+
+    selected = []
+    total, fit_total = np.zeros(X.shape[0]), np.zeros(X_fit.shape[0])
+    remaining = np.arange(len(tree_proba))
+    while len(remaining):
+        k = len(selected) + 1
+        errors = (((fit_total + fit_proba[remaining]) / k - forest_fit) ** 2).mean(axis=1)
+        best = remaining[np.argmin(errors)]
+        selected.append(int(best))
+        remaining = remaining[remaining != best]
+        total += tree_proba[best]
+        fit_total += fit_proba[best]
+
+        auc, accuracy = scores(total / k, y)
+        agreement = np.mean((fit_total / k > 0.5) == (forest_fit > 0.5))
+        if auc >= target_auc - tolerance and accuracy >= target_accuracy - tolerance and agreement >= 1 - tolerance:
+            break
+    return sorted(selected)
+
+
+def collapse_tree(estimator, tolerance=0.0):
+    """
+    Copy of a fitted DecisionTreeClassifier whose redundant splits are
+    collapsed into leaves (see the module docstring). The merged leaf holds
+    the sample-weighted class distribution of the two leaves.
+
+    Returns:
+        tuple: (estimator, number of splits removed)
+    """
+    state = estimator.tree_.__getstate__()
+    nodes, values = state['nodes'], state['values'].copy()
+    left, right = nodes['left_child'], nodes['right_child']
+    weights = nodes['weighted_n_node_samples']
+    proba = values[:, 0, :] / np.maximum(values[:, 0, :].sum(axis=1, keepdims=True), 1e-300)
+    is_leaf = left == TREE_LEAF
+
+    collapsed = 0
+    # Children always come after their parent, so this visits them first
+    for node in range(len(nodes) - 1, -1, -1):
+        if is_leaf[node] or not (is_leaf[left[node]] and is_leaf[right[node]]):
+            continue
+        l, r = left[node], right[node]
+        merged = (weights[l] * proba[l] + weights[r] * proba[r]) / (weights[l] + weights[r])
+        # Expected change of the tree's output over the training distribution
+        change = (weights[l] * np.abs(proba[l] - merged).max() + weights[r] * np.abs(proba[r] - merged).max())
+        if change > tolerance * weights[0]:
+            continue
+        if np.array_equal(proba[l], proba[r]):
+            values[node] = values[l]
+        else:
+            values[node, 0] = merged * values[node, 0].sum()
+        proba[node] = values[node, 0] / values[node, 0].sum()
+        is_leaf[node] = True
+        collapsed += 1
+
+    # Renumber the reachable nodes in depth-first order, as sklearn builds them
+    order, depths, stack = [], [], [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        order.append(node)
+        depths.append(depth)
+        if not is_leaf[node]:
+            stack.append((right[node], depth + 1))
+            stack.append((left[node], depth + 1))
+    new_id = {node: i for i, node in enumerate(order)}
+
+    new_nodes = nodes[order].copy()
+    for i, node in enumerate(order):
+        if is_leaf[node]:
+            new_nodes[i]['left_child'] = new_nodes[i]['right_child'] = TREE_LEAF
+            new_nodes[i]['feature'] = TREE_UNDEFINED
+            new_nodes[i]['threshold'] = TREE_UNDEFINED
+        else:
+            new_nodes[i]['left_child'] = new_id[left[node]]
+            new_nodes[i]['right_child'] = new_id[right[node]]
+
+    tree = estimator.tree_
+    pruned = Tree(tree.n_features, np.asarray(tree.n_classes, dtype=np.intp), tree.n_outputs)
+    pruned.__setstate__({
+        'max_depth': max(depths),
+        'node_count': len(order),
+        'nodes': new_nodes,
+        'values': np.ascontiguousarray(values[order]),
+    })
+    result = copy.deepcopy(estimator)
+    result.tree_ = pruned
+    return result, collapsed
+
+
+def collapse_forest(model, tolerance=COLLAPSE_TOLERANCE):
+    """Copy of a fitted forest with collapse_tree() applied to every tree; returns (model, splits removed)."""
+    collapsed = copy.copy(model)
+    collapsed.estimators_, removed = [], 0
+    for estimator in model.estimators_:
+        estimator, n = collapse_tree(estimator, tolerance)
+        collapsed.estimators_.append(estimator)
+        removed += n
+    return collapsed, removed
+
+
+def subset_forest(model, indices):
+    """Shallow copy of a fitted forest keeping only the trees at `indices`."""
+    subset = copy.copy(model)
+    subset.estimators_ = [model.estimators_[i] for i in indices]
+    subset.n_estimators = len(subset.estimators_)
+    return subset
+
+
+def measure_stage(name, model, scaler, validation, test, compact=False, fold_scaler=None):
+    """
+    Size, load time, latency, validation and test scores of one compression
+    stage, as served. validation and test are (X_raw, y) pairs.
+    """
+    fold_scaler = FOLD_SCALER if fold_scaler is None else fold_scaler
+    packed = PackedForest.from_sklearn(model)
+    if fold_scaler:
+        packed = packed.fold_scaler(scaler.mean_, scaler.scale_)
+    if compact:
+        packed = packed.compact()
+
+    def stage_scores(X_raw, y):
+        return scores(packed.predict_proba(X_raw if fold_scaler else scaler.transform(X_raw))[:, 1], y)
+
+    val_auc, val_accuracy = stage_scores(*validation)
+    auc, accuracy = stage_scores(*test)
+    X_raw = test[0]
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    start = time.perf_counter()
+    buffer.seek(0)
+    joblib.load(buffer)
+    joblib_load_ms = (time.perf_counter() - start) * 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export_packed(model, scaler, [f'x{i}' for i in range(X_raw.shape[1])], Path(tmp) / 'a', compact=compact,
+                      fold_scaler=fold_scaler)
+        packed_bytes = sum(path.stat().st_size for path in (Path(tmp) / 'a').iterdir())
+        start = time.perf_counter()
+        load_packed(Path(tmp) / 'a', mmap=False)
+        packed_load_ms = (time.perf_counter() - start) * 1000
+
+    serving = measure_serving(model, scaler, X_raw[:LATENCY_ROWS], packed=packed)
+    return {
+        'stage': name,
+        'n_trees': packed.n_trees,
+        'node_count': packed.node_count,
+        'joblib_bytes': serving['size_bytes'],
+        'packed_bytes': packed_bytes,
+        'forest_bytes': packed.nbytes,
+        'joblib_load_ms': joblib_load_ms,
+        'packed_load_ms': packed_load_ms,
+        'infer_ms': serving['infer_ms'],
+        'shap_ms': serving['shap_ms'],
+        'val_auc': val_auc,
+        'val_accuracy': val_accuracy,
+        'auc': auc,
+        'accuracy': accuracy,
+    }
+
+
+def compress(model, scaler, validation, test, X_fit_raw=None, tolerance=TOLERANCE,
+             collapse_tolerance=COLLAPSE_TOLERANCE, compact=True):
+    """
+    Compresses a fitted forest, validating every step on the validation
+    rows and scoring every step on the test rows (both (X_raw, y) pairs,
+    see holdout_splits). X_fit_raw (default: the validation rows) are the
+    unlabelled rows that tree selection reproduces the forest on.
+
+    Returns:
+        tuple: (compressed model, whether to pack it in float32, per-step
+        reports, each marked 'accepted' or not)
+    """
+    X_val_raw, y_val = validation
+    X_val = scaler.transform(X_val_raw)
+    X_fit = X_val if X_fit_raw is None else scaler.transform(X_fit_raw)
+    original = measure_stage('original', model, scaler, validation, test)
+    original['accepted'] = True
+    stages = [original]
+
+    def accept(stage):
+        stage['accepted'] = (stage['val_auc'] >= original['val_auc'] - tolerance
+                             and stage['val_accuracy'] >= original['val_accuracy'] - tolerance)
+        stages.append(stage)
+        return stage['accepted']
+
+    collapsed, removed = collapse_forest(model, collapse_tolerance)
+    stage = measure_stage('collapsed splits', collapsed, scaler, validation, test)
+    stage['splits_removed'] = removed
+    if accept(stage):
+        model = collapsed
+
+    subset = subset_forest(model, select_trees(
+        model, X_val, y_val, X_fit, tolerance, target=(original['val_auc'], original['val_accuracy'])
+    ))
+    if accept(measure_stage('tree subset', subset, scaler, validation, test)):
+        model = subset
+
+    if compact:
+        compact = accept(measure_stage('float32', model, scaler, validation, test, compact=True))
+    return model, compact, stages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', default=','.join(MODEL_VARIANTS), help="Comma-separated model variants")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="Max drop in validation AUC and accuracy")
+    parser.add_argument('--collapse-tolerance', type=float, default=COLLAPSE_TOLERANCE,
+                        help="Max expected change of a tree's output per collapsed split (0: identical leaves only)")
+    parser.add_argument('--no-compact', action='store_true', help="Keep the packed forest in float64")
+    parser.add_argument('--publish', action='store_true', help="Publish the compressed models as current versions")
+    args = parser.parse_args(argv)
+
+    store = ModelStore()
+    registry = ModelRegistry(artifact_format='joblib', store=store)
+    dataset_dir = cache_dataset()
+    report = {}
+    for variant in args.variants.split(','):
+        feature_columns = MODEL_VARIANTS[variant][0]
+        entry = registry.get(variant)
+        X_fit, validation, test = holdout_splits(dataset_dir, feature_columns)
+        compressed, compact, stages = compress(
+            entry.model, entry.scaler, validation, test, X_fit,
+            args.tolerance, args.collapse_tolerance, compact=not args.no_compact
+        )
+        report[variant] = {'source_version': entry.version, 'compact': compact, 'stages': stages}
+
+        print(f"{variant} ({entry.version})")
+        print(f"  {'stage':<17} {'trees':>5} {'nodes':>6} {'joblib KiB':>10} {'packed KiB':>10} "
+              f"{'load ms':>7} {'infer ms':>8} {'shap ms':>7} {'val AUC':>7} {'AUC':>7} {'acc':>7}  kept")
+        for s in stages:
+            print(f"  {s['stage']:<17} {s['n_trees']:>5} {s['node_count']:>6} {s['joblib_bytes'] / 1024:>10.0f} "
+                  f"{s['packed_bytes'] / 1024:>10.0f} {s['packed_load_ms']:>7.2f} {s['infer_ms']:>8.3f} "
+                  f"{s['shap_ms']:>7.3f} {s['val_auc']:>7.4f} {s['auc']:>7.4f} {s['accuracy']:>7.4f}  "
+                  f"{'yes' if s['accepted'] else 'no'}")
+
+        if args.publish:
+            final = [s for s in stages if s['accepted']][-1]
+            version = store.publish(
+                variant, compressed, entry.scaler, feature_columns,
+                metrics={'test_accuracy': final['accuracy'], 'test_auc': final['auc']},
+                params={**compressed.get_params(), 'compressed_from': entry.version,
+                        'tolerance': args.tolerance, 'collapse_tolerance': args.collapse_tolerance},
+                compact=compact,
+            )
+            report[variant]['version'] = version
+            print(f"  published as {version}")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = REPORT_DIR / f"compression-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    path.write_text(json.dumps({'settings': vars(args), 'variants': report}, indent=2))
+    print(f"Report written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Latency and error of the SHAP methods against exact TreeSHAP.
+
+    python -m heartproject.explain_modes [--variants full,reduced] [--latency-rows 50]
+
+ml_model.SHAP_METHODS trades precision for speed:
+
+    exact   path-dependent TreeSHAP (HEART_EXPLAINER_BACKEND, native by default)
+    saabas  path attribution: one walk down every tree (tree_shap.SaabasExplainer)
+    table   per-feature lookup of mean exact SHAP values by value bin,
+            precomputed from the dataset (tree_shap.LookupTableExplainer)
+
+A deployment picks one with HEART_SHAP_METHOD. A request can override it
+with ?shap_method= on the prediction endpoints, or with the shap_method
+argument of predict_risk.
+
+For every variant this explains each dataset row with each method and
+reports the following, written to data/training/:
+- median single-row latency
+- mean and max absolute error against exact SHAP
+- relative error (sum of absolute errors / sum of absolute exact values)
+- how often the feature with the largest absolute value matches exact SHAP
+
+The lookup table is built from the same rows, so its error is in-sample.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .ml_model import (
+    SHAP_METHODS, ExplainerCache, ModelRegistry, load_and_prepare_data, positive_class_shap, served_variants,
+)
+from .training import LATENCY_ROWS, REPORT_DIR
+
+
+def evaluate(loaded, X_raw, explainers, latency_rows=LATENCY_ROWS):
+    """One row per SHAP method: latency and error against the exact values on X_raw."""
+    X = loaded.model_input(X_raw)
+    exact = positive_class_shap(explainers.for_method(loaded, 'exact'), X)
+    exact_top = np.abs(exact).argmax(axis=1)
+
+    rows = []
+    for method in SHAP_METHODS:
+        explainer = explainers.for_method(loaded, method)
+        values = positive_class_shap(explainer, X)
+        error = np.abs(values - exact)
+
+        timings = []
+        for row in X[:latency_rows]:
+            start = time.perf_counter()
+            positive_class_shap(explainer, row[np.newaxis])
+            timings.append(time.perf_counter() - start)
+
+        rows.append({
+            'method': method,
+            'latency_ms': float(np.median(timings)) * 1000,
+            'mean_abs_error': float(error.mean()),
+            'max_abs_error': float(error.max()),
+            'relative_error': float(error.sum() / np.abs(exact).sum()),
+            'top_feature_agreement': float((np.abs(values).argmax(axis=1) == exact_top).mean()),
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', default=','.join(served_variants()), help="Comma-separated model variants")
+    parser.add_argument('--latency-rows', type=int, default=LATENCY_ROWS, help="Rows timed one at a time")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(artifact_format='joblib')
+    explainers = ExplainerCache(registry)
+    report = {}
+    for variant in args.variants.split(','):
+        loaded = registry.get(variant)
+        X, _ = load_and_prepare_data(list(loaded.feature_columns))
+        rows = evaluate(loaded, X.to_numpy(dtype=float), explainers, args.latency_rows)
+        report[variant] = {'version': loaded.version, 'methods': rows}
+
+        print(f"{variant} ({loaded.version}, {len(X)} rows)")
+        print(f"  {'method':<7} {'ms/row':>7} {'mean err':>9} {'max err':>8} {'rel err':>8} {'top match':>9}")
+        for row in rows:
+            print(f"  {row['method']:<7} {row['latency_ms']:>7.3f} {row['mean_abs_error']:>9.5f} "
+                  f"{row['max_abs_error']:>8.4f} {row['relative_error']:>8.3f} {row['top_feature_agreement']:>9.3f}")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = REPORT_DIR / f"explain-modes-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    path.write_text(json.dumps({'settings': vars(args), 'variants': report}, indent=2))
+    print(f"Report written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Deferred SHAP explanations.
+
+The risk percentage is cheap; the SHAP explanation is the slow part of a
+prediction. With HEART_SHAP_MODE set to 'thread' or 'queue' the prediction
+endpoints save the record with explanation_status='pending' and return
+immediately, and the explanation is filled in afterwards:
+
+    sync    explain inline before saving (default, previous behaviour)
+    thread  explain on an in-process thread pool once the record is committed
+    queue   leave pending records for `manage.py process_explanations`
+
+The frontend polls /api/result/<id>/ until the status leaves 'pending'.
+Pending records keep the SHAP method requested with the prediction.
+Processors claim records in a short transaction that sets a lease
+(explanation_claimed_until) and compute SHAP outside it, so no row locks
+or transaction are held during the slow part. A processor that dies
+leaves its claim to expire after CLAIM_SECONDS.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from predictor.models import MedicalRecord
+
+from .ml_model import explain_risk_batch, is_partial_record, model_input_from_record, shap_rows_to_dicts
+
+logger = logging.getLogger(__name__)
+
+EXPLANATION_MODES = ('sync', 'thread', 'queue')
+EXPLANATION_MODE = os.environ.get('HEART_SHAP_MODE', 'sync')
+if EXPLANATION_MODE not in EXPLANATION_MODES:
+    raise ValueError(f"HEART_SHAP_MODE must be one of {EXPLANATION_MODES}, got {EXPLANATION_MODE!r}")
+
+# Worker threads for 'thread' mode; SHAP is CPU bound, so a couple is plenty
+THREAD_WORKERS = int(os.environ.get('HEART_SHAP_THREADS', '2'))
+
+# Records explained per scaler/SHAP call
+EXPLAIN_BATCH_SIZE = 256
+
+# Seconds a processor holds the records it claimed before others may claim them again
+CLAIM_SECONDS = 300
+
+RECORD_FIELDS = (
+    'age', 'gender', 'heart_rate', 'systolic_bp', 'diastolic_bp', 'blood_sugar', 'ck_mb', 'troponin'
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_deferred():
+    """True when predictions should be saved before their SHAP explanation."""
+    return EXPLANATION_MODE != 'sync'
+
+
+def _record_data(record):
+    return {field: getattr(record, field) for field in RECORD_FIELDS}
+
+
+def explain_records(records):
+    """
+    Computes and stores SHAP values for the given records, one SHAP call per
+    model variant, version and SHAP method. Records are explained by the model version
+    that scored them (see ModelRegistry.get_version). Records whose group
+    fails, e.g. because that version is no longer published, are marked 'failed'.
+
+    Returns:
+        tuple: (number explained, number failed)
+    """
+    groups = {}
+    for record in records:
+        data = _record_data(record)
+        key = (is_partial_record(data), record.model_version or None, record.shap_method or None)
+        groups.setdefault(key, []).append((record, model_input_from_record(data)))
+        record.explanation_claimed_until = None
+
+    done, failed = [], []
+    for (use_reduced, version, shap_method), members in groups.items():
+        group_records = [record for record, _ in members]
+        try:
+            shap_matrix, columns = explain_risk_batch(
+                [row for _, row in members], use_reduced_model=use_reduced, version=version,
+                shap_method=shap_method
+            )
+        except Exception:
+            logger.exception("SHAP explanation failed for records %s", [r.id for r in group_records])
+            for record in group_records:
+                record.explanation_status = MedicalRecord.EXPLANATION_FAILED
+            failed.extend(group_records)
+            continue
+        for record, shap_dict in zip(group_records, shap_rows_to_dicts(shap_matrix, columns)):
+            record.shap_values = shap_dict
+            record.explanation_status = MedicalRecord.EXPLANATION_READY
+        done.extend(group_records)
+
+    MedicalRecord.objects.bulk_update(
+        done + failed, ['shap_values', 'explanation_status', 'explanation_claimed_until']
+    )
+    return len(done), len(failed)
+
+
+def claim_pending(batch_size=EXPLAIN_BATCH_SIZE, record_ids=None):
+    """
+    Claims up to batch_size pending, unclaimed records, oldest first, for
+    CLAIM_SECONDS. Rows are locked with SKIP LOCKED (where the database
+    supports it) only while the claim is written, so several processors can
+    drain the queue side by side.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        pending = MedicalRecord.objects.filter(explanation_status=MedicalRecord.EXPLANATION_PENDING).filter(
+            Q(explanation_claimed_until__isnull=True) | Q(explanation_claimed_until__lt=now)
+        )
+        if record_ids is not None:
+            pending = pending.filter(id__in=record_ids)
+        batch = list(
+            pending.select_for_update(skip_locked=True)
+            .only('id', 'model_version', 'shap_method', *RECORD_FIELDS)
+            .order_by('id')[:batch_size]
+        )
+        MedicalRecord.objects.filter(id__in=[record.id for record in batch]).update(
+            explanation_claimed_until=now + timedelta(seconds=CLAIM_SECONDS)
+        )
+    return batch
+
+
+def process_pending(batch_size=EXPLAIN_BATCH_SIZE, record_ids=None):
+    """
+    Claims up to batch_size pending records (see claim_pending) and explains
+    them outside the claiming transaction.
+
+    Returns:
+        tuple: (number explained, number failed)
+    """
+    return explain_records(claim_pending(batch_size, record_ids))
+
+
+def _explain_in_thread(record_ids):
+    close_old_connections()
+    try:
+        for start in range(0, len(record_ids), EXPLAIN_BATCH_SIZE):
+            process_pending(record_ids=record_ids[start:start + EXPLAIN_BATCH_SIZE])
+    except Exception:
+        # Left 'pending'; `manage.py process_explanations` picks them up later
+        logger.exception("Background SHAP explanation failed")
+    finally:
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix='shap')
+    return _executor
+
+
+def schedule(records):
+    """
+    Queues SHAP explanations for freshly saved pending records. In 'thread'
+    mode the work is submitted once the surrounding transaction commits; in
+    'queue' mode the rows themselves are the queue.
+    """
+    if EXPLANATION_MODE != 'thread':
+        return
+    record_ids = [record.id for record in records]
+    transaction.on_commit(lambda: _get_executor().submit(_explain_in_thread, record_ids))
@@ -0,0 +1,67 @@
+"""
+Streaming exports of a patient's assessment history.
+
+Rows are read with QuerySet.iterator(chunk_size=...) and encoded one at a
+time, so memory stays flat no matter how many records are exported.
+"""
+import csv
+import json
+
+from .ml_model import FEATURE_COLUMNS
+
+EXPORT_CHUNK_SIZE = 500
+
+RECORD_FIELDS = [
+    'id', 'created_at', 'age', 'gender', 'heart_rate', 'systolic_bp', 'diastolic_bp',
+    'blood_sugar', 'ck_mb', 'troponin', 'result',
+]
+
+# SHAP values flattened into one column per model feature, e.g. 'CK-MB' -> 'shap_ck_mb'
+SHAP_COLUMNS = {
+    feature: 'shap_' + feature.lower().replace(' ', '_').replace('-', '_')
+    for feature in FEATURE_COLUMNS
+}
+
+EXPORT_COLUMNS = RECORD_FIELDS + list(SHAP_COLUMNS.values())
+
+
+def export_rows(queryset):
+    """Yields one flat dict per record, oldest first."""
+    rows = (
+        queryset.order_by('created_at', 'id')
+        .values_list(*RECORD_FIELDS, 'shap_values')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    for values in rows:
+        row = dict(zip(RECORD_FIELDS, values[:-1]))
+        row['created_at'] = row['created_at'].isoformat()
+        shap_values = values[-1] or {}
+        for feature, column in SHAP_COLUMNS.items():
+            # Partial assessments have no CK-MB/Troponin contribution
+            row[column] = shap_values.get(feature)
+        yield row
+
+
+class _Echo:
+    """File-like object whose write() returns the line for the generator to yield."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset):
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_COLUMNS)
+    yield writer.writeheader()
+    for row in export_rows(queryset):
+        yield writer.writerow(row)
+
+
+def stream_ndjson(queryset):
+    for row in export_rows(queryset):
+        yield json.dumps(row) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+}
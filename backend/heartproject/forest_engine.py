@@ -0,0 +1,218 @@
+"""
+Packed inference engine for the trained Random Forests.
+
+All trees are concatenated into a handful of contiguous NumPy arrays (split
+feature, threshold, children and per-leaf class probabilities) and evaluated
+level by level for every (row, tree) pair at once. This avoids the per-call
+joblib/thread dispatch of RandomForestClassifier.predict_proba, which
+dominates single-row latency for a model trained with n_jobs=-1.
+
+Results are bit-identical to sklearn: inputs are cast to float32 and compared
+against float64 thresholds exactly as the Cython trees do, leaf probabilities
+are normalized with the same operations and the per-tree probabilities are
+accumulated in estimator order before dividing by the number of trees.
+
+fold_scaler() rewrites the thresholds to apply to raw features. The
+folded forest takes its decisions on float64 inputs that have not been
+scaled, and they are identical to the scaled float32 decisions (see
+fold_thresholds).
+"""
+import numpy as np
+
+# Rows evaluated together; keeps the (rows, trees) working set cache-sized
+CHUNK_ROWS = 256
+
+_INT64_MIN = np.iinfo(np.int64).min
+_FLOAT64_MAX = np.finfo(np.float64).max
+
+
+def _ordered(x):
+    """Maps float64 values to int64 keys with the same order (-0.0 and 0.0 share a key)."""
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return np.where(bits < 0, _INT64_MIN - bits, bits)
+
+
+def _from_ordered(keys):
+    return np.where(keys < 0, _INT64_MIN - keys, keys).astype(np.int64).view(np.float64)
+
+
+def fold_thresholds(thresholds, features, mean, scale):
+    """
+    Raw-feature thresholds r such that, for every float64 x,
+        x <= r   <=>   float32((x - mean[f]) / scale[f]) <= t
+    i.e. the split decisions of a tree fitted on StandardScaler output,
+    taken on unscaled input. The right-hand side is exactly what
+    transform() and the float32 cast of the trees compute. It is monotone in
+    x, so r is the largest float64 that satisfies it. r is found by
+    bisecting the ordered bit patterns of float64, 64 steps for all
+    thresholds at once.
+    """
+    t = np.asarray(thresholds, dtype=np.float64)
+    m = np.asarray(mean, dtype=np.float64)[features]
+    s = np.asarray(scale, dtype=np.float64)[features]
+
+    def goes_left(x):
+        # Probes near +-FLOAT64_MAX overflow to +-inf, which still compares correctly
+        with np.errstate(over='ignore'):
+            return ((x - m) / s).astype(np.float32) <= t
+
+    # Invariant: goes_left(lo) and not goes_left(hi)
+    lo = np.full(t.shape, _ordered(-_FLOAT64_MAX))
+    hi = np.full(t.shape, _ordered(_FLOAT64_MAX))
+    for _ in range(64):
+        # Overflow-free floor((lo + hi) / 2)
+        mid = (lo >> 1) + (hi >> 1) + (lo & hi & 1)
+        left = goes_left(_from_ordered(mid))
+        lo = np.where(left, mid, lo)
+        hi = np.where(left, hi, mid)
+    return _from_ordered(lo)
+
+
+class PackedForest:
+    """Flat-array representation of a fitted RandomForestClassifier."""
+
+    # Arrays that fully describe the forest (see arrays() / packed_artifacts.py)
+    ARRAY_NAMES = ('feature', 'threshold', 'children', 'leaf_proba', 'roots', 'classes')
+
+    def __init__(self, feature, threshold, children, leaf_proba, roots, classes, max_depth, n_features,
+                 raw_input=False):
+        self.feature = feature
+        self.threshold = threshold
+        # children[2 * node + went_left]: right child at even, left child at odd
+        # positions, so one gather replaces two gathers and a where()
+        self.children = children
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        # True once fold_scaler() has rewritten the thresholds for unscaled float64 input
+        self.raw_input = bool(raw_input)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        features, thresholds, children, probas, roots = [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(offset, offset + n)
+
+            # Leaves point at themselves so extra iterations are no-ops
+            left = np.where(is_leaf, node_ids, tree.children_left + offset)
+            right = np.where(is_leaf, node_ids, tree.children_right + offset)
+            children.append(np.stack([right, left], axis=1).ravel())
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+
+            # Same normalization as DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :].copy()
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+            probas.append(proba)
+
+            roots.append(offset)
+            offset += n
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp),
+            leaf_proba=np.concatenate(probas),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=np.asarray(model.classes_),
+            max_depth=max(e.tree_.max_depth for e in model.estimators_),
+            n_features=model.n_features_in_,
+        )
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    def compact(self):
+        """
+        Returns a copy with float32 thresholds and leaf probabilities. Node
+        indices stay intp, because gathers with narrower indices pay for a
+        conversion on every level.
+
+        Thresholds are rounded down to the nearest float32. For float32 inputs,
+        x <= t64 holds exactly when x <= round_down(t64), so every split
+        decision is unchanged. Leaf probabilities are stored as float32, which
+        is the only lossy part (below 1e-7), and they are still summed in
+        float64. A folded forest compares float64 inputs, so it keeps its
+        float64 thresholds.
+        """
+        threshold = self.threshold
+        if not self.raw_input:
+            threshold = threshold.astype(np.float32)
+            above = threshold.astype(np.float64) > self.threshold
+            threshold[above] = np.nextafter(threshold[above], np.float32(-np.inf))
+        return PackedForest(
+            feature=self.feature,
+            threshold=threshold,
+            children=self.children,
+            leaf_proba=self.leaf_proba.astype(np.float32),
+            roots=self.roots,
+            classes=self.classes,
+            max_depth=self.max_depth,
+            n_features=self.n_features,
+            raw_input=self.raw_input,
+        )
+
+    def fold_scaler(self, mean, scale):
+        """Returns a copy that takes unscaled features; see fold_thresholds()."""
+        if self.raw_input:
+            return self
+        internal = self.children[1::2] != np.arange(self.node_count)
+        threshold = self.threshold.astype(np.float64)
+        threshold[internal] = fold_thresholds(threshold[internal], self.feature[internal], mean, scale)
+        return PackedForest(
+            feature=self.feature,
+            threshold=threshold,
+            children=self.children,
+            leaf_proba=self.leaf_proba,
+            roots=self.roots,
+            classes=self.classes,
+            max_depth=self.max_depth,
+            n_features=self.n_features,
+            raw_input=True,
+        )
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays().values())
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.feature)
+
+    def apply(self, X):
+        """Returns the global leaf index reached in every tree, shape (n_samples, n_trees)."""
+        X = np.asarray(X, dtype=np.float64 if self.raw_input else np.float32)
+        if X.shape[0] <= CHUNK_ROWS:
+            return self._apply_chunk(X)
+        return np.vstack([self._apply_chunk(X[i:i + CHUNK_ROWS]) for i in range(0, X.shape[0], CHUNK_ROWS)])
+
+    def _apply_chunk(self, X):
+        n_samples = X.shape[0]
+        flat_X = np.ascontiguousarray(X).ravel()
+        row_offsets = (np.arange(n_samples) * self.n_features)[:, np.newaxis]
+
+        nodes = np.broadcast_to(self.roots, (n_samples, self.n_trees))
+        for _ in range(self.max_depth):
+            go_left = flat_X[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = self.children[2 * nodes + go_left]
+        return nodes
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        # (n_trees, n_samples, n_classes), summed over trees in estimator order
+        per_tree = self.leaf_proba[leaves.T]
+        proba = per_tree.sum(axis=0, dtype=np.float64)
+        proba /= self.n_trees
+        return proba
@@ -0,0 +1,298 @@
+"""
+In-process metrics registry (counters and histograms) rendered in the
+Prometheus text exposition format at /metrics.
+
+Each process keeps its own values. With HEART_METRICS_DIR set (a directory
+shared by every worker of a pre-forking server), a background thread
+writes a snapshot of this process' values to <dir>/metrics-<pid>.json at
+most every FLUSH_INTERVAL seconds. /metrics then sums the snapshots of all
+workers. Snapshots of exited workers are kept so counters never go
+backwards; clear the directory when the server is restarted.
+
+HEART_METRICS=0 turns off the endpoint and the per-request metrics.
+
+Only scrapers may read /metrics: requests from HEART_METRICS_ALLOWED_IPS
+(comma-separated; loopback by default) or carrying
+`Authorization: Bearer <HEART_METRICS_TOKEN>`. Behind a reverse proxy every
+request comes from the proxy's address, so use the token there.
+"""
+import atexit
+import bisect
+import hmac
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_ENABLED = os.environ.get('HEART_METRICS', '1') == '1'
+METRICS_DIR = os.environ.get('HEART_METRICS_DIR') or None
+METRICS_TOKEN = os.environ.get('HEART_METRICS_TOKEN') or None
+METRICS_ALLOWED_IPS = frozenset(
+    ip.strip() for ip in os.environ.get('HEART_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+)
+FLUSH_INTERVAL = 1.0
+
+# Seconds; spans a cached prediction (~10 us) to a cold model load
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Queries per request
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def scrape_allowed(request):
+    """True if the request may read /metrics (see the module docstring)."""
+    if METRICS_TOKEN is not None:
+        scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return True
+    return request.META.get('REMOTE_ADDR') in METRICS_ALLOWED_IPS
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with self.registry.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+            self.registry.dirty = True
+
+    def merge(self, values, labels, value):
+        values[labels] = values.get(labels, 0) + value
+
+    def snapshot(self):
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+    def render(self, values):
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+            self.registry.dirty = True
+
+    def merge(self, values, labels, value):
+        counts, total = value
+        entry = values.get(labels)
+        if entry is None:
+            values[labels] = [list(counts), total]
+        else:
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+
+    def snapshot(self):
+        return [[list(labels), [list(counts), total]] for labels, (counts, total) in self.values.items()]
+
+    def render(self, values):
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                le = (('le', _number(float(bound))),)
+                yield f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_label_text(self.labelnames, labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = Path(directory) if directory else None
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._pid = os.getpid()
+        self._flusher = None
+        if self.directory is not None:
+            # Whatever a worker recorded since its last flush
+            atexit.register(self.flush)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        if self.directory is not None and METRICS_ENABLED:
+            self._start_flusher()
+        return metric
+
+    # Multi-process aggregation
+
+    def _snapshot_path(self, pid=None):
+        return self.directory / f"metrics-{pid or os.getpid()}.json"
+
+    def check_fork(self):
+        """Called per request: a forked worker inherits the parent's values and no flusher thread."""
+        if os.getpid() != self._pid:
+            with self.lock:
+                for metric in self.metrics.values():
+                    metric.values.clear()
+                self._pid = os.getpid()
+                self._flusher = None
+            self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while os.getpid() == pid:
+            time.sleep(FLUSH_INTERVAL)
+            if self.dirty:
+                self.flush()
+
+    def flush(self):
+        """Writes this process' values to its snapshot file in the shared directory."""
+        if self.directory is None:
+            return
+        with self.lock:
+            snapshot = {name: metric.snapshot() for name, metric in self.metrics.items()}
+            self.dirty = False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._snapshot_path()
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(snapshot))
+        os.replace(tmp, path)
+
+    def collect(self):
+        """Returns {metric name: {labels: value}} summed over every process."""
+        self.check_fork()
+        if self.directory is None:
+            with self.lock:
+                snapshots = [{name: metric.snapshot() for name, metric in self.metrics.items()}]
+        else:
+            self.flush()
+            snapshots = []
+            for path in self.directory.glob('metrics-*.json'):
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue
+
+        totals = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, rows in snapshot.items():
+                if name in totals:
+                    for labels, value in rows:
+                        self.metrics[name].merge(totals[name], tuple(labels), value)
+        return totals
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        values = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.render(values[name]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# HTTP (recorded by heartproject.middleware.ServerTimingMiddleware)
+http_requests = registry.counter(
+    'heart_http_requests_total', "HTTP requests by view, method and status.", ('view', 'method', 'status')
+)
+http_latency = registry.histogram(
+    'heart_http_request_duration_seconds', "Request latency by view.", ('view',)
+)
+request_phase_latency = registry.histogram(
+    'heart_request_phase_duration_seconds', "Time spent in each instrumented phase of a request.", ('view', 'phase')
+)
+db_queries = registry.histogram(
+    'heart_db_queries_per_request', "DB queries issued per request.", ('view',), buckets=COUNT_BUCKETS
+)
+db_latency = registry.histogram(
+    'heart_db_duration_seconds', "Total DB query time per request.", ('view',)
+)
+
+# Predictions (recorded by heartproject.ml_model)
+prediction_latency = registry.histogram(
+    'heart_prediction_duration_seconds', "Model prediction latency (scale, infer, SHAP) by model variant.", ('variant',)
+)
+shap_latency = registry.histogram(
+    'heart_shap_duration_seconds', "SHAP explanation latency by model variant.", ('variant',)
+)
+predicted_rows = registry.counter(
+    'heart_predicted_rows_total', "Rows scored by the model by variant.", ('variant',)
+)
+prediction_cache_lookups = registry.counter(
+    'heart_prediction_cache_lookups_total', "Prediction cache lookups by result (hit or miss).", ('result',)
+)
+model_registry_lookups = registry.counter(
+    'heart_model_registry_lookups_total', "Model registry lookups by result (hit or load).", ('variant', 'result')
+)
+
+# Assessments (recorded by heartproject.views)
+assessments = registry.counter(
+    'heart_assessments_total', "Saved assessments by kind (full or partial).", ('kind',)
+)
+
+
+@contextmanager
+def timer(histogram, *labels):
+    """Observes the duration of the block in `histogram`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+def observe_request(view, method, status, total_seconds, timings):
+    """Records one request served by the view named `view` (its URL name)."""
+    http_requests.inc(view, method, str(status))
+    http_latency.observe(total_seconds, view)
+    for phase, seconds in timings.phases.items():
+        request_phase_latency.observe(seconds, view, phase)
+    db_queries.observe(timings.db_queries, view)
+    db_latency.observe(timings.db_seconds, view)
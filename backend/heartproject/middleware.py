@@ -0,0 +1,94 @@
+"""
+Per-request timing breakdown.
+
+ServerTimingMiddleware collects the phases recorded with
+ml_model.timed_phase() (auth, validate, model_load, scale, infer, shap,
+db_save) together with the number and duration of DB queries, and reports
+them in a Server-Timing response header:
+
+    Server-Timing: auth;dur=0.41, validate;dur=0.12, scale;dur=0.20, infer;dur=0.07,
+                   shap;dur=2.31, db_save;dur=1.05, db;dur=0.98;desc="4 queries", total;dur=4.62
+
+Browser dev tools show the header in the network timing panel. The header
+tells any client how long authentication, the model and the database took,
+so it is only sent with HEART_SERVER_TIMING=1 (for debugging and load tests).
+With HEART_TIMING_LOG=1 every request also emits one JSON log line on the
+'heartproject.timing' logger. The same numbers feed the request histograms
+of heartproject.metrics.
+
+Streamed responses (the CSV/NDJSON history exports) get no header: headers
+go out before the body is generated, so their timings, in the log line and
+metrics too, only cover the work done before the first row.
+"""
+import json
+import logging
+import os
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import metrics
+from .ml_model import start_phase_timings, stop_phase_timings
+
+SERVER_TIMING_ENABLED = os.environ.get('HEART_SERVER_TIMING', '0') == '1'
+TIMING_LOG_ENABLED = os.environ.get('HEART_TIMING_LOG', '0') == '1'
+
+logger = logging.getLogger('heartproject.timing')
+
+
+def _query_timer(timings):
+    """execute_wrapper that counts the queries of the request and their time."""
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            timings.db_queries += 1
+            timings.db_seconds += time.perf_counter() - start
+    return wrapper
+
+
+def format_server_timing(timings, total_seconds):
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.phases.items()]
+    entries.append(f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.db_queries} queries"')
+    entries.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ', '.join(entries)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        if not (SERVER_TIMING_ENABLED or TIMING_LOG_ENABLED or metrics.METRICS_ENABLED):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if metrics.METRICS_ENABLED:
+            metrics.registry.check_fork()
+        timings, token = start_phase_timings()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_query_timer(timings)):
+                response = self.get_response(request)
+        finally:
+            stop_phase_timings(token)
+        total = time.perf_counter() - start
+
+        request.phase_timings = timings
+        if SERVER_TIMING_ENABLED and not response.streaming:
+            response['Server-Timing'] = format_server_timing(timings, total)
+        if metrics.METRICS_ENABLED:
+            match = request.resolver_match
+            view = match.url_name if match and match.url_name else 'unmatched'
+            metrics.observe_request(view, request.method, response.status_code, total, timings)
+        if TIMING_LOG_ENABLED:
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 3),
+                'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in timings.phases.items()},
+                'db_queries': timings.db_queries,
+                'db_ms': round(timings.db_seconds * 1000, 3),
+            }))
+        return response
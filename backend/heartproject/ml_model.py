@@ -2,15 +2,33 @@
 Machine Learning model for heart disease risk prediction.
 Uses the Kaggle Medical Dataset to train a Random Forest classifier.
 """
+import contextvars
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, classification_report
 from pathlib import Path
 import joblib
 import shap
+from scipy.special import expit
+
+from . import metrics
+from .forest_engine import PackedForest
+from .model_store import ModelStore, artifact_version, file_checksum
+from .packed_artifacts import export_packed, load_packed
+from .tree_shap import BoostedTreeShap, LookupTableExplainer, NativeTreeShap, SaabasExplainer
+
+logger = logging.getLogger(__name__)
 
 # Paths
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,6 +39,9 @@ SCALER_PATH = BASE_DIR / 'data' / 'scaler.joblib'
 MODEL_PATH_REDUCED = BASE_DIR / 'data' / 'heart_model_reduced.joblib'
 SCALER_PATH_REDUCED = BASE_DIR / 'data' / 'scaler_reduced.joblib'
 
+MODEL_PATH_UNIFIED = BASE_DIR / 'data' / 'heart_model_unified.joblib'
+SCALER_PATH_UNIFIED = BASE_DIR / 'data' / 'scaler_unified.joblib'
+
 # Feature columns in order
 FEATURE_COLUMNS = [
     'Age', 'Gender', 'Heart rate', 
@@ -35,6 +56,103 @@ FEATURE_COLUMNS_REDUCED = [
     'Blood sugar'
 ]
 
+# Lab values that are 0 when they were not measured (see is_partial_record)
+LAB_COLUMNS = ('CK-MB', 'Troponin')
+
+# Serving mode: 'pair' (full model, reduced model for records without labs) or
+# 'unified' (one missing-value-aware model for every record, see unified_model.py)
+SERVING_MODE = os.environ.get('HEART_SERVING_MODE', 'pair')
+
+# SHAP backend: 'native' (vectorized TreeSHAP in tree_shap.py) or 'shap' (shap.TreeExplainer)
+EXPLAINER_BACKEND = os.environ.get('HEART_EXPLAINER_BACKEND', 'native')
+
+# How SHAP values are computed, per deployment or per request (see explain_modes.py):
+# 'exact' (TreeSHAP with EXPLAINER_BACKEND), 'saabas' (path attribution) or
+# 'table' (precomputed per-feature lookup). Boosted models are always explained exactly.
+SHAP_METHODS = ('exact', 'saabas', 'table')
+SHAP_METHOD = os.environ.get('HEART_SHAP_METHOD', 'exact')
+
+# Inference backend: 'packed' (flat-array engine in forest_engine.py) or 'sklearn' (predict_proba)
+INFERENCE_BACKEND = os.environ.get('HEART_INFERENCE_BACKEND', 'packed')
+
+# Artifact format: 'joblib' (private unpickled copy per process) or 'mmap'
+# (packed .npy arrays under PACKED_DIR shared by every worker on the host)
+ARTIFACT_FORMAT = os.environ.get('HEART_ARTIFACT_FORMAT', 'joblib')
+PACKED_DIR = BASE_DIR / 'data' / 'packed'
+
+# Fold the StandardScaler into the packed forest and native explainer, so
+# they take raw features and serving skips the transform (see forest_engine.fold_thresholds).
+# Folded thresholds are raw-feature float64 values: a compact forest then only
+# stores its leaf probabilities in float32 (4 more bytes per node than unfolded).
+# The scaler is still loaded, as mean/scale arrays from packed artifacts, because
+# the sklearn and shap backends scale their input.
+FOLD_SCALER = os.environ.get('HEART_FOLD_SCALER', '1') == '1'
+
+# Memoized predictions for resubmitted vitals: max entries (0 disables) and lifetime in seconds
+PREDICTION_CACHE_SIZE = int(os.environ.get('HEART_PREDICTION_CACHE_SIZE', '1024'))
+PREDICTION_CACHE_TTL = float(os.environ.get('HEART_PREDICTION_CACHE_TTL', '300'))
+
+# Versioned artifacts (see model_store.py) and how often each server process
+# checks for a new current version, in seconds (0 disables the background swap)
+MODELS_DIR = BASE_DIR / 'data' / 'models'
+MODEL_POLL_SECONDS = float(os.environ.get('HEART_MODEL_POLL_SECONDS', '5'))
+
+# Legacy unversioned artifacts, served until a variant has a published version:
+# name -> (feature columns, model path, scaler path)
+MODEL_VARIANTS = {
+    'full': (FEATURE_COLUMNS, MODEL_PATH, SCALER_PATH),
+    'reduced': (FEATURE_COLUMNS_REDUCED, MODEL_PATH_REDUCED, SCALER_PATH_REDUCED),
+}
+UNIFIED_VARIANTS = {
+    'unified': (FEATURE_COLUMNS, MODEL_PATH_UNIFIED, SCALER_PATH_UNIFIED),
+}
+
+
+def served_variants():
+    """Variants the current serving mode answers requests with."""
+    return tuple(UNIFIED_VARIANTS) if SERVING_MODE == 'unified' else tuple(MODEL_VARIANTS)
+
+
+# Per-request phase timings, filled in by timed_phase() while a collector is
+# active (see heartproject.middleware.ServerTimingMiddleware)
+_phase_timings = contextvars.ContextVar('heart_phase_timings', default=None)
+
+
+class PhaseTimings:
+    """Seconds spent in each named phase of one request, plus its DB queries."""
+
+    def __init__(self):
+        self.phases = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+def start_phase_timings():
+    """Starts collecting phase timings in the current context; returns (timings, token)."""
+    timings = PhaseTimings()
+    return timings, _phase_timings.set(timings)
+
+
+def stop_phase_timings(token):
+    _phase_timings.reset(token)
+
+
+@contextmanager
+def timed_phase(name):
+    """Adds the duration of the block to the active collector, if any (a no-op otherwise)."""
+    timings = _phase_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
 
 def load_and_prepare_data(feature_columns):
     df = pd.read_csv(DATA_PATH)
@@ -82,9 +200,6 @@ def train_model(feature_columns=FEATURE_COLUMNS, model_path=MODEL_PATH, scaler_p
     print(f"Scaler saved to {scaler_path}\n")
 
 
-
-
-
 def load_model_and_scaler(model_path=MODEL_PATH, scaler_path=SCALER_PATH):
     if not model_path.exists() or not scaler_path.exists():
         raise FileNotFoundError(
@@ -96,27 +211,798 @@ def load_model_and_scaler(model_path=MODEL_PATH, scaler_path=SCALER_PATH):
     return model, scaler
 
 
-def predict_risk(data, use_reduced_model=False):
+class LoadedModel:
+    """
+    A model variant loaded once per process and shared by every request.
+
+    The model, scaler and feature list must be treated as read-only; the
+    scaler statistics are frozen so accidental writes fail loudly. When the
+    variant comes from a memory-mapped packed artifact, the sklearn model is
+    only unpickled if a code path actually asks for it.
+
+    With fold_scaler the packed forest and native explainer take raw
+    features. Rows are prepared with model_input(), which then skips
+    the scaler. Missing-value-aware models (handles_missing) take raw
+    features with unmeasured labs as NaN and have no packed forest.
+    """
+
+    def __init__(self, variant, scaler, feature_columns, checksums, load_seconds,
+                 model=None, model_path=None, packed_forest=None, native_explainer=None,
+                 artifact_format='joblib', manifest=None, fold_scaler=False):
+        self.variant = variant
+        self.scaler = scaler
+        self.feature_columns = tuple(feature_columns)
+        self.checksums = checksums
+        self.load_seconds = load_seconds
+        self.artifact_format = artifact_format
+        self.native_explainer = native_explainer
+        self.fold_scaler = fold_scaler
+        self.manifest = manifest or {}
+        self.loaded_at = time.time()
+        self.hits = 0
+        self._model = model
+        self._model_path = model_path
+        self._packed_forest = packed_forest
+        self._model_lock = threading.Lock()
+
+        for attr in ('mean_', 'scale_', 'var_'):
+            value = getattr(scaler, attr, None)
+            if isinstance(value, np.ndarray) and value.flags.writeable:
+                value.flags.writeable = False
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = joblib.load(self._model_path)
+        return self._model
+
+    @property
+    def handles_missing(self):
+        """True for models that route NaN features themselves (HistGradientBoosting)."""
+        return self._packed_forest is None and isinstance(self.model, HistGradientBoostingClassifier)
+
+    @property
+    def packed_forest(self):
+        """Flat-array copy of the forest, built on first use; None for boosted models."""
+        if self._packed_forest is None:
+            if self.handles_missing:
+                return None
+            forest = PackedForest.from_sklearn(self.model)
+            if self.fold_scaler:
+                forest = forest.fold_scaler(self.scaler.mean_, self.scaler.scale_)
+            # Versions published by the compression step are served in float32
+            self._packed_forest = forest.compact() if self.manifest.get('compact') else forest
+        return self._packed_forest
+
+    def model_input(self, X):
+        """Raw feature rows as the packed forest and native explainer take them."""
+        if self.handles_missing:
+            return mark_missing_labs(X, self.feature_columns)
+        if self.fold_scaler:
+            return np.asarray(X, dtype=np.float64)
+        return self.scaler.transform(X)
+
+    def predict_positive(self, X, backend=None):
+        """Probability of the positive class for rows prepared by model_input()."""
+        backend = backend or INFERENCE_BACKEND
+        if backend == 'packed' and not self.handles_missing:
+            return self.packed_forest.predict_proba(X)[:, 1]
+        if backend in ('packed', 'sklearn'):
+            return self.model.predict_proba(self.scaler.transform(X) if self.fold_scaler else X)[:, 1]
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+    @property
+    def version(self):
+        """Short identifier of the artifact contents (changes whenever a file changes)."""
+        return artifact_version(self.checksums)
+
+    def stats(self):
+        return {
+            'variant': self.variant,
+            'version': self.version,
+            'features': list(self.feature_columns),
+            'checksums': dict(self.checksums),
+            'artifact_format': self.artifact_format,
+            'metrics': dict(self.manifest.get('metrics', {})),
+            'load_seconds': self.load_seconds,
+            'loaded_at': self.loaded_at,
+            'hits': self.hits,
+        }
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of (model, scaler, feature list) per variant.
+
+    Each variant is deserialized at most once per process; afterwards get()
+    is a dictionary lookup. A variant is served from the version its
+    CURRENT pointer names in the model store (see model_store.py), or from
+    the legacy MODEL_VARIANTS paths until one is published.
+
+    After start_watching() a daemon thread polls the CURRENT pointers. Only
+    server processes start it (heartproject.wsgi), so management commands
+    and tests do not poll. A new version is loaded and prepared (see `prepare`) on that thread
+    while requests keep using the old one, then swapped in with a single
+    assignment, so workers pick it up without a restart or a slow request.
+    The previous entry is kept as the variant's retired version, so work
+    that started on it (e.g. deferred explanations) can still finish with it.
+    get_version() also loads older versions from the model store, for
+    processors that never served the version a record was scored by.
+    """
+
+    def __init__(self, variants=None, artifact_format=None, packed_dir=None, store=None):
+        self._variants = dict(variants or {**MODEL_VARIANTS, **UNIFIED_VARIANTS})
+        self.artifact_format = artifact_format or ARTIFACT_FORMAT
+        self.packed_dir = Path(packed_dir or PACKED_DIR)
+        self.store = store if store is not None else ModelStore(MODELS_DIR)
+        self.watch_interval = 0
+        # Called with a freshly loaded entry before it is swapped in
+        self.prepare = None
+        self._entries = {}
+        self._retired = {}
+        # Per variant, the last older version loaded by get_version()
+        self._pinned = {}
+        self._lock = threading.Lock()
+        self._loads = 0
+        self._swaps = 0
+        self._watcher_pid = None
+        self._watcher = None
+        self._watch_stop = None
+
+    def get(self, variant, version=None):
+        """
+        The live entry of `variant`. With `version`, the retired entry is
+        returned if it is that version; otherwise the live one is.
+        """
+        if self.watch_interval and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        entry = self._entries.get(variant)
+        result = 'hit'
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(variant)
+                if entry is None:
+                    with timed_phase('model_load'):
+                        entry = self._load(variant)
+                    self._entries[variant] = entry
+                    result = 'load'
+        if version is not None and entry.version != version:
+            retired = self._retired.get(variant)
+            if retired is not None and retired.version == version:
+                entry = retired
+        metrics.model_registry_lookups.inc(variant, result)
+        with self._lock:
+            entry.hits += 1
+        return entry
+
+    def get_version(self, variant, version):
+        """
+        The entry of exactly `version` of a variant: the live or retired one,
+        or else that version loaded from the model store. Raises LookupError
+        when the store does not have it.
+        """
+        entry = self.get(variant, version=version)
+        if entry.version == version:
+            return entry
+        pinned = self._pinned.get(variant)
+        if pinned is not None and pinned.version == version:
+            return pinned
+        if not self.store.has_version(variant, version):
+            raise LookupError(f"No {variant} model version {version} to load")
+        entry = self._load(variant, version)
+        with self._lock:
+            self._pinned[variant] = entry
+        return entry
+
+    def _load(self, variant, version=None):
+        if variant not in self._variants:
+            raise KeyError(f"Unknown model variant: {variant}")
+        version = version or self.store.current_version(variant)
+        manifest = None
+        if version is not None:
+            manifest = self.store.read_manifest(variant, version)
+            version_dir = self.store.version_dir(variant, version)
+            feature_columns = manifest['feature_columns']
+            model_path, scaler_path = version_dir / 'model.joblib', version_dir / 'scaler.joblib'
+            packed_dir = version_dir / 'packed'
+        else:
+            feature_columns, model_path, scaler_path = self._variants[variant]
+            packed_dir = self.packed_dir / variant
+        if not model_path.exists() or not scaler_path.exists():
+            raise FileNotFoundError(
+                f"Model or scaler not found at {model_path} / {scaler_path}. "
+                "Please run train_model() first."
+            )
+
+        start = time.perf_counter()
+        if manifest is not None:
+            # Published versions are immutable; their manifest has the checksums
+            checksums = dict(manifest['checksums'])
+        else:
+            checksums = {
+                'model': file_checksum(model_path),
+                'scaler': file_checksum(scaler_path),
+            }
+
+        entry = None
+        # Boosted models are published without a packed artifact
+        if self.artifact_format == 'mmap' and (manifest or {}).get('packed', True):
+            entry = self._load_packed(variant, packed_dir, model_path, checksums)
+        if entry is None:
+            model, scaler = load_model_and_scaler(model_path, scaler_path)
+            entry = LoadedModel(variant, scaler, feature_columns, checksums, None, model=model,
+                                fold_scaler=FOLD_SCALER and isinstance(model, RandomForestClassifier))
+
+        entry.manifest = manifest or {}
+        entry.load_seconds = time.perf_counter() - start
+        self._loads += 1
+        return entry
+
+    def _load_packed(self, variant, artifact_dir, model_path, checksums):
+        if not (artifact_dir / 'manifest.json').exists():
+            logger.warning(
+                "No packed artifact at %s; loading joblib files. "
+                "Run `python -m heartproject.packed_artifacts` to export it.", artifact_dir
+            )
+            return None
+
+        artifact = load_packed(artifact_dir, mmap=True)
+        if artifact.manifest.get('source_checksums') != checksums:
+            logger.warning("Packed artifact at %s is stale; loading joblib files.", artifact_dir)
+            return None
+
+        return LoadedModel(
+            variant, artifact.scaler, artifact.feature_columns, checksums, None,
+            model_path=model_path, packed_forest=artifact.forest,
+            native_explainer=artifact.explainer, artifact_format='mmap',
+            fold_scaler=artifact.forest.raw_input
+        )
+
+    def swap(self, variant, version=None):
+        """
+        Loads `version` (default: the current one) of a variant, prepares it
+        and makes it the live entry. Returns the new entry, or None if that
+        version is already live.
+        """
+        version = version or self.store.current_version(variant)
+        live = self._entries.get(variant)
+        if version is None or (live is not None and live.version == version):
+            return None
+
+        entry = self._load(variant, version)
+        if self.prepare is not None:
+            self.prepare(entry)
+        with self._lock:
+            previous = self._entries.get(variant)
+            self._entries[variant] = entry
+            if previous is not None:
+                self._retired[variant] = previous
+            self._swaps += 1
+        logger.info(
+            "Serving %s model %s%s", variant, entry.version, f" (was {previous.version})" if previous else ""
+        )
+        return entry
+
+    def check_for_updates(self):
+        """Swaps in every loaded variant whose CURRENT pointer moved; returns the new entries."""
+        swapped = []
+        for variant in list(self._entries):
+            try:
+                entry = self.swap(variant)
+            except Exception:
+                # Keep serving the old version; the next poll retries
+                logger.exception("Could not load the new %s model", variant)
+                continue
+            if entry is not None:
+                swapped.append(entry)
+        return swapped
+
+    def start_watching(self, interval=MODEL_POLL_SECONDS):
+        """
+        Checks for new versions every `interval` seconds on a daemon thread
+        (0 disables it). After a fork, the worker's next get() starts its own.
+        """
+        if interval > 0:
+            self.watch_interval = interval
+            self._start_watcher()
+
+    def stop_watching(self, timeout=None):
+        """Stops the watcher thread, waiting up to `timeout` seconds for its current check."""
+        with self._lock:
+            self.watch_interval = 0
+            self._watcher_pid = None
+            watcher, stop = self._watcher, self._watch_stop
+            self._watcher = self._watch_stop = None
+        if stop is not None:
+            stop.set()
+        if watcher is not None and watcher is not threading.current_thread():
+            watcher.join(timeout)
+
+    @property
+    def watching(self):
+        return self._watcher is not None and self._watcher.is_alive()
+
+    def _start_watcher(self):
+        with self._lock:
+            # Threads do not survive fork(); every worker starts its own
+            if self._watcher_pid == os.getpid() or not self.watch_interval:
+                return
+            self._watcher_pid = os.getpid()
+            self._watch_stop = threading.Event()
+            self._watcher = threading.Thread(
+                target=self._watch, args=(self.watch_interval, self._watch_stop), name='model-watcher', daemon=True
+            )
+            self._watcher.start()
+
+    def _watch(self, interval, stop):
+        while not stop.wait(interval):
+            self.check_for_updates()
+
+    def versions(self, variant):
+        """Versions of a variant this registry can still serve (live, retired and pinned)."""
+        entries = (self._entries.get(variant), self._retired.get(variant), self._pinned.get(variant))
+        return {entry.version for entry in entries if entry}
+
+    def warm_up(self, variants=None):
+        """Loads the given variants (the served ones by default) ahead of the first request."""
+        for variant in variants or served_variants():
+            entry = self.get(variant)
+            if INFERENCE_BACKEND == 'packed':
+                # Build the flat-array engine ahead of the first request too
+                entry.packed_forest
+
+    def reload(self, variant=None):
+        """Forgets cached artifacts so the next get() reads them from disk again."""
+        with self._lock:
+            if variant is None:
+                self._entries.clear()
+                self._retired.clear()
+                self._pinned.clear()
+            else:
+                self._entries.pop(variant, None)
+                self._retired.pop(variant, None)
+                self._pinned.pop(variant, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loads': self._loads,
+                'swaps': self._swaps,
+                'variants': {name: entry.stats() for name, entry in self._entries.items()},
+                'retired': {name: entry.version for name, entry in self._retired.items()},
+            }
+
+
+model_registry = ModelRegistry()
+
+
+def variant_name(use_reduced_model=False):
+    if SERVING_MODE == 'unified':
+        return 'unified'
+    return 'reduced' if use_reduced_model else 'full'
+
+
+def mark_missing_labs(X, feature_columns):
+    """Rows as float64 with unmeasured (0) lab values as NaN, for models that route missing values."""
+    X = np.array(X, dtype=np.float64)
+    for col in LAB_COLUMNS:
+        if col in feature_columns:
+            j = list(feature_columns).index(col)
+            X[X[:, j] == 0, j] = np.nan
+    return X
+
+
+class ScaledExplainer:
+    """Scales raw rows before handing them to a shap explainer of the unfolded model."""
+
+    def __init__(self, explainer, scaler):
+        self.explainer = explainer
+        self.scaler = scaler
+        self.expected_value = explainer.expected_value
+
+    def shap_values(self, X):
+        return self.explainer.shap_values(self.scaler.transform(X))
+
+
+class ProbabilityExplainer:
+    """
+    Rescales the log-odds SHAP values of a boosted model to probability units.
+
+    Each row's values are multiplied by (p(x) - p(base)) / (f(x) - base), so
+    they keep their signs and ratios and, with expected_value = p(base), sum
+    to predict_proba(X)[:, 1] like the SHAP values of the forests.
+    """
+
+    def __init__(self, explainer):
+        self.explainer = explainer
+        self.base_value = float(np.ravel(explainer.expected_value)[-1])
+        self.expected_value = float(expit(self.base_value))
+
+    def shap_values(self, X):
+        values = positive_class_shap(self.explainer, X)
+        margin = values.sum(axis=1)
+        change = expit(self.base_value + margin) - self.expected_value
+        # A row predicted at the base value takes the slope of the sigmoid there
+        slope = self.expected_value * (1 - self.expected_value)
+        safe = np.where(np.abs(margin) > 1e-12, margin, 1.0)
+        return values * np.where(np.abs(margin) > 1e-12, change / safe, slope)[:, np.newaxis]
+
+
+def positive_class_shap(explainer, X):
+    """Runs an explainer on X and returns an (n_samples, n_features) array for class 1."""
+    if isinstance(explainer, NativeTreeShap):
+        return explainer.shap_values(X)
+
+    shap_vals = explainer.shap_values(X)
+    # Handle different SHAP output formats (sometimes array, sometimes list of arrays)
+    if isinstance(shap_vals, list):
+        return np.asarray(shap_vals[1])
+    if len(shap_vals.shape) == 3:
+        return shap_vals[:, :, 1]
+    return shap_vals
+
+
+class ExplainerCache:
+    """
+    Pre-built SHAP explainers keyed by (variant, artifact version, backend).
+
+    Building an explainer walks every tree of the forest, so it is done once
+    per artifact version (eagerly in warm_up() and before a hot swap)
+    instead of on every request. Besides the exact backends ('native',
+    'shap'), the approximate SHAP_METHODS are backends too: 'saabas' and
+    'table'. The table is built from the exact values on the dataset rows,
+    so hosts that serve it need DATA_PATH as well as the artifacts.
+    """
+
+    def __init__(self, registry=None, backend=None):
+        self.registry = registry or model_registry
+        self.backend = backend or EXPLAINER_BACKEND
+        self._explainers = {}
+        self._build_seconds = {}
+        self._lock = threading.Lock()
+
+    def for_method(self, loaded, shap_method=None):
+        """The explainer of a SHAP_METHODS entry (SHAP_METHOD by default)."""
+        shap_method = shap_method or SHAP_METHOD
+        if shap_method not in SHAP_METHODS:
+            raise ValueError(f"Unknown SHAP method {shap_method!r}; expected one of {SHAP_METHODS}")
+        return self.get(loaded, None if shap_method == 'exact' else shap_method)
+
+    def get(self, loaded, backend=None):
+        backend = backend or self.backend
+        key = (loaded.variant, loaded.version, backend)
+        explainer = self._explainers.get(key)
+        if explainer is None:
+            with self._lock:
+                explainer = self._explainers.get(key)
+                if explainer is None:
+                    explainer = self._build(loaded, backend)
+                    # Drop explainers of versions the registry no longer serves
+                    keep = self.registry.versions(loaded.variant) | {loaded.version}
+                    for stale in [k for k in self._explainers if k[0] == loaded.variant and k[1] not in keep]:
+                        del self._explainers[stale]
+                    self._explainers[key] = explainer
+        return explainer
+
+    def _build(self, loaded, backend):
+        start = time.perf_counter()
+        if loaded.handles_missing:
+            # Exact SHAP of the boosted model is already cheap; served in probability units like the forests
+            if backend == 'shap':
+                explainer = ProbabilityExplainer(shap.TreeExplainer(loaded.model))
+            elif backend in ('native', 'saabas', 'table'):
+                explainer = ProbabilityExplainer(BoostedTreeShap.from_sklearn(loaded.model))
+            else:
+                raise ValueError(f"Unknown explainer backend: {backend}")
+        elif backend == 'saabas':
+            explainer = SaabasExplainer(loaded.packed_forest)
+        elif backend == 'table':
+            exact = self._explainers.get((loaded.variant, loaded.version, self.backend))
+            exact = exact or self._build(loaded, self.backend)
+            X, _ = load_and_prepare_data(list(loaded.feature_columns))
+            X = loaded.model_input(X.to_numpy(dtype=float))
+            expected_value = np.ravel(exact.expected_value)[-1]
+            explainer = LookupTableExplainer.fit(X, positive_class_shap(exact, X), expected_value)
+        elif backend == 'native':
+            explainer = loaded.native_explainer
+            if explainer is None:
+                explainer = NativeTreeShap.from_sklearn(loaded.model)
+                if loaded.fold_scaler:
+                    explainer = explainer.fold_scaler(loaded.scaler.mean_, loaded.scaler.scale_)
+        elif backend == 'shap':
+            explainer = shap.TreeExplainer(loaded.model)
+            if loaded.fold_scaler:
+                explainer = ScaledExplainer(explainer, loaded.scaler)
+        else:
+            raise ValueError(f"Unknown explainer backend: {backend}")
+        self._build_seconds[(loaded.variant, loaded.version, backend)] = time.perf_counter() - start
+        return explainer
+
+    def prepare(self, loaded):
+        """Builds the explainer of every SHAP method: a request can ask for any of them."""
+        for shap_method in SHAP_METHODS:
+            self.for_method(loaded, shap_method)
+
+    def warm_up(self, variants=None):
+        for variant in variants or served_variants():
+            self.prepare(self.registry.get(variant))
+
+    def clear(self):
+        with self._lock:
+            self._explainers.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                f"{variant}:{version}:{backend}": {'build_seconds': self._build_seconds.get((variant, version, backend))}
+                for variant, version, backend in self._explainers
+            }
+
+
+explainer_cache = ExplainerCache()
+
+
+def _prepare_swap(entry):
+    # Built on the watcher thread, so the first request on a new version is not slower
+    if INFERENCE_BACKEND == 'packed':
+        entry.packed_forest
+    explainer_cache.prepare(entry)
+
+
+model_registry.prepare = _prepare_swap
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a TTL of (probability, SHAP dict) results, keyed by
+    (variant, artifact version, feature tuple in the variant's column order).
+
+    Retries, double-clicks and repeat readings resubmit identical vitals;
+    those skip the model and SHAP entirely. The artifact version is part of
+    the key, so reloaded artifacts never serve results of the old model.
+    """
+
+    def __init__(self, max_size=None, ttl=None, clock=time.monotonic):
+        self.max_size = PREDICTION_CACHE_SIZE if max_size is None else max_size
+        self.ttl = PREDICTION_CACHE_TTL if ttl is None else ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(loaded, features, shap_method='exact'):
+        return (loaded.variant, loaded.version, tuple(float(v) for v in features), shap_method)
+
+    def get(self, key, explain=True):
+        """Returns (probability, shap_dict) or None; entries without SHAP only serve explain=False."""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, probability, shap_dict = entry
+                if expires_at <= self._clock():
+                    del self._entries[key]
+                elif shap_dict is not None or not explain:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    metrics.prediction_cache_lookups.inc('hit')
+                    return probability, dict(shap_dict) if shap_dict is not None else None
+            self.misses += 1
+        metrics.prediction_cache_lookups.inc('miss')
+        return None
+
+    def put(self, key, probability, shap_dict):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            variant, version = key[0], key[1]
+            if self._versions.get(variant) != version:
+                # First entry of a new artifact version: forget the old version's results
+                for stale in [k for k in self._entries if k[0] == variant]:
+                    del self._entries[stale]
+                self._versions[variant] = version
+            self._entries[key] = (
+                self._clock() + self.ttl, probability, dict(shap_dict) if shap_dict is not None else None
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+prediction_cache = PredictionCache()
+
+
+def warm_up(variants=None):
+    """Loads the model artifacts and builds their explainers before serving traffic."""
+    model_registry.warm_up(variants)
+    explainer_cache.warm_up(variants)
+
+
+def preload_for_fork(variants=None):
+    """
+    Warms every variant in the parent process of a pre-forking server
+    (e.g. gunicorn --preload) so workers inherit the loaded arrays through
+    copy-on-write pages. gc.freeze() moves the loaded objects out of the
+    collector's reach, so collections in the workers do not write to
+    (and thereby copy) the shared pages.
+    """
+    warm_up(variants)
+    gc.collect()
+    gc.freeze()
+
+
+def export_all_packed(variants=None, packed_dir=PACKED_DIR):
+    """Exports memory-mappable packed artifacts for the current joblib files."""
+    for variant in variants or MODEL_VARIANTS:
+        feature_columns, model_path, scaler_path = MODEL_VARIANTS[variant]
+        model, scaler = load_model_and_scaler(model_path, scaler_path)
+        checksums = {'model': file_checksum(model_path), 'scaler': file_checksum(scaler_path)}
+        manifest = export_packed(
+            model, scaler, feature_columns, Path(packed_dir) / variant, checksums, fold_scaler=FOLD_SCALER
+        )
+        print(f"Packed {variant} model ({manifest['node_count']} nodes) -> {Path(packed_dir) / variant}")
+
+
+def model_input_from_record(data):
+    """
+    Maps MedicalRecord fields (lowercase) to the Capitalized keys expected by
+    the model: 'Age', 'Gender', 'Heart rate', 'Systolic blood pressure',
+    'Diastolic blood pressure', 'Blood sugar', 'CK-MB', 'Troponin'.
+    """
+    model_input = {
+        'Age': data['age'],
+        'Heart rate': data['heart_rate'],
+        'Systolic blood pressure': data['systolic_bp'],
+        'Diastolic blood pressure': data['diastolic_bp'],
+        'Blood sugar': data['blood_sugar'],
+        'CK-MB': data.get('ck_mb', 0) or 0,
+        'Troponin': data.get('troponin', 0) or 0
+    }
+
+    # Gender is stored as text ('male'/'female' or '1'/'0'); the model expects 1 for male, 0 for female
+    if isinstance(data['gender'], str):
+        model_input['Gender'] = 1 if data['gender'].lower() in ['male', '1'] else 0
+    else:
+        model_input['Gender'] = int(data['gender'])
+
+    return model_input
+
+
+def is_partial_record(data):
+    """If CK-MB and Troponin are effectively 0 (not provided), the 6-feature model is used."""
+    ck_mb_val = data.get('ck_mb', 0)
+    trop_val = data.get('troponin', 0)
+    return (ck_mb_val == 0 or ck_mb_val is None) and (trop_val == 0 or trop_val is None)
+
+
+def _feature_matrix(rows, feature_columns):
+    matrix = np.empty((len(rows), len(feature_columns)))
+    for i, row in enumerate(rows):
+        for j, col in enumerate(feature_columns):
+            if col not in row:
+                raise ValueError(f"Missing required field: {col}")
+            matrix[i, j] = row[col]
+    return matrix
+
+
+def predict_risk_batch(rows, use_reduced_model=False, explain=True, return_version=False, shap_method=None):
+    """
+    Predicts heart disease risk for many patients with one scaler, one
+    predict_proba and one SHAP call.
+
+    Args:
+        rows (list[dict]): Patient data dicts with keys matching FEATURE_COLUMNS
+        use_reduced_model (bool): If True, use the reduced model (6 features)
+        explain (bool): If False, skip SHAP (see explain_risk_batch) and return None for it
+        return_version (bool): If True, also return the version of the model that scored the rows
+        shap_method (str): One of SHAP_METHODS (default: SHAP_METHOD)
+
+    Returns:
+        tuple: (risk percentages as an (n,) array, SHAP values as an
+        (n, n_features) array, feature column names in SHAP column order
+        [, model version])
+    """
+    loaded = model_registry.get(variant_name(use_reduced_model))
+    feature_columns = loaded.feature_columns
+    if not rows:
+        result = np.empty(0), np.empty((0, len(feature_columns))) if explain else None, feature_columns
+        return result + (loaded.version,) if return_version else result
+
+    with metrics.timer(metrics.prediction_latency, loaded.variant):
+        with timed_phase('scale'):
+            X = loaded.model_input(_feature_matrix(rows, feature_columns))
+        with timed_phase('infer'):
+            probabilities = loaded.predict_positive(X)
+        shap_matrix = None
+        if explain:
+            with timed_phase('shap'), metrics.timer(metrics.shap_latency, loaded.variant):
+                shap_matrix = positive_class_shap(explainer_cache.for_method(loaded, shap_method), X)
+    metrics.predicted_rows.inc(loaded.variant, amount=len(rows))
+
+    if return_version:
+        return probabilities * 100, shap_matrix, feature_columns, loaded.version
+    return probabilities * 100, shap_matrix, feature_columns
+
+
+def explain_risk_batch(rows, use_reduced_model=False, version=None, shap_method=None):
+    """
+    Computes only the SHAP values for many patients, for explanations
+    deferred past the prediction (see heartproject.explanations). With
+    `version`, the model that scored the rows is used, loaded from the model
+    store if the registry no longer holds it (see ModelRegistry.get_version);
+    LookupError if it is gone. shap_method is one of SHAP_METHODS (default:
+    SHAP_METHOD).
+
+    Returns:
+        tuple: (SHAP values as an (n, n_features) array, feature column names)
+    """
+    variant = variant_name(use_reduced_model)
+    loaded = model_registry.get(variant) if version is None else model_registry.get_version(variant, version)
+    feature_columns = loaded.feature_columns
+    if not rows:
+        return np.empty((0, len(feature_columns))), feature_columns
+
+    with timed_phase('scale'):
+        X = loaded.model_input(_feature_matrix(rows, feature_columns))
+    with timed_phase('shap'), metrics.timer(metrics.shap_latency, loaded.variant):
+        return positive_class_shap(explainer_cache.for_method(loaded, shap_method), X), feature_columns
+
+
+def shap_rows_to_dicts(shap_matrix, feature_columns):
+    """Converts an (n, n_features) SHAP matrix into per-row {feature: value} dicts."""
+    return [
+        {col: float(value) for col, value in zip(feature_columns, row)}
+        for row in shap_matrix.tolist()
+    ]
+
+
+def _with_version(result, loaded, return_version):
+    return result + (loaded.version,) if return_version else result
+
+
+def predict_risk(data, use_reduced_model=False, explain=True, return_version=False, shap_method=None):
     """
     Predicts heart disease risk percentage for a single patient.
     
     Args:
         data (dict): Dictionary containing patient data with keys matching FEATURE_COLUMNS
         use_reduced_model (bool): If True, use the reduced model (6 features)
+        explain (bool): If False, skip SHAP and return None in place of the SHAP dict
+        return_version (bool): If True, also return the version of the model that scored the data
+        shap_method (str): One of SHAP_METHODS (default: SHAP_METHOD)
         
     Returns:
-        float: Risk percentage (0-100)
+        tuple: (risk percentage (0-100), SHAP dict [, model version])
     """
-    if use_reduced_model:
-        current_features = FEATURE_COLUMNS_REDUCED
-        current_model_path = MODEL_PATH_REDUCED
-        current_scaler_path = SCALER_PATH_REDUCED
-    else:
-        current_features = FEATURE_COLUMNS
-        current_model_path = MODEL_PATH
-        current_scaler_path = SCALER_PATH
-
-    model, scaler = load_model_and_scaler(current_model_path, current_scaler_path)
+    # Artifacts are loaded once per process and shared between requests
+    loaded = model_registry.get(variant_name(use_reduced_model))
+    current_features = loaded.feature_columns
     
     # Ensure data is in correct order
     input_data = []
@@ -125,34 +1011,39 @@ def predict_risk(data, use_reduced_model=False):
             raise ValueError(f"Missing required field: {col}")
         input_data.append(data[col])
     
+    # Identical vitals scored by the same artifacts give identical results
+    shap_method = shap_method or SHAP_METHOD
+    cache_key = PredictionCache.key(loaded, input_data, shap_method)
+    cached = prediction_cache.get(cache_key, explain=explain)
+    if cached is not None:
+        probability, shap_dict = cached
+        return _with_version((probability * 100, shap_dict if explain else None), loaded, return_version)
+
+    start = time.perf_counter()
+    metrics.predicted_rows.inc(loaded.variant)
+
     # Reshape for single sample
     input_array = np.array(input_data).reshape(1, -1)
     
-    # Scale
-    scaled_input = scaler.transform(input_array)
+    # Scale (a no-op when the scaler is folded into the forest)
+    with timed_phase('scale'):
+        model_input = loaded.model_input(input_array)
     
     # Predict probability of positive class (index 1)
-    probability = model.predict_proba(scaled_input)[0][1]
+    with timed_phase('infer'):
+        probability = loaded.predict_positive(model_input)[0]
+    if not explain:
+        prediction_cache.put(cache_key, probability, None)
+        metrics.prediction_latency.observe(time.perf_counter() - start, loaded.variant)
+        return _with_version((probability * 100, None), loaded, return_version)
     
-    # Calculate SHAP values
-    # We use TreeExplainer for Random Forest
-    # Note: shap_values for classification often return a list [values_for_class_0, values_for_class_1]
-    # We want class 1 (postive risk)
+    # Calculate SHAP values for class 1 (positive risk) with the cached explainer
     # NOTE: SHAP TreeExplainer works well for Trees. 
     # If we switch to SVM globally, we'd need KernelExplainer. 
     # For now, we assume the saved model is still Random Forest.
-    explainer = shap.TreeExplainer(model)
-    shap_vals = explainer.shap_values(scaled_input)
-    
-    # Handle different SHAP output formats (sometimes array, sometimes list of arrays)
-    if isinstance(shap_vals, list):
-        shap_vals_class_1 = shap_vals[1][0]
-    else:
-        # If binary classification output is single array (less common for RF in shap but possible)
-        if len(shap_vals.shape) == 3:
-             shap_vals_class_1 = shap_vals[0, :, 1]
-        else:
-             shap_vals_class_1 = shap_vals[0]
+    with timed_phase('shap'), metrics.timer(metrics.shap_latency, loaded.variant):
+        explainer = explainer_cache.for_method(loaded, shap_method)
+        shap_vals_class_1 = positive_class_shap(explainer, model_input)[0]
 
     # Create a dictionary of Feature Name -> SHAP Value
     # This explains how much each feature contributed to the risk score calculation
@@ -160,14 +1051,12 @@ def predict_risk(data, use_reduced_model=False):
     for i, col in enumerate(current_features):
         shap_dict[col] = float(shap_vals_class_1[i])
 
-    return probability * 100, shap_dict
+    prediction_cache.put(cache_key, probability, shap_dict)
+    metrics.prediction_latency.observe(time.perf_counter() - start, loaded.variant)
+    return _with_version((probability * 100, shap_dict), loaded, return_version)
 
 if __name__ == '__main__':
-    # Standard training (saves models)
-    print("Training Full Model (8 features)...")
-    train_model(FEATURE_COLUMNS, MODEL_PATH, SCALER_PATH)
-    
-    print("Training Reduced Model (6 features - No CK-MB/Troponin)...")
-    train_model(FEATURE_COLUMNS_REDUCED, MODEL_PATH_REDUCED, SCALER_PATH_REDUCED)
-
-
+    # Trains both variants concurrently with the fixed train_model() configuration
+    # and publishes them as new model versions; see heartproject/training.py for the search
+    from heartproject.training import main
+    main(['--grid', 'default'])
@@ -0,0 +1,180 @@
+"""
+Versioned model artifacts.
+
+Every trained model is published into its own immutable directory and
+never overwritten, so a worker that is still reading a version is never
+affected by a retrain:
+
+    data/models/<variant>/
+        CURRENT                  version id of the live model (one line)
+        <version>/
+            manifest.json        feature list, checksums, metrics, params
+            model.joblib
+            scaler.joblib
+            packed/              memory-mappable copy of a forest (see packed_artifacts)
+
+The version id is derived from the artifact checksums, so publishing the
+same model twice yields the same version. A version directory is written
+under a temporary name and renamed into place, and CURRENT is replaced
+atomically, so readers see either the old or the new version, never a
+partial one. Rolling back is `activate(variant, <older version>)`.
+
+Usage (from backend/):
+    python -m heartproject.model_store                       # list versions
+    python -m heartproject.model_store activate full <ver>   # switch/roll back
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+
+from .packed_artifacts import export_packed
+
+MODELS_DIR = Path(__file__).resolve().parent.parent / 'data' / 'models'
+MANIFEST_NAME = 'manifest.json'
+CURRENT_NAME = 'CURRENT'
+FORMAT_VERSION = 1
+
+
+def file_checksum(path):
+    """Returns the SHA-256 hex digest of an artifact file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_version(checksums):
+    """Short identifier of a set of artifact files (changes whenever a file changes)."""
+    combined = hashlib.sha256(''.join(checksums[k] for k in sorted(checksums)).encode())
+    return combined.hexdigest()[:12]
+
+
+class ModelStore:
+    """Publishes, lists and activates model versions under `root`."""
+
+    def __init__(self, root=None):
+        self.root = Path(root or MODELS_DIR)
+
+    def version_dir(self, variant, version):
+        return self.root / variant / version
+
+    def current_version(self, variant):
+        """Version id CURRENT points at, or None before the first publish."""
+        try:
+            return (self.root / variant / CURRENT_NAME).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def read_manifest(self, variant, version):
+        with open(self.version_dir(variant, version) / MANIFEST_NAME) as fh:
+            return json.load(fh)
+
+    def has_version(self, variant, version):
+        return (self.version_dir(variant, version) / MANIFEST_NAME).exists()
+
+    def list_versions(self, variant):
+        """Manifests of the published versions of a variant, oldest first."""
+        variant_dir = self.root / variant
+        if not variant_dir.is_dir():
+            return []
+        manifests = [
+            self.read_manifest(variant, path.name)
+            for path in variant_dir.iterdir()
+            if not path.name.startswith('.') and (path / MANIFEST_NAME).exists()
+        ]
+        return sorted(manifests, key=lambda m: m['created_at'])
+
+    def publish(self, variant, model, scaler, feature_columns, metrics=None, params=None, activate=True,
+                compact=False):
+        """
+        Writes a new version of `variant` and, with activate=True, makes it
+        current. With compact=True the packed forest is served in float32
+        (see PackedForest.compact). Only random forests get a packed copy;
+        other models are always served from model.joblib. Returns the
+        version id.
+        """
+        variant_dir = self.root / variant
+        variant_dir.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix='.tmp-', dir=variant_dir))
+        try:
+            joblib.dump(model, tmp / 'model.joblib')
+            joblib.dump(scaler, tmp / 'scaler.joblib')
+            checksums = {
+                'model': file_checksum(tmp / 'model.joblib'),
+                'scaler': file_checksum(tmp / 'scaler.joblib'),
+            }
+            version = artifact_version(checksums)
+            packed = hasattr(model, 'estimators_')
+            if packed:
+                export_packed(model, scaler, feature_columns, tmp / 'packed', checksums, compact=compact)
+            manifest = {
+                'format_version': FORMAT_VERSION,
+                'variant': variant,
+                'version': version,
+                'feature_columns': list(feature_columns),
+                'checksums': checksums,
+                'metrics': dict(metrics or {}),
+                'params': dict(params or {}),
+                'compact': compact,
+                'packed': packed,
+                'created_at': datetime.now(timezone.utc).isoformat(),
+            }
+            (tmp / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, default=str))
+
+            if self.has_version(variant, version):
+                # Identical artifacts are already published
+                shutil.rmtree(tmp)
+            else:
+                os.replace(tmp, self.version_dir(variant, version))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(variant, version)
+        return version
+
+    def activate(self, variant, version):
+        """Atomically points CURRENT at an already published version."""
+        if not self.has_version(variant, version):
+            raise FileNotFoundError(f"No published {variant} model version {version} in {self.root}")
+        pointer = self.root / variant / CURRENT_NAME
+        tmp = pointer.with_name(f".{CURRENT_NAME}.tmp-{os.getpid()}")
+        tmp.write_text(version + '\n')
+        os.replace(tmp, pointer)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default=None, help=f"Store directory (default: {MODELS_DIR})")
+    sub = parser.add_subparsers(dest='command')
+    activate = sub.add_parser('activate', help="Make a published version current")
+    activate.add_argument('variant')
+    activate.add_argument('version')
+    args = parser.parse_args(argv)
+
+    store = ModelStore(args.root)
+    if args.command == 'activate':
+        store.activate(args.variant, args.version)
+        print(f"{args.variant} -> {args.version}")
+        return
+
+    variants = sorted(p.name for p in store.root.iterdir() if p.is_dir()) if store.root.is_dir() else []
+    for variant in variants:
+        current = store.current_version(variant)
+        for manifest in store.list_versions(variant):
+            marker = '*' if manifest['version'] == current else ' '
+            accuracy = manifest['metrics'].get('test_accuracy')
+            print(f"{marker} {variant:<8} {manifest['version']}  {manifest['created_at']}  test_accuracy={accuracy}")
+
+
+if __name__ == '__main__':
+    main()
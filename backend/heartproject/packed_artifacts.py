@@ -0,0 +1,161 @@
+"""
+Memory-mapped model artifacts.
+
+joblib.load gives every WSGI worker a private, unpickled copy of both
+forests. A packed artifact instead stores the flat arrays used at serving
+time (PackedForest, NativeTreeShap and the scaler statistics) as raw .npy
+files that are opened with np.load(mmap_mode='r'): every worker on a host
+maps the same files, so the tree arrays live once in the page cache.
+
+Layout of an artifact directory (one per model variant):
+    manifest.json          feature list, scalar metadata, source checksums
+    forest.<name>.npy      PackedForest arrays
+    shap.<name>.npy        NativeTreeShap arrays
+    scaler.<name>.npy      StandardScaler mean_ / scale_
+
+By default the forest and explainer are folded (see
+PackedForest.fold_scaler): they take raw features and serving skips the
+scaler. The scaler arrays are still stored for the sklearn and shap
+fallbacks.
+
+Usage (from backend/):
+    python -m heartproject.packed_artifacts     # export every variant
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from .forest_engine import PackedForest
+from .tree_shap import NativeTreeShap
+
+MANIFEST_NAME = 'manifest.json'
+FORMAT_VERSION = 1
+
+
+class ArrayScaler:
+    """
+    Read-only stand-in for a fitted StandardScaler.
+
+    transform() performs the same in-place subtract/divide as sklearn, so
+    scaled values are bit-identical.
+    """
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    @classmethod
+    def from_sklearn(cls, scaler):
+        return cls(np.asarray(scaler.mean_, dtype=np.float64), np.asarray(scaler.scale_, dtype=np.float64))
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+
+class PackedArtifact:
+    def __init__(self, forest, explainer, scaler, feature_columns, manifest):
+        self.forest = forest
+        self.explainer = explainer
+        self.scaler = scaler
+        self.feature_columns = tuple(feature_columns)
+        self.manifest = manifest
+
+
+def export_packed(model, scaler, feature_columns, artifact_dir, source_checksums=None, compact=False,
+                  fold_scaler=True):
+    """
+    Writes the packed arrays of a trained model to `artifact_dir`. With
+    compact=True the forest is stored as float32 (see PackedForest.compact);
+    with fold_scaler=True the scaler is folded into the thresholds.
+
+    The directory is written next to its final location and swapped in with
+    renames, so workers never observe a half-written artifact. Workers that
+    still map the previous files keep reading them until they reload.
+    """
+    artifact_dir = Path(artifact_dir)
+    artifact_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = artifact_dir.with_name(f"{artifact_dir.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir()
+
+    forest = PackedForest.from_sklearn(model)
+    explainer = NativeTreeShap.from_sklearn(model)
+    array_scaler = ArrayScaler.from_sklearn(scaler)
+    if fold_scaler:
+        forest = forest.fold_scaler(array_scaler.mean_, array_scaler.scale_)
+        explainer = explainer.fold_scaler(array_scaler.mean_, array_scaler.scale_)
+    if compact:
+        forest = forest.compact()
+
+    groups = {
+        'forest': forest.arrays(),
+        'shap': explainer.arrays(),
+        'scaler': {'mean': array_scaler.mean_, 'scale': array_scaler.scale_},
+    }
+    for prefix, arrays in groups.items():
+        for name, array in arrays.items():
+            np.save(tmp_dir / f"{prefix}.{name}.npy", np.ascontiguousarray(array))
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'feature_columns': list(feature_columns),
+        'max_depth': forest.max_depth,
+        'n_features': forest.n_features,
+        'n_trees': forest.n_trees,
+        'node_count': forest.node_count,
+        'compact': compact,
+        'raw_input': fold_scaler,
+        'source_checksums': dict(source_checksums or {}),
+    }
+    with open(tmp_dir / MANIFEST_NAME, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+
+    old_dir = artifact_dir.with_name(f"{artifact_dir.name}.old-{os.getpid()}")
+    if artifact_dir.exists():
+        os.replace(artifact_dir, old_dir)
+    os.replace(tmp_dir, artifact_dir)
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    return manifest
+
+
+def read_manifest(artifact_dir):
+    with open(Path(artifact_dir) / MANIFEST_NAME) as fh:
+        return json.load(fh)
+
+
+def load_packed(artifact_dir, mmap=True):
+    """Opens a packed artifact; with mmap=True the arrays are read-only file mappings."""
+    artifact_dir = Path(artifact_dir)
+    manifest = read_manifest(artifact_dir)
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported packed artifact format in {artifact_dir}")
+
+    mmap_mode = 'r' if mmap else None
+
+    def group(prefix, names):
+        return {name: np.load(artifact_dir / f"{prefix}.{name}.npy", mmap_mode=mmap_mode) for name in names}
+
+    raw_input = manifest.get('raw_input', False)
+    forest = PackedForest(
+        max_depth=manifest['max_depth'],
+        n_features=manifest['n_features'],
+        raw_input=raw_input,
+        **group('forest', PackedForest.ARRAY_NAMES)
+    )
+    explainer = NativeTreeShap(raw_input=raw_input, **group('shap', NativeTreeShap.ARRAY_NAMES))
+    scaler = ArrayScaler(**group('scaler', ('mean', 'scale')))
+    return PackedArtifact(forest, explainer, scaler, manifest['feature_columns'], manifest)
+
+
+if __name__ == '__main__':
+    from .ml_model import export_all_packed
+
+    export_all_packed()
@@ -0,0 +1,73 @@
+"""
+Keyset (cursor) pagination over MedicalRecord histories.
+
+Pages are ordered by (created_at, id) and continue from the last row seen
+instead of using OFFSET, so with the (user, created_at, id) index every page
+is an index range scan of `limit` rows, however deep into the history the
+client reads. A request without ?limit= gets DEFAULT_PAGE_SIZE records;
+clients that need the whole history follow next_cursor.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+def encode_cursor(record):
+    raw = f"{record.created_at.isoformat()}|{record.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(record_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidPageRequest("Invalid cursor")
+
+
+def page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Client-chosen ?limit=, capped at `maximum`."""
+    limit = request.query_params.get('limit')
+    if limit is None:
+        return default
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise InvalidPageRequest("limit must be an integer")
+    if limit < 1:
+        raise InvalidPageRequest("limit must be positive")
+    return min(limit, maximum)
+
+
+def keyset_page(queryset, request, newest_first=True):
+    """
+    Returns (records, next_cursor) for the page selected by ?cursor= and ?limit=.
+
+    next_cursor is None on the last page.
+    """
+    cursor = request.query_params.get('cursor')
+    limit = page_size(request)
+
+    if newest_first:
+        queryset = queryset.order_by('-created_at', '-id')
+    else:
+        queryset = queryset.order_by('created_at', 'id')
+
+    if cursor:
+        created_at, record_id = decode_cursor(cursor)
+        if newest_first:
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=record_id))
+        else:
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=record_id))
+
+    records = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(records[limit - 1]) if len(records) > limit else None
+    return records[:limit], next_cursor
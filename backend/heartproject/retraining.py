@@ -0,0 +1,259 @@
+"""
+Retraining from labelled MedicalRecord rows.
+
+    python manage.py retrain_from_records [--variant full] [--mode incremental]
+                                          [--chunk-size 5000] [--compare] [--no-publish]
+
+A record is labelled once its confirmed outcome is known (MedicalRecord.outcome;
+import_records fills it from a Result column, the prediction API never does). Three modes:
+
+    incremental  grow the live forest: every chunk of records newer than the
+                 ones the live version was trained through adds
+                 trees_per_chunk trees fitted on that chunk alone
+                 (RandomForestClassifier warm_start). The scaler is kept, so
+                 the existing trees stay valid. Beyond max_trees the oldest
+                 trees are dropped, so the forest follows recent data.
+    window       refit the scaler and a forest with the live hyperparameters
+                 on the newest `window` records
+    full         refit on the training CSV plus every labelled record (the
+                 reference; its memory grows with the table)
+
+incremental and window read the table in keyset-paginated chunks, so their
+peak memory is bounded by chunk_size (window) rather than by the table.
+The result is published as a new model version (see model_store.py), which
+serving processes swap in by themselves. compare() runs every mode on the
+same records, holding out every HOLDOUT_MODULUS-th one, and reports wall
+time, peak traced memory and holdout accuracy.
+"""
+import time
+import tracemalloc
+
+import numpy as np
+from django.db.models import Q
+from django.db.models.functions import Mod
+from sklearn.base import clone
+from sklearn.preprocessing import StandardScaler
+
+from predictor.models import MedicalRecord
+
+from .explanations import RECORD_FIELDS
+from .ml_model import MODEL_VARIANTS, ModelRegistry, _feature_matrix, load_and_prepare_data, model_input_from_record
+from .model_store import ModelStore
+
+MODES = ('incremental', 'window', 'full')
+
+CHUNK_SIZE = 5000
+TREES_PER_CHUNK = 10
+MAX_TREES = 300
+WINDOW = 50000
+
+# Every HOLDOUT_MODULUS-th record (by id) is kept out of training by compare()
+HOLDOUT_MODULUS = 5
+
+LABELS = (MedicalRecord.OUTCOME_POSITIVE, MedicalRecord.OUTCOME_NEGATIVE)
+
+
+def labelled_records(variant, holdout=None):
+    """
+    Labelled records `variant` learns from. The full model is only trained on
+    readings with CK-MB or Troponin, since partial readings are scored by the
+    reduced model. holdout=True/False selects/excludes compare()'s test records.
+    """
+    records = MedicalRecord.objects.filter(outcome__in=LABELS)
+    if variant == 'full':
+        records = records.exclude(
+            (Q(ck_mb__isnull=True) | Q(ck_mb=0)) & (Q(troponin__isnull=True) | Q(troponin=0))
+        )
+    if holdout is not None:
+        records = records.annotate(bucket=Mod('id', HOLDOUT_MODULUS))
+        records = records.filter(bucket=0) if holdout else records.exclude(bucket=0)
+    return records
+
+
+def iter_chunks(records, feature_columns, chunk_size=CHUNK_SIZE, after_id=0, newest_first=False):
+    """
+    Yields (ids, X, y) for consecutive chunks of `records` with an id above
+    `after_id`, in id order (or newest first). Keyset pagination keeps each
+    query an index range scan and only one chunk in memory.
+    """
+    records = records.filter(id__gt=after_id)
+    last_id = None
+    while True:
+        page = records
+        if last_id is not None:
+            page = page.filter(id__lt=last_id) if newest_first else page.filter(id__gt=last_id)
+        rows = list(
+            page.order_by('-id' if newest_first else 'id')
+            .values_list('id', 'outcome', *RECORD_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        X = _feature_matrix(
+            [model_input_from_record(dict(zip(RECORD_FIELDS, row[2:]))) for row in rows], feature_columns
+        )
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        y = np.fromiter((row[1] == MedicalRecord.OUTCOME_POSITIVE for row in rows), dtype=int, count=len(rows))
+        yield ids, X, y
+
+
+def grow_forest(model, scaler, chunks, trees_per_chunk=TREES_PER_CHUNK, max_trees=MAX_TREES):
+    """
+    Adds trees_per_chunk trees fitted on each (ids, X, y) chunk to `model`,
+    in place. A chunk holding a single class is skipped, as trees fitted on
+    it could never predict the other one.
+
+    Returns:
+        dict: rows, chunks, skipped_rows, added_trees, dropped_trees, trained_through_id
+    """
+    stats = {'rows': 0, 'chunks': 0, 'skipped_rows': 0, 'added_trees': 0, 'dropped_trees': 0,
+             'trained_through_id': None}
+    model.warm_start = True
+    try:
+        for ids, X, y in chunks:
+            stats['trained_through_id'] = int(ids[-1])
+            if len(np.unique(y)) < 2:
+                stats['skipped_rows'] += len(y)
+                continue
+            model.n_estimators = len(model.estimators_) + trees_per_chunk
+            model.fit(scaler.transform(X), y)
+            stats['rows'] += len(y)
+            stats['chunks'] += 1
+            stats['added_trees'] += trees_per_chunk
+            if max_trees and len(model.estimators_) > max_trees:
+                dropped = len(model.estimators_) - max_trees
+                del model.estimators_[:dropped]
+                model.n_estimators = max_trees
+                stats['dropped_trees'] += dropped
+    finally:
+        model.warm_start = False
+    return stats
+
+
+def _refit(model, X, y):
+    if len(np.unique(y)) < 2:
+        raise ValueError(f"Need records of both outcomes to refit, got {len(y)} rows of one")
+    scaler = StandardScaler()
+    refitted = clone(model).set_params(warm_start=False)
+    refitted.fit(scaler.fit_transform(X), y)
+    return refitted, scaler
+
+
+def refit_window(model, records, feature_columns, window=WINDOW, chunk_size=CHUNK_SIZE):
+    """Refits a clone of `model` and a new scaler on the newest `window` records; returns (model, scaler, stats)."""
+    X = np.empty((window, len(feature_columns)))
+    y = np.empty(window, dtype=int)
+    n, trained_through_id = 0, None
+    for ids, X_chunk, y_chunk in iter_chunks(records, feature_columns, min(chunk_size, window), newest_first=True):
+        if trained_through_id is None:
+            trained_through_id = int(ids[0])
+        take = min(len(y_chunk), window - n)
+        X[n:n + take], y[n:n + take] = X_chunk[:take], y_chunk[:take]
+        n += take
+        if n == window:
+            break
+    refitted, scaler = _refit(model, X[:n], y[:n])
+    return refitted, scaler, {'rows': n, 'trained_through_id': trained_through_id}
+
+
+def refit_full(model, records, feature_columns, chunk_size=CHUNK_SIZE):
+    """Refits a clone of `model` and a new scaler on the CSV plus every record; returns (model, scaler, stats)."""
+    X_csv, y_csv = load_and_prepare_data(list(feature_columns))
+    chunks = list(iter_chunks(records, feature_columns, chunk_size))
+    X = np.vstack([X_csv.to_numpy(dtype=float)] + [X_chunk for _, X_chunk, _ in chunks])
+    y = np.concatenate([y_csv.to_numpy()] + [y_chunk for _, _, y_chunk in chunks])
+    refitted, scaler = _refit(model, X, y)
+    trained_through_id = int(chunks[-1][0][-1]) if chunks else None
+    return refitted, scaler, {'rows': len(y) - len(y_csv), 'csv_rows': len(y_csv), 'trained_through_id': trained_through_id}
+
+
+def holdout_accuracy(model, scaler, records, feature_columns, chunk_size=CHUNK_SIZE):
+    """Accuracy of `model` on `records`, streamed in chunks; None when there are none."""
+    correct = total = 0
+    for _, X, y in iter_chunks(records, feature_columns, chunk_size):
+        correct += int((model.predict(scaler.transform(X)) == y).sum())
+        total += len(y)
+    return correct / total if total else None
+
+
+def load_live(variant, store=None):
+    """A private copy (safe to modify) of the live model and scaler of `variant`, and its manifest."""
+    entry = ModelRegistry(artifact_format='joblib', store=store).get(variant)
+    return entry.model, entry.scaler, entry.manifest
+
+
+def _train(mode, model, scaler, records, feature_columns, after_id=0, chunk_size=CHUNK_SIZE,
+           trees_per_chunk=TREES_PER_CHUNK, max_trees=MAX_TREES, window=WINDOW):
+    if mode == 'incremental':
+        chunks = iter_chunks(records, feature_columns, chunk_size, after_id=after_id)
+        return model, scaler, grow_forest(model, scaler, chunks, trees_per_chunk, max_trees)
+    if mode == 'window':
+        return refit_window(model, records, feature_columns, window, chunk_size)
+    if mode == 'full':
+        return refit_full(model, records, feature_columns, chunk_size)
+    raise ValueError(f"Unknown retraining mode: {mode}")
+
+
+def retrain(variant, mode='incremental', publish=True, store=None, **options):
+    """
+    Retrains `variant` from the labelled records and, with publish=True,
+    publishes the result as its current version. An incremental run only
+    reads records newer than the ones the live version was trained through.
+
+    Returns:
+        dict: the mode's stats plus variant, mode, seconds, n_trees and the
+        published version (None when not published or nothing was new)
+    """
+    store = store or ModelStore()
+    feature_columns = MODEL_VARIANTS[variant][0]
+    model, scaler, manifest = load_live(variant, store)
+    after_id = manifest.get('params', {}).get('trained_through_id') or 0
+
+    start = time.perf_counter()
+    model, scaler, stats = _train(
+        mode, model, scaler, labelled_records(variant), feature_columns, after_id=after_id, **options
+    )
+    stats.update(variant=variant, mode=mode, seconds=time.perf_counter() - start,
+                 n_trees=len(model.estimators_), version=None)
+
+    if publish and stats['rows']:
+        stats['version'] = store.publish(
+            variant, model, scaler, feature_columns,
+            metrics={key: stats[key] for key in ('rows', 'seconds', 'n_trees')},
+            params={**model.get_params(), 'retrain_mode': mode, 'trained_through_id': stats['trained_through_id']},
+        )
+    return stats
+
+
+def compare(variant, store=None, **options):
+    """
+    Runs every mode from the live model on the non-holdout records and
+    scores each result (and the unchanged live model) on the holdout ones.
+
+    Returns:
+        list[dict]: per mode: rows, n_trees, seconds, peak_bytes, holdout_accuracy
+    """
+    feature_columns = MODEL_VARIANTS[variant][0]
+    train = labelled_records(variant, holdout=False)
+    test = labelled_records(variant, holdout=True)
+
+    model, scaler, _ = load_live(variant, store)
+    results = [{
+        'mode': 'live', 'rows': 0, 'n_trees': len(model.estimators_), 'seconds': 0.0, 'peak_bytes': 0,
+        'holdout_accuracy': holdout_accuracy(model, scaler, test, feature_columns),
+    }]
+    for mode in MODES:
+        model, scaler, _ = load_live(variant, store)
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            model, scaler, stats = _train(mode, model, scaler, train, feature_columns, **options)
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results.append({
+            'mode': mode, 'rows': stats['rows'], 'n_trees': len(model.estimators_), 'seconds': seconds,
+            'peak_bytes': peak, 'holdout_accuracy': holdout_accuracy(model, scaler, test, feature_columns),
+        })
+    return results
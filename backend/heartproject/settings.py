@@ -29,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its total covers the whole request
+    'heartproject.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,9 +80,14 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 #next 6 lines generated by AI to implement tokens authentication
+# HEART_STATELESS_JWT=1 builds request.user from token claims instead of
+# fetching it on every request (see heartproject/authentication.py)
+STATELESS_JWT = os.environ.get('HEART_STATELESS_JWT', '0') == '1'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'heartproject.authentication.StatelessJWTAuthentication' if STATELESS_JWT
+        else 'heartproject.authentication.TimedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -93,4 +100,17 @@ from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15), #how often expires access token
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1), #how often expires refresh token
-}
\ No newline at end of file
+}
+
+# Structured per-request timing lines (HEART_TIMING_LOG=1, see heartproject/middleware.py)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'heartproject': {'handlers': ['console'], 'level': 'INFO'},
+        'heartproject.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
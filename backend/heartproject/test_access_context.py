@@ -0,0 +1,113 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from predictor.access import CACHE_TTL, SHORT_CACHE_TTL, cache_ttl, get_access_context
+from predictor.models import MedicalRecord, Patient
+
+from .test_predict_api import FULL_READING
+
+
+class AccessContextTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username='doc@test.com', email='doc@test.com', password='password')
+        self.patient_user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        self.patient = Patient.objects.create(doctor=self.doctor, user=self.patient_user)
+        self.record = MedicalRecord.objects.create(
+            user=self.patient_user, result=42.0,
+            age=50, gender='male', heart_rate=70, systolic_bp=120, diastolic_bp=80, blood_sugar=100
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def test_cached_context_needs_no_queries(self):
+        get_access_context(self.doctor)
+        with self.assertNumQueries(0):
+            access = get_access_context(self.doctor.pk)
+
+        self.assertEqual(access.role, 'doctor')
+        self.assertTrue(access.can_view(self.patient_user.pk))
+        self.assertEqual(access.patient_id_for(self.patient_user.pk), self.patient.pk)
+
+    def test_assessment_detail_permission_checks_are_cached(self):
+        self.client.get(f'/api/result/{self.record.id}/')
+        # Only the record (with its owner) and the history page remain
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/result/{self.record.id}/')
+
+        data = response.json()
+        self.assertEqual(data['viewer_role'], 'doctor')
+        self.assertEqual(data['patient_id'], self.patient.pk)
+        self.assertTrue(data['is_doctor_user'])
+
+    def test_patient_links_invalidate_the_context(self):
+        other = User.objects.create_user(username='other@test.com', email='other@test.com', password='password')
+        self.assertFalse(get_access_context(self.doctor).can_view(other.pk))
+
+        link = Patient.objects.create(doctor=self.doctor, user=other)
+        self.assertTrue(get_access_context(self.doctor).can_view(other.pk))
+
+        link.delete()
+        self.patient.delete()
+        access = get_access_context(self.doctor)
+        self.assertFalse(access.can_view(other.pk))
+        self.assertEqual(access.role, 'patient')
+
+    def test_reassigning_a_patient_invalidates_both_doctors(self):
+        other_doctor = User.objects.create_user(username='doc2@test.com', email='doc2@test.com', password='password')
+        self.assertTrue(get_access_context(self.doctor).can_view(self.patient_user.pk))
+        self.assertFalse(get_access_context(other_doctor).can_view(self.patient_user.pk))
+
+        self.patient.doctor = other_doctor
+        self.patient.save()
+        self.assertFalse(get_access_context(self.doctor).can_view(self.patient_user.pk))
+        self.assertTrue(get_access_context(other_doctor).can_view(self.patient_user.pk))
+
+    def test_group_changes_invalidate_the_context(self):
+        group = Group.objects.create(name='Doctor')
+        self.assertFalse(get_access_context(self.patient_user).in_group('Doctor'))
+
+        self.patient_user.groups.add(group)
+        self.assertTrue(get_access_context(self.patient_user).in_group('Doctor'))
+
+        group.user_set.clear()
+        self.assertFalse(get_access_context(self.patient_user).in_group('Doctor'))
+
+        group.user_set.add(self.patient_user)
+        group.name = 'Physician'
+        group.save()
+        self.assertEqual(get_access_context(self.patient_user).groups, {'Physician'})
+
+    def test_other_users_records_stay_forbidden(self):
+        stranger = User.objects.create_user(username='x@test.com', email='x@test.com', password='password')
+        self.client.force_authenticate(stranger)
+
+        self.assertEqual(self.client.get(f'/api/result/{self.record.id}/').status_code, 403)
+
+    def test_predictions_for_a_patient_resolve_the_link_from_the_context(self):
+        get_access_context(self.doctor)
+        with CaptureQueriesContext(connection) as queries:
+            single = self.client.post('/api/predict-risk/', dict(FULL_READING, patient_id=self.patient.id), format='json')
+            batch = self.client.post(
+                '/api/predict-risk/batch/', {'patient_id': self.patient.id, 'records': [FULL_READING]}, format='json'
+            )
+
+        self.assertEqual((single.status_code, batch.status_code), (200, 200))
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "predictor_patient"' in q['sql']])
+        self.assertEqual(MedicalRecord.objects.filter(user=self.patient_user).count(), 3)
+
+        stranger = User.objects.create_user(username='x@test.com', email='x@test.com', password='password')
+        self.client.force_authenticate(stranger)
+        response = self.client.post('/api/predict-risk/', dict(FULL_READING, patient_id=self.patient.id), format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_per_process_caches_keep_contexts_briefly(self):
+        # Other workers' LocMemCache never sees this process's invalidations
+        self.assertEqual(cache_ttl(), SHORT_CACHE_TTL)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(cache_ttl(), CACHE_TTL)
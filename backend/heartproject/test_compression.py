@@ -0,0 +1,94 @@
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from . import compression, ml_model
+from .forest_engine import PackedForest
+from .ml_model import ModelRegistry
+from .model_store import ModelStore
+from .training import cache_dataset, split_and_scale
+from .tree_shap import NativeTreeShap
+
+
+class CompressionTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.entry = ModelRegistry(artifact_format='joblib').get('full')
+        cls.X_fit, cls.validation, cls.test = compression.holdout_splits(cache_dataset(), ml_model.FEATURE_COLUMNS)
+        cls.X_raw, cls.y = cls.test
+        cls.X = cls.entry.scaler.transform(cls.X_raw)
+
+    def test_validation_and_test_halves_split_the_held_out_rows(self):
+        *_, y_holdout, X_holdout = split_and_scale(cache_dataset(), ml_model.FEATURE_COLUMNS, 0.2, 42)
+        (X_val, y_val), (X_test, y_test) = self.validation, self.test
+
+        held_out = sorted(map(tuple, X_holdout))
+        self.assertEqual(sorted(map(tuple, np.vstack([X_val, X_test]))), held_out)
+        self.assertEqual(len(y_val) + len(y_test), len(y_holdout))
+        # Tree selection never sees the test rows
+        self.assertFalse(set(map(tuple, X_test)) & set(map(tuple, self.X_fit)) - set(map(tuple, X_val)))
+
+    def test_float32_thresholds_keep_every_split_decision(self):
+        forest = PackedForest.from_sklearn(self.entry.model)
+        compact = forest.compact()
+
+        self.assertEqual(compact.threshold.dtype, np.float32)
+        self.assertTrue((compact.threshold.astype(np.float64) <= forest.threshold).all())
+        # Inputs on and next to (the float32 rounding of) every threshold
+        t = np.unique(forest.threshold).astype(np.float32)
+        values = np.concatenate([t, np.nextafter(t, np.float32(np.inf)), np.nextafter(t, np.float32(-np.inf))])
+        X = np.repeat(values[:, np.newaxis], forest.n_features, axis=1)
+        np.testing.assert_array_equal(compact.apply(X), forest.apply(X))
+        np.testing.assert_allclose(compact.predict_proba(X), forest.predict_proba(X), atol=1e-6)
+
+    def test_stages_are_measured_on_the_served_forest(self):
+        args = ('float32', self.entry.model, self.entry.scaler, self.validation, self.test)
+        folded = compression.measure_stage(*args, compact=True, fold_scaler=True)
+        unfolded = compression.measure_stage(*args, compact=True, fold_scaler=False)
+
+        served = self.entry.packed_forest.compact()
+        self.assertEqual(folded['forest_bytes'], served.nbytes)
+        # Folded thresholds stay float64
+        self.assertEqual(folded['forest_bytes'] - unfolded['forest_bytes'], 4 * served.node_count)
+        self.assertEqual((folded['auc'], folded['accuracy']), (unfolded['auc'], unfolded['accuracy']))
+
+    def test_collapsed_trees_stay_consistent(self):
+        exact, removed_exact = compression.collapse_forest(self.entry.model, tolerance=0.0)
+        np.testing.assert_array_equal(exact.predict_proba(self.X), self.entry.model.predict_proba(self.X))
+
+        collapsed, removed = compression.collapse_forest(self.entry.model, tolerance=0.005)
+        self.assertGreater(removed, removed_exact)
+        packed = PackedForest.from_sklearn(collapsed)
+        self.assertLess(packed.node_count, PackedForest.from_sklearn(self.entry.model).node_count)
+        # The rebuilt sklearn trees, the packed engine and TreeSHAP agree
+        proba = collapsed.predict_proba(self.X)
+        np.testing.assert_array_equal(packed.predict_proba(self.X), proba)
+        explainer = NativeTreeShap.from_sklearn(collapsed)
+        np.testing.assert_allclose(
+            explainer.shap_values(self.X[:5]).sum(axis=1) + explainer.expected_value, proba[:5, 1], atol=1e-9
+        )
+
+    def test_compressed_model_stays_within_tolerance_and_is_served_compact(self):
+        model, compact, stages = compression.compress(
+            self.entry.model, self.entry.scaler, self.validation, self.test, self.X_fit, tolerance=0.01
+        )
+
+        self.assertEqual([s['stage'] for s in stages], ['original', 'collapsed splits', 'tree subset', 'float32'])
+        final = [s for s in stages if s['accepted']][-1]
+        # Accepted on the validation half; auc/accuracy are the untouched test half
+        self.assertGreaterEqual(final['val_auc'], stages[0]['val_auc'] - 0.01)
+        self.assertGreaterEqual(final['val_accuracy'], stages[0]['val_accuracy'] - 0.01)
+        self.assertNotEqual(final['auc'], final['val_auc'])
+        self.assertLess(final['packed_bytes'], stages[0]['packed_bytes'])
+        self.assertTrue(compact)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ModelStore(tmp)
+            version = store.publish('full', model, self.entry.scaler, ml_model.FEATURE_COLUMNS, compact=True)
+            for artifact_format in ('joblib', 'mmap'):
+                entry = ModelRegistry(artifact_format=artifact_format, store=store).get('full')
+                self.assertEqual(entry.version, version)
+                # Folded thresholds compare raw float64 features, so only the leaves shrink
+                self.assertEqual(entry.packed_forest.leaf_proba.dtype, np.float32)
@@ -0,0 +1,99 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from predictor.models import MedicalRecord, PatientRiskSummary
+from predictor.rollups import compute_summaries, record_assessments
+
+from .test_helpers import READING, DoctorTestCase
+
+
+class DoctorPatientsTest(DoctorTestCase):
+    def add_assessed_patient(self, name, results):
+        user = self.add_patient(name).user
+        # Oldest first, so the last value is the latest assessment
+        for result in results:
+            record = MedicalRecord.objects.create(user=user, result=result, **READING)
+            record_assessments(user, [record])
+        return user
+
+    def patients_by_name(self):
+        response = self.client.get('/api/patients/')
+        self.assertEqual(response.status_code, 200)
+        return {p['first_name']: p for p in response.json()}
+
+    def test_risk_status_rules(self):
+        self.add_assessed_patient('high_latest', [10, 10, 10, 10, 80])
+        self.add_assessed_patient('high_average', [90, 90, 90, 90, 60])
+        self.add_assessed_patient('moderate', [40, 40, 40])
+        self.add_assessed_patient('low', [95, 10, 10, 10, 10, 10])  # 95 falls outside the last 5
+        self.add_assessed_patient('with_none', [50, None])
+        self.add_assessed_patient('unknown', [])
+
+        patients = self.patients_by_name()
+
+        self.assertEqual(patients['high_latest']['risk_status'], 'High')
+        self.assertEqual(patients['high_latest']['latest_score'], 80)
+        self.assertEqual(patients['high_latest']['average_score'], 24.0)
+        self.assertEqual(patients['high_average']['risk_status'], 'High')
+        self.assertEqual(patients['moderate']['risk_status'], 'Moderate')
+        self.assertEqual(patients['low']['risk_status'], 'Low')
+        self.assertEqual(patients['low']['average_score'], 10.0)
+        self.assertEqual(patients['with_none']['latest_score'], 0)
+        self.assertEqual(patients['with_none']['average_score'], 50.0)
+        self.assertEqual(patients['with_none']['risk_status'], 'Moderate')
+        self.assertEqual(patients['unknown']['risk_status'], 'Unknown')
+        self.assertEqual(patients['unknown']['email'], 'unknown@test.com')
+
+    def test_query_count_does_not_grow_with_patients(self):
+        for i in range(3):
+            self.add_assessed_patient(f'p{i}', [20, 40, 60])
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.patients_by_name()), 3)
+
+        for i in range(3, 30):
+            self.add_assessed_patient(f'p{i}', [20, 40, 60, 80, 10, 30])
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.patients_by_name()), 30)
+
+
+class RiskRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pat@test.com', email='pat@test.com')
+
+    def test_incremental_updates_match_rebuild(self):
+        for results in ([12.0], [40.0, None], [75.5, 20.0, 33.0, 90.0]):
+            records = [MedicalRecord.objects.create(user=self.user, result=r, **READING) for r in results]
+            record_assessments(self.user, records)
+
+        summary = PatientRiskSummary.objects.get(user=self.user)
+        rebuilt = compute_summaries()[self.user.id]
+
+        self.assertEqual(summary.record_count, 7)
+        self.assertEqual(summary.recent_results, [90.0, 33.0, 20.0, 75.5, None])
+        for field in ('recent_results', 'latest_score', 'average_score', 'risk_status', 'record_count', 'last_assessment_at'):
+            self.assertEqual(getattr(summary, field), getattr(rebuilt, field), field)
+
+    def test_rebuild_command_repairs_drift(self):
+        record = MedicalRecord.objects.create(user=self.user, result=85.0, **READING)
+        record_assessments(self.user, [record])
+        MedicalRecord.objects.filter(id=record.id).update(result=5.0)
+        other = User.objects.create_user(username='other@test.com')
+        MedicalRecord.objects.create(user=other, result=50.0, **READING)
+
+        call_command('rebuild_risk_rollups', stdout=StringIO())
+
+        self.assertEqual(PatientRiskSummary.objects.get(user=self.user).risk_status, 'Low')
+        self.assertEqual(PatientRiskSummary.objects.get(user=other).risk_status, 'Moderate')
+
+    def test_predict_endpoint_updates_rollup(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/predict-risk/', READING, format='json')
+
+        summary = PatientRiskSummary.objects.get(user=self.user)
+        self.assertEqual(summary.record_count, 1)
+        self.assertEqual(summary.latest_score, round(response.json()['risk_percentage'], 1))
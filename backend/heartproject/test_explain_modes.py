@@ -0,0 +1,81 @@
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from predictor.models import MedicalRecord
+
+from . import explain_modes, ml_model
+from .ml_model import ExplainerCache, ModelRegistry, load_and_prepare_data, predict_risk
+from .test_ml_model import SAMPLE_INPUT
+from .test_predict_api import FULL_READING
+from .tree_shap import LookupTableExplainer, SaabasExplainer
+
+
+class ApproximateShapTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.loaded = ml_model.model_registry.get('full')
+        X, _ = load_and_prepare_data(ml_model.FEATURE_COLUMNS)
+        cls.X = cls.loaded.model_input(X.to_numpy(dtype=float))
+
+    def test_saabas_contributions_sum_to_the_prediction(self):
+        forest = self.loaded.packed_forest
+        explainer = SaabasExplainer(forest)
+
+        values = explainer.shap_values(self.X)
+        np.testing.assert_allclose(
+            values.sum(axis=1) + explainer.expected_value, forest.predict_proba(self.X)[:, 1], atol=1e-9
+        )
+        np.testing.assert_array_equal(explainer.shap_values(self.X[:3]), values[:3])
+
+    def test_lookup_table_returns_bin_means(self):
+        X = np.array([[0.0, 1.0], [1.0, 1.0], [2.0, 1.0], [3.0, 1.0]])
+        shap_values = np.array([[0.1, 0.5], [0.3, 0.5], [-0.2, 0.5], [-0.4, 0.5]])
+        explainer = LookupTableExplainer.fit(X, shap_values, 0.25, n_bins=2)
+
+        np.testing.assert_allclose(explainer.shap_values([[0.5, 1.0], [3.5, 7.0]]), [[0.2, 0.5], [-0.3, 0.5]])
+        self.assertAlmostEqual(explainer.error, 0.05)
+        self.assertEqual(explainer.expected_value, 0.25)
+
+    def test_every_method_reports_latency_and_error_against_exact(self):
+        explainers = ExplainerCache(ModelRegistry())
+        rows = explain_modes.evaluate(self.loaded, self.X[:200], explainers, latency_rows=5)
+
+        self.assertEqual([row['method'] for row in rows], list(ml_model.SHAP_METHODS))
+        exact, *approximate = rows
+        self.assertEqual((exact['mean_abs_error'], exact['top_feature_agreement']), (0.0, 1.0))
+        for row in approximate:
+            self.assertGreater(row['latency_ms'], 0)
+            self.assertGreater(row['mean_abs_error'], 0)
+            self.assertLess(row['mean_abs_error'], 0.05)
+
+
+class ShapMethodSelectionTest(TestCase):
+    def setUp(self):
+        ml_model.prediction_cache.clear()
+
+    def test_methods_are_selectable_per_call_and_cached_separately(self):
+        saabas_risk, saabas = predict_risk(SAMPLE_INPUT, shap_method='saabas')
+        exact_risk, exact = predict_risk(SAMPLE_INPUT)
+
+        self.assertEqual(saabas_risk, exact_risk)
+        self.assertNotEqual(saabas, exact)
+        self.assertEqual(predict_risk(SAMPLE_INPUT, shap_method='exact')[1], exact)
+        with self.assertRaises(ValueError):
+            predict_risk(SAMPLE_INPUT, shap_method='guess')
+
+    def test_api_accepts_a_shap_method_per_request(self):
+        user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        result = client.post('/api/predict-risk/?shap_method=table', FULL_READING, format='json').json()
+        self.assertEqual(result['shap_method'], 'table')
+        self.assertEqual(len(result['shap_values']), len(ml_model.FEATURE_COLUMNS))
+
+        response = client.post('/api/predict-risk/batch/?shap_method=guess', {'records': [FULL_READING]},
+                               format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(MedicalRecord.objects.count(), 1)
@@ -0,0 +1,98 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from predictor.models import MedicalRecord
+
+from . import explanations
+from .test_predict_api import FULL_READING, PARTIAL_READING
+
+
+class DeferredExplanationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_queue_mode_saves_pending_and_command_fills_shap(self):
+        expected = {
+            'full': self.client.post('/api/predict-risk/', FULL_READING, format='json').json(),
+            'partial': self.client.post('/api/predict-risk/', PARTIAL_READING, format='json').json(),
+        }
+        self.assertEqual(expected['full']['explanation_status'], 'ready')
+
+        with mock.patch.object(explanations, 'EXPLANATION_MODE', 'queue'):
+            deferred = {
+                'full': self.client.post('/api/predict-risk/', FULL_READING, format='json').json(),
+                'partial': self.client.post('/api/predict-risk/', PARTIAL_READING, format='json').json(),
+            }
+
+        for name, body in deferred.items():
+            self.assertEqual(body['explanation_status'], 'pending')
+            self.assertIsNone(body['shap_values'])
+            self.assertAlmostEqual(body['risk_percentage'], expected[name]['risk_percentage'])
+            detail = self.client.get(f"/api/result/{body['record_id']}/").json()
+            self.assertEqual(detail['explanation_status'], 'pending')
+
+        call_command('process_explanations', stdout=mock.MagicMock())
+
+        for name, body in deferred.items():
+            detail = self.client.get(f"/api/result/{body['record_id']}/").json()
+            self.assertEqual(detail['record']['explanation_status'], 'ready')
+            for feature, value in expected[name]['shap_values'].items():
+                self.assertAlmostEqual(detail['record']['shap_values'][feature], value)
+
+    def test_thread_mode_schedules_after_commit(self):
+        with mock.patch.object(explanations, 'EXPLANATION_MODE', 'thread'), \
+                mock.patch.object(explanations, '_get_executor') as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                body = self.client.post('/api/predict-risk/', FULL_READING, format='json').json()
+
+        get_executor.return_value.submit.assert_called_once_with(explanations._explain_in_thread, [body['record_id']])
+        self.assertEqual(MedicalRecord.objects.get(id=body['record_id']).explanation_status, 'pending')
+
+    def test_failed_explanation_is_marked(self):
+        record = MedicalRecord.objects.create(
+            user=self.user, result=40.0, explanation_status=MedicalRecord.EXPLANATION_PENDING,
+            age=50, gender='male', heart_rate=70, systolic_bp=120, diastolic_bp=80, blood_sugar=100
+        )
+        with mock.patch.object(explanations, 'explain_risk_batch', side_effect=RuntimeError("boom")), \
+                self.assertLogs('heartproject.explanations', level='ERROR'):
+            self.assertEqual(explanations.process_pending(), (0, 1))
+
+        record.refresh_from_db()
+        self.assertEqual(record.explanation_status, 'failed')
+        self.assertIsNone(record.shap_values)
+
+    def test_deferred_explanation_keeps_the_requested_shap_method(self):
+        expected = self.client.post('/api/predict-risk/?shap_method=saabas', FULL_READING, format='json').json()
+        with mock.patch.object(explanations, 'EXPLANATION_MODE', 'queue'):
+            body = self.client.post('/api/predict-risk/?shap_method=saabas', FULL_READING, format='json').json()
+        self.assertEqual(MedicalRecord.objects.get(id=body['record_id']).shap_method, 'saabas')
+
+        self.assertEqual(explanations.process_pending(), (1, 0))
+        record = MedicalRecord.objects.get(id=body['record_id'])
+        for feature, value in expected['shap_values'].items():
+            self.assertAlmostEqual(record.shap_values[feature], value)
+
+    def test_claimed_records_wait_for_the_claim_to_expire(self):
+        record = MedicalRecord.objects.create(
+            user=self.user, result=40.0, explanation_status=MedicalRecord.EXPLANATION_PENDING,
+            age=50, gender='male', heart_rate=70, systolic_bp=120, diastolic_bp=80, blood_sugar=100
+        )
+        self.assertEqual([r.id for r in explanations.claim_pending()], [record.id])
+        self.assertEqual(explanations.claim_pending(), [])
+        self.assertEqual(explanations.process_pending(), (0, 0))
+
+        # The processor that claimed it died: the claim expires
+        MedicalRecord.objects.filter(id=record.id).update(
+            explanation_claimed_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(explanations.process_pending(), (1, 0))
+        record.refresh_from_db()
+        self.assertEqual((record.explanation_status, record.explanation_claimed_until), ('ready', None))
@@ -0,0 +1,25 @@
+"""Readings and users shared by the doctor / patient history tests."""
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from predictor.models import Patient
+
+READING = {
+    'age': 50, 'gender': 'male', 'heart_rate': 70, 'systolic_bp': 120,
+    'diastolic_bp': 80, 'blood_sugar': 100, 'ck_mb': 2.5, 'troponin': 0.02
+}
+
+
+class DoctorTestCase(TestCase):
+    """A doctor logged in through self.client."""
+
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doc@test.com', email='doc@test.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def add_patient(self, name='pat'):
+        """Creates a user named `name` and links them to the doctor; returns the Patient."""
+        user = User.objects.create_user(username=f'{name}@test.com', email=f'{name}@test.com', first_name=name)
+        return Patient.objects.create(doctor=self.doctor, user=user)
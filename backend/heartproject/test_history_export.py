@@ -0,0 +1,52 @@
+import csv
+import io
+import json
+
+from django.contrib.auth.models import User
+
+from predictor.models import MedicalRecord
+
+from .test_helpers import READING, DoctorTestCase
+
+
+class HistoryExportTest(DoctorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.add_patient()
+        patient_user = self.patient.user
+        self.full = MedicalRecord.objects.create(
+            user=patient_user, result=62.5, shap_values={'Age': 0.1, 'CK-MB': -0.05, 'Troponin': 0.3}, **READING
+        )
+        self.partial = MedicalRecord.objects.create(
+            user=patient_user, result=20.0, shap_values={'Age': -0.2}, **{**READING, 'ck_mb': 0, 'troponin': 0}
+        )
+        self.url = f'/api/patients/{self.patient.id}/history/export/'
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response = self.client.get(self.url)
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual([int(r['id']) for r in rows], [self.full.id, self.partial.id])
+        self.assertEqual(rows[0]['shap_ck_mb'], '-0.05')
+        self.assertEqual(rows[0]['shap_heart_rate'], '')
+        self.assertEqual(rows[1]['shap_age'], '-0.2')
+
+    def test_ndjson_export(self):
+        response = self.client.get(self.url, {'output': 'ndjson'})
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['shap_troponin'], 0.3)
+        self.assertIsNone(rows[1]['shap_troponin'])
+        self.assertEqual(rows[1]['result'], 20.0)
+
+    def test_export_requires_own_patient_and_known_format(self):
+        self.assertEqual(self.client.get(self.url, {'output': 'xml'}).status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='other@test.com'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
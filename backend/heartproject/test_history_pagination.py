@@ -0,0 +1,64 @@
+from heartproject.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from predictor.models import MedicalRecord
+
+from .test_helpers import READING, DoctorTestCase
+
+
+class HistoryPaginationTest(DoctorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patient = self.add_patient()
+        self.patient_user = self.patient.user
+        self.records = [MedicalRecord.objects.create(user=self.patient_user, result=i, **READING) for i in range(7)]
+        # Two records sharing a timestamp must still be paged exactly once
+        MedicalRecord.objects.filter(id=self.records[4].id).update(created_at=self.records[3].created_at)
+
+    def test_patient_history_walks_all_pages_newest_first(self):
+        url = f'/api/patients/{self.patient.id}/history/'
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(url, params).json()
+            seen.extend(r['id'] for r in data['history'])
+            pages += 1
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, 3)
+        expected = [r.id for r in sorted(
+            MedicalRecord.objects.all(), key=lambda r: (r.created_at, r.id), reverse=True
+        )]
+        self.assertEqual(seen, expected)
+
+    def test_assessment_detail_pages_chart_history(self):
+        url = f'/api/result/{self.records[0].id}/'
+        first = self.client.get(url, {'limit': 4}).json()
+        older = self.client.get(url, {'limit': 4, 'cursor': first['next_cursor']}).json()
+
+        # Each page is chronological; the cursor continues with older records
+        self.assertEqual([h['score'] for h in first['history']], [3, 4, 5, 6])
+        self.assertEqual([h['score'] for h in older['history']], [0, 1, 2])
+        self.assertIsNone(older['next_cursor'])
+
+    def test_page_size_is_capped_and_validated(self):
+        url = f'/api/patients/{self.patient.id}/history/'
+        MedicalRecord.objects.bulk_create([
+            MedicalRecord(user=self.patient_user, result=1, **READING) for _ in range(MAX_PAGE_SIZE)
+        ])
+
+        response = self.client.get(url, {'limit': MAX_PAGE_SIZE * 10})
+        self.assertEqual(len(response.json()['history']), MAX_PAGE_SIZE)
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+
+    def test_history_is_paginated_by_default(self):
+        MedicalRecord.objects.bulk_create([
+            MedicalRecord(user=self.patient_user, result=1, **READING) for _ in range(DEFAULT_PAGE_SIZE)
+        ])
+
+        for url in (f'/api/patients/{self.patient.id}/history/', f'/api/result/{self.records[0].id}/'):
+            data = self.client.get(url).json()
+            self.assertEqual(len(data['history']), DEFAULT_PAGE_SIZE)
+            rest = self.client.get(url, {'cursor': data['next_cursor']}).json()
+            self.assertEqual((len(rest['history']), rest['next_cursor']), (len(self.records), None))
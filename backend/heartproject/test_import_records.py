@@ -0,0 +1,111 @@
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from heartproject import ml_model
+from predictor.management.commands import import_records
+from predictor.models import ImportCheckpoint, MedicalRecord, PatientRiskSummary
+from predictor.rollups import record_assessments
+
+
+class ImportRecordsCommandTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_path = Path(self.tmp.name) / 'readings.csv'
+
+        df = pd.read_csv(ml_model.DATA_PATH).head(25).copy()
+        # A few partial readings and one invalid row
+        df.loc[[3, 7], ['CK-MB', 'Troponin']] = 0
+        df.loc[11, 'Age'] = None
+        df.to_csv(self.csv_path, index=False)
+        self.df = df
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_imports_and_scores_in_chunks(self):
+        out = StringIO()
+        call_command('import_records', str(self.csv_path), '--user', 'pat@test.com', '--chunk-size', '10', stdout=out, stderr=StringIO())
+
+        records = MedicalRecord.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(records.count(), 24)
+        self.assertIn('rows/s', out.getvalue())
+
+        first = records[0]
+        expected_risk, expected_shap = ml_model.predict_risk(ml_model.model_input_from_record({
+            'age': first.age, 'gender': first.gender, 'heart_rate': first.heart_rate,
+            'systolic_bp': first.systolic_bp, 'diastolic_bp': first.diastolic_bp,
+            'blood_sugar': first.blood_sugar, 'ck_mb': first.ck_mb, 'troponin': first.troponin,
+        }))
+        self.assertAlmostEqual(first.result, expected_risk)
+        self.assertEqual(set(first.shap_values), set(expected_shap))
+        self.assertEqual(len(records[3].shap_values), len(ml_model.FEATURE_COLUMNS_REDUCED))
+
+        # The Result column labels the records for retraining
+        expected = self.df.drop(index=11)['Result'].str.lower().tolist()
+        self.assertEqual(list(records.values_list('outcome', flat=True)), expected)
+
+        checkpoint = ImportCheckpoint.objects.get(user=self.user)
+        self.assertEqual(checkpoint.rows_done, 25)
+        self.assertEqual(checkpoint.totals, {'imported': 24, 'invalid': 1, 'partial': 2})
+
+    def test_resume_skips_committed_rows(self):
+        ImportCheckpoint.objects.create(
+            user=self.user, csv_path=str(self.csv_path.resolve()), csv_size=self.csv_path.stat().st_size,
+            rows_done=20, totals={'imported': 19, 'invalid': 1, 'partial': 2},
+        )
+
+        call_command('import_records', str(self.csv_path), '--user', 'pat@test.com', '--resume', stdout=StringIO())
+
+        records = MedicalRecord.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(records.count(), 5)
+        self.assertEqual(records[0].age, int(self.df.loc[20, 'Age']))
+        self.assertEqual(ImportCheckpoint.objects.get(user=self.user).totals['imported'], 24)
+
+    def test_crash_rolls_back_the_chunk_with_its_checkpoint(self):
+        args = ('import_records', str(self.csv_path), '--user', 'pat@test.com', '--chunk-size', '10')
+        real = import_records.record_assessments
+        calls = []
+
+        def crash_on_second_chunk(user, records):
+            calls.append(len(records))
+            if len(calls) == 2:
+                raise RuntimeError("worker killed")
+            return real(user, records)
+
+        with mock.patch.object(import_records, 'record_assessments', crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                call_command(*args, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(MedicalRecord.objects.count(), 10)
+        self.assertEqual(ImportCheckpoint.objects.get(user=self.user).rows_done, 10)
+
+        call_command(*args, '--resume', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(MedicalRecord.objects.count(), 24)
+        self.assertEqual(ImportCheckpoint.objects.get(user=self.user).totals['imported'], 24)
+
+    def test_records_keep_their_source_timestamps(self):
+        record_assessments(self.user, [MedicalRecord.objects.create(
+            user=self.user, result=5.0, age=50, gender='1', heart_rate=70, systolic_bp=120,
+            diastolic_bp=80, blood_sugar=100,
+        )])
+        self.df['Timestamp'] = pd.date_range('2020-01-01', periods=len(self.df), freq='D').astype(str)
+        self.df.loc[5, 'Timestamp'] = 'not a date'
+        self.df.to_csv(self.csv_path, index=False)
+
+        call_command('import_records', str(self.csv_path), '--user', 'pat@test.com', stdout=StringIO(),
+                     stderr=StringIO())
+
+        imported = MedicalRecord.objects.filter(user=self.user, created_at__year=2020).order_by('created_at')
+        self.assertEqual(imported.count(), 23)
+        self.assertEqual(imported[0].created_at, datetime(2020, 1, 1, tzinfo=timezone.utc))
+        # Backdated history is folded into the rollup behind the newer record
+        summary = PatientRiskSummary.objects.get(user=self.user)
+        self.assertEqual((summary.record_count, summary.latest_score), (24, 5.0))
@@ -0,0 +1,81 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from . import metrics, ml_model
+from .metrics import MetricsRegistry
+from .test_predict_api import FULL_READING
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    def test_prometheus_text_format(self):
+        registry = MetricsRegistry(directory=None)
+        requests = registry.counter('requests_total', "Requests.", ('view',))
+        latency = registry.histogram('latency_seconds', "Latency.", ('view',), buckets=(0.1, 1.0))
+        requests.inc('home')
+        requests.inc('home')
+        latency.observe(0.05, 'home')
+        latency.observe(0.5, 'home')
+        latency.observe(5, 'home')
+
+        text = registry.render()
+        self.assertIn('# TYPE requests_total counter\nrequests_total{view="home"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="1.0"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="+Inf"} 3\n', text)
+        self.assertIn('latency_seconds_sum{view="home"} 5.55\n', text)
+        self.assertIn('latency_seconds_count{view="home"} 3\n', text)
+
+    def test_workers_are_summed_through_the_shared_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = MetricsRegistry(directory=tmp)
+            requests = registry.counter('requests_total', "Requests.", ('view',))
+            latency = registry.histogram('latency_seconds', "Latency.", ('view',), buckets=(0.1,))
+            requests.inc('home')
+            latency.observe(0.05, 'home')
+            # Snapshot left by another worker process
+            Path(tmp, 'metrics-999999.json').write_text(json.dumps({
+                'requests_total': [[['home'], 3], [['other'], 1]],
+                'latency_seconds': [[['home'], [[0, 2], 4.0]]],
+            }))
+
+            values = registry.collect()
+
+        self.assertEqual(values['requests_total'], {('home',): 4, ('other',): 1})
+        self.assertEqual(values['latency_seconds'][('home',)], [[1, 2], 4.05])
+
+
+class MetricsEndpointTest(TestCase):
+    def test_prediction_shows_up_in_metrics(self):
+        user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        ml_model.prediction_cache.clear()
+
+        client.post('/api/predict-risk/', FULL_READING, format='json')
+        response = client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertRegex(text, r'heart_http_requests_total\{view="predict_risk",method="POST",status="200"\} \d+')
+        self.assertRegex(text, r'heart_request_phase_duration_seconds_count\{view="predict_risk",phase="shap"\} \d+')
+        self.assertRegex(text, r'heart_shap_duration_seconds_count\{variant="full"\} \d+')
+        self.assertRegex(text, r'heart_assessments_total\{kind="full"\} \d+')
+        self.assertRegex(text, r'heart_prediction_cache_lookups_total\{result="miss"\} \d+')
+        self.assertRegex(text, r'heart_db_queries_per_request_count\{view="predict_risk"\} \d+')
+
+    def test_only_allowed_addresses_or_the_token_can_scrape(self):
+        client = APIClient(REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(client.get('/metrics').status_code, 403)
+
+        with mock.patch.object(metrics, 'METRICS_TOKEN', 's3cret'):
+            self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        with mock.patch.object(metrics, 'METRICS_ALLOWED_IPS', frozenset({'203.0.113.7'})):
+            self.assertEqual(client.get('/metrics').status_code, 200)
@@ -0,0 +1,189 @@
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import shap
+from django.test import SimpleTestCase
+
+from heartproject import ml_model
+from heartproject.ml_model import (
+    ExplainerCache, ModelRegistry, PredictionCache, positive_class_shap, predict_risk
+)
+from heartproject.forest_engine import PackedForest
+from heartproject.tree_shap import NativeTreeShap
+
+SAMPLE_INPUT = {
+    'Age': 50, 'Gender': 1, 'Heart rate': 70,
+    'Systolic blood pressure': 120, 'Diastolic blood pressure': 80,
+    'Blood sugar': 100, 'CK-MB': 2.5, 'Troponin': 0.02
+}
+
+
+class ModelRegistryTest(SimpleTestCase):
+    def test_variant_is_loaded_once(self):
+        registry = ModelRegistry()
+        first = registry.get('full')
+        second = registry.get('full')
+
+        self.assertIs(first, second)
+        self.assertIs(first.model, second.model)
+        stats = registry.stats()
+        self.assertEqual(stats['loads'], 1)
+        self.assertEqual(stats['variants']['full']['hits'], 2)
+        self.assertEqual(len(stats['variants']['full']['checksums']['model']), 64)
+
+    def test_reload_forgets_cached_artifacts(self):
+        registry = ModelRegistry()
+        first = registry.get('reduced')
+        registry.reload('reduced')
+
+        self.assertIsNot(registry.get('reduced'), first)
+        self.assertEqual(registry.stats()['loads'], 2)
+
+    def test_unknown_variant(self):
+        with self.assertRaises(KeyError):
+            ModelRegistry().get('nope')
+
+    def test_predict_risk_uses_shared_registry(self):
+        predict_risk(SAMPLE_INPUT)
+        loads = ml_model.model_registry.stats()['loads']
+        risk, shap_dict = predict_risk(SAMPLE_INPUT)
+
+        self.assertEqual(ml_model.model_registry.stats()['loads'], loads)
+        self.assertTrue(0 <= risk <= 100)
+        self.assertEqual(list(shap_dict), ml_model.FEATURE_COLUMNS)
+
+
+class ExplainerCacheTest(SimpleTestCase):
+    def test_explainer_is_built_once_per_version(self):
+        cache = ExplainerCache(ModelRegistry())
+        loaded = cache.registry.get('full')
+
+        self.assertIs(cache.get(loaded), cache.get(loaded))
+        self.assertIsInstance(cache.get(loaded), NativeTreeShap)
+        self.assertIsNot(cache.get(loaded, backend='shap'), cache.get(loaded))
+
+    def test_warm_up_builds_every_shap_method(self):
+        cache = ExplainerCache(ModelRegistry())
+        cache.warm_up(['full'])
+        version = cache.registry.get('full').version
+
+        self.assertEqual(
+            set(cache.stats()),
+            {f"full:{version}:{backend}" for backend in (cache.backend, 'saabas', 'table')}
+        )
+
+    def test_native_tree_shap_matches_shap(self):
+        df = pd.read_csv(ml_model.DATA_PATH).head(50)
+        for variant in ml_model.MODEL_VARIANTS:
+            loaded = ml_model.model_registry.get(variant)
+            X = loaded.scaler.transform(df[list(loaded.feature_columns)].values)
+
+            native = NativeTreeShap.from_sklearn(loaded.model)
+            reference = shap.TreeExplainer(loaded.model)
+
+            np.testing.assert_allclose(
+                native.shap_values(X), positive_class_shap(reference, X), atol=1e-12
+            )
+            self.assertAlmostEqual(native.expected_value, reference.expected_value[1], places=12)
+            # Local accuracy: base value + contributions == predicted probability
+            np.testing.assert_allclose(
+                native.shap_values(X).sum(axis=1) + native.expected_value,
+                loaded.model.predict_proba(X)[:, 1], atol=1e-12
+            )
+
+
+class PredictionCacheTest(SimpleTestCase):
+    def test_resubmitted_vitals_skip_the_model(self):
+        ml_model.prediction_cache.clear()
+        first = predict_risk(SAMPLE_INPUT)
+        with mock.patch.object(ml_model.LoadedModel, 'predict_positive', side_effect=AssertionError) as predict:
+            second = predict_risk(dict(SAMPLE_INPUT, Age=50.0))
+
+        predict.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertGreaterEqual(ml_model.prediction_cache.stats()['hits'], 1)
+
+    def test_lru_ttl_and_version_invalidation(self):
+        now = [0.0]
+        cache = PredictionCache(max_size=2, ttl=10, clock=lambda: now[0])
+        v1 = SimpleNamespace(variant='full', version='v1')
+        a, b, c = (PredictionCache.key(v1, [i]) for i in range(3))
+
+        cache.put(a, 0.1, {'Age': 1.0})
+        cache.put(b, 0.2, None)
+        self.assertEqual(cache.get(a), (0.1, {'Age': 1.0}))
+        self.assertIsNone(cache.get(b))  # cached without SHAP
+        self.assertEqual(cache.get(b, explain=False), (0.2, None))
+        cache.put(c, 0.3, {})  # evicts a, the least recently used
+        self.assertIsNone(cache.get(a))
+
+        now[0] = 11
+        self.assertIsNone(cache.get(c))
+
+        cache.put(c, 0.3, {})
+        cache.put(PredictionCache.key(SimpleNamespace(variant='full', version='v2'), [0]), 0.4, {})
+        self.assertIsNone(cache.get(c))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class PackedForestTest(SimpleTestCase):
+    def test_probabilities_are_bit_identical_to_sklearn(self):
+        df = pd.read_csv(ml_model.DATA_PATH)
+        rng = np.random.default_rng(0)
+        for variant in ml_model.MODEL_VARIANTS:
+            loaded = ml_model.model_registry.get(variant)
+            X = loaded.scaler.transform(df[list(loaded.feature_columns)].values)
+            X = np.vstack([X, X + rng.normal(size=X.shape)])
+            packed = PackedForest.from_sklearn(loaded.model)
+
+            # Single-threaded sklearn sums trees in estimator order, like the packed engine
+            n_jobs = loaded.model.n_jobs
+            loaded.model.n_jobs = 1
+            try:
+                expected = loaded.model.predict_proba(X)
+            finally:
+                loaded.model.n_jobs = n_jobs
+
+            np.testing.assert_array_equal(packed.predict_proba(X), expected)
+            np.testing.assert_array_equal(packed.predict_proba(X[:1]), expected[:1])
+
+    def test_backend_selection(self):
+        loaded = ml_model.model_registry.get('full')
+        X = loaded.model_input(np.array([list(SAMPLE_INPUT.values())]))
+
+        self.assertAlmostEqual(loaded.predict_positive(X, 'packed')[0], loaded.predict_positive(X, 'sklearn')[0])
+        with self.assertRaises(ValueError):
+            loaded.predict_positive(X, 'gpu')
+
+
+class PackedArtifactTest(SimpleTestCase):
+    def test_mmap_registry_matches_joblib_registry(self):
+        with tempfile.TemporaryDirectory() as packed_dir:
+            ml_model.export_all_packed(packed_dir=packed_dir)
+            mapped = ModelRegistry(artifact_format='mmap', packed_dir=packed_dir)
+            unpickled = ModelRegistry(artifact_format='joblib')
+
+            for variant in ml_model.MODEL_VARIANTS:
+                m_entry, j_entry = mapped.get(variant), unpickled.get(variant)
+                self.assertEqual(m_entry.artifact_format, 'mmap')
+                self.assertEqual(m_entry.version, j_entry.version)
+                self.assertIsInstance(m_entry.packed_forest.threshold, np.memmap)
+                self.assertIsNone(m_entry._model)
+
+                X = np.array([list(SAMPLE_INPUT.values())[:len(m_entry.feature_columns)]])
+                scaled = m_entry.scaler.transform(X)
+                np.testing.assert_array_equal(scaled, j_entry.scaler.transform(X))
+                X = m_entry.model_input(X)
+                np.testing.assert_array_equal(m_entry.predict_positive(X), j_entry.predict_positive(X))
+                np.testing.assert_array_equal(
+                    m_entry.native_explainer.shap_values(X),
+                    NativeTreeShap.from_sklearn(j_entry.model).shap_values(scaled)
+                )
+
+    def test_missing_packed_artifact_falls_back_to_joblib(self):
+        with tempfile.TemporaryDirectory() as packed_dir:
+            entry = ModelRegistry(artifact_format='mmap', packed_dir=packed_dir).get('full')
+        self.assertEqual(entry.artifact_format, 'joblib')
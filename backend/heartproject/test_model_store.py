@@ -0,0 +1,186 @@
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from sklearn.ensemble import RandomForestClassifier
+
+from predictor.models import MedicalRecord
+
+from . import explanations, ml_model
+from .ml_model import ExplainerCache, ModelRegistry, load_model_and_scaler, load_and_prepare_data
+from .model_store import ModelStore
+from .test_predict_api import FULL_READING, PARTIAL_READING
+from .test_ml_model import SAMPLE_INPUT
+
+
+def publish_legacy(store, **kwargs):
+    model, scaler = load_model_and_scaler()
+    return store.publish('full', model, scaler, ml_model.FEATURE_COLUMNS, **kwargs)
+
+
+def publish_small(store):
+    model, scaler = load_model_and_scaler()
+    X, y = load_and_prepare_data(ml_model.FEATURE_COLUMNS)
+    small = RandomForestClassifier(n_estimators=5, max_depth=3, random_state=0).fit(scaler.transform(X), y)
+    return store.publish('full', small, scaler, ml_model.FEATURE_COLUMNS)
+
+
+class ModelStoreTest(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = ModelStore(tmp.name)
+
+    def test_publish_writes_an_immutable_version_and_points_current_at_it(self):
+        model, scaler = load_model_and_scaler()
+        self.assertIsNone(self.store.current_version('full'))
+        version = self.store.publish(
+            'full', model, scaler, ml_model.FEATURE_COLUMNS,
+            metrics={'test_accuracy': 0.9}, params={'n_estimators': 100}
+        )
+
+        self.assertEqual(self.store.current_version('full'), version)
+        manifest = self.store.read_manifest('full', version)
+        self.assertEqual(manifest['feature_columns'], ml_model.FEATURE_COLUMNS)
+        self.assertEqual(manifest['metrics'], {'test_accuracy': 0.9})
+        self.assertEqual(set(manifest['checksums']), {'model', 'scaler'})
+        self.assertTrue((self.store.version_dir('full', version) / 'packed' / 'manifest.json').exists())
+        # Same artifacts, same version
+        self.assertEqual(self.store.publish('full', model, scaler, ml_model.FEATURE_COLUMNS), version)
+        self.assertEqual(len(self.store.list_versions('full')), 1)
+
+    def test_activate_rolls_back_to_a_published_version(self):
+        first = publish_legacy(self.store)
+        second = publish_small(self.store)
+        self.assertEqual(self.store.current_version('full'), second)
+
+        self.store.activate('full', first)
+        self.assertEqual(self.store.current_version('full'), first)
+        with self.assertRaises(FileNotFoundError):
+            self.store.activate('full', 'nope')
+
+
+class HotSwapTest(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = ModelStore(tmp.name)
+        self.registry = ModelRegistry(store=self.store)
+        self.explainers = ExplainerCache(registry=self.registry)
+        self.registry.prepare = self.explainers.get
+
+    def test_registry_serves_the_current_version(self):
+        version = publish_legacy(self.store)
+
+        entry = self.registry.get('full')
+        self.assertEqual(entry.version, version)
+        self.assertEqual(entry.version, ml_model.artifact_version(entry.checksums))
+        self.assertIn('metrics', entry.stats())
+        # Variants without a published version still use the legacy files
+        self.assertEqual(self.registry.get('reduced').version, ModelRegistry().get('reduced').version)
+
+    def test_watcher_only_runs_once_started_and_stops(self):
+        self.assertFalse(ml_model.model_registry.watching)
+        old = self.registry.get('full')
+        self.assertFalse(self.registry.watching)
+
+        self.registry.start_watching(0.01)
+        self.addCleanup(self.registry.stop_watching)
+        version = publish_small(self.store)
+        deadline = time.monotonic() + 10
+        while self.registry.get('full') is old and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.registry.get('full').version, version)
+
+        self.registry.stop_watching(timeout=10)
+        self.assertFalse(self.registry.watching)
+        # get() does not restart a stopped watcher
+        self.registry.get('full')
+        self.assertFalse(self.registry.watching)
+
+    def test_new_version_is_prepared_then_swapped_in(self):
+        old = self.registry.get('full')
+        self.assertEqual(self.registry.check_for_updates(), [])
+
+        version = publish_small(self.store)
+        swapped = self.registry.check_for_updates()
+
+        self.assertEqual([entry.version for entry in swapped], [version])
+        new = self.registry.get('full')
+        self.assertIs(new, swapped[0])
+        self.assertIn(('full', version, self.explainers.backend), self.explainers._explainers)
+        self.assertEqual(self.registry.stats()['swaps'], 1)
+        # Work scored by the old model can still be finished with it
+        self.assertIs(self.registry.get('full', version=old.version), old)
+        self.assertIs(self.registry.get('full', version='unknown'), new)
+
+        X = np.array([list(SAMPLE_INPUT.values())])
+        self.assertNotEqual(old.predict_positive(old.model_input(X))[0], new.predict_positive(new.model_input(X))[0])
+
+
+class RecordModelVersionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_records_store_the_version_that_scored_them(self):
+        full_version = ml_model.model_registry.get('full').version
+        reduced_version = ml_model.model_registry.get('reduced').version
+
+        single = self.client.post('/api/predict-risk/', FULL_READING, format='json').json()
+        batch = self.client.post(
+            '/api/predict-risk/batch/', {'records': [PARTIAL_READING, FULL_READING]}, format='json'
+        ).json()['results']
+
+        self.assertEqual(single['model_version'], full_version)
+        self.assertEqual(MedicalRecord.objects.get(id=single['record_id']).model_version, full_version)
+        self.assertEqual([r['model_version'] for r in batch], [reduced_version, full_version])
+
+
+class DeferredExplanationVersionTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = ModelStore(tmp.name)
+        self.registry = ModelRegistry(store=self.store)
+        for name, value in (('model_registry', self.registry), ('explainer_cache', ExplainerCache(self.registry))):
+            patcher = mock.patch.object(ml_model, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        ml_model.prediction_cache.clear()
+
+        self.user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_queued_record_is_explained_by_the_version_that_scored_it(self):
+        first = publish_legacy(self.store)
+        expected = self.client.post('/api/predict-risk/', FULL_READING, format='json').json()
+        with mock.patch.object(explanations, 'EXPLANATION_MODE', 'queue'):
+            body = self.client.post('/api/predict-risk/', FULL_READING, format='json').json()
+        self.assertEqual(body['model_version'], first)
+
+        # A retrain publishes a new version; the processor starts without the old one
+        second = publish_small(self.store)
+        self.registry.reload()
+        self.assertEqual(self.registry.get('full').version, second)
+
+        self.assertEqual(explanations.process_pending(), (1, 0))
+        record = MedicalRecord.objects.get(id=body['record_id'])
+        for feature, value in expected['shap_values'].items():
+            self.assertAlmostEqual(record.shap_values[feature], value)
+
+    def test_record_of_an_unpublished_version_is_marked_failed(self):
+        publish_legacy(self.store)
+        with mock.patch.object(explanations, 'EXPLANATION_MODE', 'queue'):
+            body = self.client.post('/api/predict-risk/', FULL_READING, format='json').json()
+        MedicalRecord.objects.filter(id=body['record_id']).update(model_version='0123456789ab')
+
+        with self.assertLogs('heartproject.explanations', level='ERROR'):
+            self.assertEqual(explanations.process_pending(), (0, 1))
+        self.assertEqual(MedicalRecord.objects.get(id=body['record_id']).explanation_status, 'failed')
@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from predictor.models import MedicalRecord, Patient
+
+FULL_READING = {
+    "age": 50, "gender": "male", "heart_rate": 70,
+    "systolic_bp": 120, "diastolic_bp": 80, "blood_sugar": 100,
+    "ck_mb": 2.5, "troponin": 0.02
+}
+PARTIAL_READING = {
+    "age": 64, "gender": "female", "heart_rate": 66,
+    "systolic_bp": 160, "diastolic_bp": 83, "blood_sugar": 160
+}
+
+
+class BatchPredictionTest(TestCase):
+    def setUp(self):
+        self.doctor = User.objects.create_user(username='doc@test.com', email='doc@test.com', password='password')
+        self.patient_user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        self.patient = Patient.objects.create(doctor=self.doctor, user=self.patient_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def test_batch_matches_single_predictions(self):
+        single_full = self.client.post('/api/predict-risk/', FULL_READING, format='json').json()
+        single_partial = self.client.post('/api/predict-risk/', PARTIAL_READING, format='json').json()
+
+        response = self.client.post('/api/predict-risk/batch/', {
+            "patient_id": self.patient.id,
+            "records": [PARTIAL_READING, FULL_READING, PARTIAL_READING]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['is_partial_assessment'] for r in results], [True, False, True])
+        self.assertAlmostEqual(results[1]['risk_percentage'], single_full['risk_percentage'])
+        self.assertAlmostEqual(results[0]['risk_percentage'], single_partial['risk_percentage'])
+        for feature, value in single_full['shap_values'].items():
+            self.assertAlmostEqual(results[1]['shap_values'][feature], value)
+
+        saved = MedicalRecord.objects.filter(user=self.patient_user)
+        self.assertEqual(saved.count(), 3)
+        self.assertEqual(sorted(saved.values_list('id', flat=True)), sorted(r['record_id'] for r in results))
+
+    def test_client_supplied_outcome_is_ignored(self):
+        labelled = dict(FULL_READING, outcome='positive')
+        self.client.post('/api/predict-risk/', labelled, format='json')
+        self.client.post('/api/predict-risk/batch/', {"records": [labelled]}, format='json')
+
+        self.assertEqual(MedicalRecord.objects.count(), 2)
+        self.assertFalse(MedicalRecord.objects.exclude(outcome=None).exists())
+
+    def test_batch_rejects_other_doctors_patient(self):
+        other = User.objects.create_user(username='other@test.com', password='password')
+        self.client.force_authenticate(other)
+
+        response = self.client.post('/api/predict-risk/batch/', {
+            "patient_id": self.patient.id, "records": [FULL_READING]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_batch_validation_errors(self):
+        response = self.client.post('/api/predict-risk/batch/', {"records": []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/predict-risk/batch/', {"records": [{"age": 50}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(MedicalRecord.objects.count(), 0)
@@ -0,0 +1,93 @@
+import tempfile
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from predictor.models import MedicalRecord
+
+from . import ml_model, retraining
+from .ml_model import ModelRegistry
+from .model_store import ModelStore
+
+
+class RetrainingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        df = pd.read_csv(ml_model.DATA_PATH).head(300)
+        records = [
+            MedicalRecord(
+                user=user, age=row['Age'], gender=str(row['Gender']), heart_rate=row['Heart rate'],
+                systolic_bp=row['Systolic blood pressure'], diastolic_bp=row['Diastolic blood pressure'],
+                blood_sugar=row['Blood sugar'], ck_mb=row['CK-MB'], troponin=row['Troponin'],
+                outcome=row['Result'], result=50.0
+            )
+            for _, row in df.iterrows()
+        ]
+        # Unlabelled and partial readings
+        records.append(MedicalRecord(user=user, age=50, gender='1', heart_rate=70, systolic_bp=120,
+                                     diastolic_bp=80, blood_sugar=100, ck_mb=2.0, troponin=0.01))
+        records.append(MedicalRecord(user=user, age=60, gender='0', heart_rate=80, systolic_bp=130,
+                                     diastolic_bp=85, blood_sugar=110, outcome='negative'))
+        MedicalRecord.objects.bulk_create(records)
+        cls.df = df
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = ModelStore(tmp.name)
+
+    def test_chunks_stream_labelled_records_in_id_order(self):
+        records = retraining.labelled_records('full')
+        chunks = list(retraining.iter_chunks(records, ml_model.FEATURE_COLUMNS, chunk_size=128))
+
+        self.assertEqual([len(ids) for ids, _, _ in chunks], [128, 128, 44])
+        ids = np.concatenate([ids for ids, _, _ in chunks])
+        self.assertTrue((np.diff(ids) > 0).all())
+        X = np.vstack([X for _, X, _ in chunks])
+        np.testing.assert_array_equal(X, self.df[ml_model.FEATURE_COLUMNS].to_numpy(dtype=float))
+        y = np.concatenate([y for _, _, y in chunks])
+        np.testing.assert_array_equal(y, (self.df['Result'] == 'positive').astype(int))
+        # The partial reading is only used by the reduced model
+        self.assertEqual(retraining.labelled_records('reduced').count(), 301)
+
+    def test_incremental_retrain_grows_the_live_forest_and_publishes_it(self):
+        stats = retraining.retrain(
+            'full', 'incremental', store=self.store, chunk_size=100, trees_per_chunk=5, max_trees=110
+        )
+
+        self.assertEqual((stats['rows'], stats['chunks'], stats['added_trees']), (300, 3, 15))
+        self.assertEqual((stats['n_trees'], stats['dropped_trees']), (110, 5))
+        entry = ModelRegistry(store=self.store).get('full')
+        self.assertEqual(entry.version, stats['version'])
+        self.assertEqual(entry.manifest['params']['trained_through_id'], stats['trained_through_id'])
+        self.assertEqual(len(entry.model.estimators_), 110)
+
+        # Nothing newer than the published version: nothing to do
+        again = retraining.retrain('full', 'incremental', store=self.store, chunk_size=100)
+        self.assertEqual((again['rows'], again['version']), (0, None))
+
+    def test_window_refit_uses_the_newest_records(self):
+        model, scaler, stats = retraining.refit_window(
+            ml_model.model_registry.get('reduced').model, retraining.labelled_records('reduced'),
+            ml_model.FEATURE_COLUMNS_REDUCED, window=150, chunk_size=64
+        )
+
+        self.assertEqual(stats['rows'], 150)
+        self.assertEqual(stats['trained_through_id'], MedicalRecord.objects.latest('id').id)
+        self.assertEqual(scaler.n_samples_seen_, 150)
+
+    def test_compare_reports_every_mode(self):
+        out = StringIO()
+        call_command('retrain_from_records', '--variant', 'reduced', '--compare', '--chunk-size', '100',
+                     '--window', '120', stdout=out)
+
+        rows = [row.split() for row in out.getvalue().splitlines()[2:]]
+        self.assertEqual([row[0] for row in rows], ['live', 'incremental', 'window', 'full'])
+        self.assertEqual(rows[2][1], '120')
+        for row in rows:
+            self.assertTrue(0 <= float(row[-1]) <= 1)
@@ -0,0 +1,84 @@
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from . import ml_model
+from .forest_engine import PackedForest
+from .ml_model import ExplainerCache, LoadedModel, ModelRegistry, positive_class_shap
+from .tree_shap import NativeTreeShap
+
+
+class ScalerFoldingTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = pd.read_csv(ml_model.DATA_PATH)
+
+    def rows(self, entry):
+        return self.df[list(entry.feature_columns)].to_numpy(dtype=np.float64)
+
+    def boundary_probes(self, forest, X):
+        """For every folded threshold r: a row with the feature at r and one just above it."""
+        internal = forest.children[1::2] != np.arange(forest.node_count)
+        thresholds, features = forest.threshold[internal], forest.feature[internal]
+        probes = np.repeat(X.mean(axis=0)[np.newaxis], 2 * len(thresholds), axis=0)
+        probes[0::2][np.arange(len(thresholds)), features] = thresholds
+        probes[1::2][np.arange(len(thresholds)), features] = np.nextafter(thresholds, np.inf)
+        return probes
+
+    def test_folded_forest_takes_identical_decisions_on_raw_features(self):
+        for variant in ml_model.MODEL_VARIANTS:
+            entry = ml_model.model_registry.get(variant)
+            forest = PackedForest.from_sklearn(entry.model)
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                folded = forest.fold_scaler(entry.scaler.mean_, entry.scaler.scale_)
+            self.assertTrue(folded.raw_input)
+
+            X = self.rows(entry)
+            X = np.vstack([X, self.boundary_probes(folded, X)])
+            scaled = entry.scaler.transform(X)
+            np.testing.assert_array_equal(folded.apply(X), forest.apply(scaled))
+            np.testing.assert_array_equal(folded.predict_proba(X), forest.predict_proba(scaled))
+            np.testing.assert_array_equal(folded.compact().predict_proba(X), forest.compact().predict_proba(scaled))
+
+    def test_folded_explainer_gives_identical_shap_values(self):
+        for variant in ml_model.MODEL_VARIANTS:
+            entry = ml_model.model_registry.get(variant)
+            native = NativeTreeShap.from_sklearn(entry.model)
+            folded = native.fold_scaler(entry.scaler.mean_, entry.scaler.scale_)
+
+            X = self.rows(entry)[:40]
+            forest = PackedForest.from_sklearn(entry.model).fold_scaler(entry.scaler.mean_, entry.scaler.scale_)
+            X = np.vstack([X, self.boundary_probes(forest, X)[::97]])
+            np.testing.assert_array_equal(folded.shap_values(X), native.shap_values(entry.scaler.transform(X)))
+            self.assertEqual(folded.expected_value, native.expected_value)
+
+    def test_registry_serves_identical_results_without_the_scaler(self):
+        with tempfile.TemporaryDirectory() as packed_dir:
+            ml_model.export_all_packed(packed_dir=packed_dir)
+            for artifact_format in ('joblib', 'mmap'):
+                registry = ModelRegistry(artifact_format=artifact_format, packed_dir=packed_dir)
+                explainers = ExplainerCache(registry)
+                for variant in ml_model.MODEL_VARIANTS:
+                    entry = registry.get(variant)
+                    self.assertTrue(entry.fold_scaler)
+                    unfolded = LoadedModel(variant, entry.scaler, entry.feature_columns, entry.checksums, None,
+                                           model=entry.model)
+
+                    X = self.rows(entry)[:25]
+                    folded_input = entry.model_input(X)
+                    np.testing.assert_array_equal(folded_input, X)
+                    scaled = unfolded.model_input(X)
+                    np.testing.assert_array_equal(entry.predict_positive(folded_input),
+                                                  unfolded.predict_positive(scaled))
+                    np.testing.assert_array_equal(entry.predict_positive(folded_input, 'sklearn'),
+                                                  unfolded.predict_positive(scaled, 'sklearn'))
+                    for backend in ('native', 'shap'):
+                        np.testing.assert_array_equal(
+                            positive_class_shap(explainers.get(entry, backend), folded_input),
+                            positive_class_shap(ExplainerCache(registry).get(unfolded, backend), scaled),
+                        )
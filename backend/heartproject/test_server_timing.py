@@ -0,0 +1,66 @@
+import json
+import re
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from predictor.models import Patient
+
+from . import middleware, ml_model
+from .test_predict_api import FULL_READING
+
+
+def parse_server_timing(header):
+    return {
+        match.group(1): float(match.group(2))
+        for match in re.finditer(r'(\w+);dur=([\d.]+)', header)
+    }
+
+
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        ml_model.prediction_cache.clear()
+
+    def test_prediction_reports_every_phase(self):
+        with mock.patch.object(middleware, 'SERVER_TIMING_ENABLED', True):
+            response = self.client.post('/api/predict-risk/', FULL_READING, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        phases = parse_server_timing(response['Server-Timing'])
+        for phase in ('auth', 'validate', 'scale', 'infer', 'shap', 'db_save', 'db', 'total'):
+            self.assertIn(phase, phases)
+        self.assertGreaterEqual(phases['total'], phases['shap'])
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+
+    def test_header_is_opt_in_and_skips_streamed_responses(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/me/'))
+
+        doctor = User.objects.create_user(username='doc@test.com', email='doc@test.com', password='password')
+        patient = Patient.objects.create(doctor=doctor, user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(doctor).access_token}")
+        with mock.patch.object(middleware, 'SERVER_TIMING_ENABLED', True):
+            response = self.client.get(f'/api/patients/{patient.id}/history/export/')
+        self.assertTrue(response.streaming)
+        self.assertNotIn('Server-Timing', response)
+
+    def test_structured_log_line(self):
+        with mock.patch.object(middleware, 'TIMING_LOG_ENABLED', True), \
+                self.assertLogs('heartproject.timing', level='INFO') as logs:
+            self.client.get('/api/me/')
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], '/api/me/')
+        self.assertEqual(line['status'], 200)
+        self.assertIn('auth', line['phases_ms'])
+        self.assertGreater(line['db_queries'], 0)
+
+    def test_timed_phase_is_noop_outside_requests(self):
+        with ml_model.timed_phase('scale'):
+            pass
+        self.assertIsNone(ml_model._phase_timings.get())
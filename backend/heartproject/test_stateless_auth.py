@@ -0,0 +1,65 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from predictor.models import MedicalRecord
+
+from . import views
+from .authentication import StatelessJWTAuthentication
+from .test_predict_api import FULL_READING
+
+
+class StatelessJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        # @api_view binds the authentication classes at import, i.e. from HEART_STATELESS_JWT
+        for view in (views.get_profile, views.predict_heart_risk):
+            patcher = mock.patch.object(view.cls, 'authentication_classes', [StatelessJWTAuthentication])
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='pat@test.com', email='pat@test.com', password='password', first_name='Pat', last_name='Doe'
+        )
+        self.client = APIClient()
+        tokens = self.client.post('/api/login/', {'username': 'pat@test.com', 'password': 'password'}, format='json').json()
+        self.refresh = tokens['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+
+    def test_profile_is_served_from_claims(self):
+        self.client.get('/api/me/')  # warms the revocation set
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/me/')
+
+        self.assertEqual(response.json(), {
+            'full_name': 'Pat Doe', 'first_name': 'Pat', 'last_name': 'Doe',
+            'username': 'pat@test.com', 'email': 'pat@test.com', 'role': 'patient'
+        })
+
+    def test_claims_user_works_with_the_orm(self):
+        response = self.client.post('/api/predict-risk/', FULL_READING, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MedicalRecord.objects.get(id=response.json()['record_id']).user, self.user)
+
+    def test_blacklisted_refresh_token_revokes_access_tokens(self):
+        self.assertEqual(self.client.get('/api/me/').status_code, 200)
+        RefreshToken(self.refresh).blacklist()
+
+        self.assertEqual(self.client.get('/api/me/').status_code, 401)
+
+    def test_inactive_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/me/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get('/api/me/').status_code, 401)
+
+    def test_tokens_without_claims_fall_back_to_the_database(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+
+        self.assertEqual(self.client.get('/api/me/').json()['email'], 'pat@test.com')
+
@@ -0,0 +1,41 @@
+import tempfile
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from heartproject import training
+from heartproject.ml_model import DATA_PATH, FEATURE_COLUMNS
+
+
+class DatasetCacheTest(SimpleTestCase):
+    def test_columnar_cache_matches_the_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_dir = training.cache_dataset(DATA_PATH, tmp)
+            self.assertEqual(training.cache_dataset(DATA_PATH, tmp), cache_dir)
+            X, y = training.load_xy(cache_dir, FEATURE_COLUMNS)
+
+        df = pd.read_csv(DATA_PATH)
+        pd.testing.assert_frame_equal(X, df[FEATURE_COLUMNS])
+        np.testing.assert_array_equal(y, (df['Result'] == 'positive').astype(int).to_numpy())
+
+
+class SearchTest(SimpleTestCase):
+    def test_search_records_accuracy_latency_and_size(self):
+        grid = {'n_estimators': [5, 10], 'max_depth': [3]}
+        with tempfile.TemporaryDirectory() as tmp:
+            results = training.run_search(['reduced'], grid, cv=2, workers=2, cache_dir=tmp)
+
+        candidates = results['reduced']['candidates']
+        self.assertEqual(sorted(c['params']['n_estimators'] for c in candidates), [5, 10])
+        for candidate in candidates:
+            for key in ('cv_accuracy_mean', 'test_accuracy', 'infer_ms', 'shap_ms', 'size_bytes', 'node_count'):
+                self.assertGreater(candidate[key], 0)
+
+    def test_selection_respects_the_latency_budget(self):
+        fast = {'cv_accuracy_mean': 0.80, 'latency_ms': 1.0}
+        slow = {'cv_accuracy_mean': 0.90, 'latency_ms': 5.0}
+
+        self.assertEqual(training.select([fast, slow]), (slow, True))
+        self.assertEqual(training.select([fast, slow], latency_budget_ms=2), (fast, True))
+        self.assertEqual(training.select([fast, slow], latency_budget_ms=0.5), (fast, False))
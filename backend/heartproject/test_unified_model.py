@@ -0,0 +1,98 @@
+import tempfile
+from unittest import mock
+
+import numpy as np
+import shap
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from . import ml_model, unified_model
+from .ml_model import ModelRegistry, positive_class_shap, predict_risk
+from .model_store import ModelStore
+from .test_ml_model import SAMPLE_INPUT
+from .test_predict_api import FULL_READING, PARTIAL_READING
+from .tree_shap import BoostedTreeShap
+
+
+class UnifiedModelTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.X_train, cls.X_test, cls.y_train, cls.y_test = unified_model.split()
+        cls.model, cls.scaler = unified_model.train_unified(cls.X_train, cls.y_train, {'max_iter': 20})
+
+    def test_boosted_tree_shap_matches_shap_with_missing_labs(self):
+        explainer = BoostedTreeShap.from_sklearn(self.model)
+        reference = shap.TreeExplainer(self.model)
+        # Fitted on raw features: there is no scaler to fold
+        self.assertIs(explainer.fold_scaler(self.scaler.mean_, self.scaler.scale_), explainer)
+
+        for columns in unified_model.MASKS:
+            X = unified_model.mask_columns(self.X_test[:20], ml_model.FEATURE_COLUMNS, columns)
+            values = explainer.shap_values(X)
+            np.testing.assert_allclose(values, positive_class_shap(reference, X), atol=1e-12)
+            # Local accuracy in log-odds
+            np.testing.assert_allclose(
+                values.sum(axis=1) + explainer.expected_value, self.model.decision_function(X), atol=1e-12
+            )
+
+    def test_compare_scores_both_serving_modes_on_both_subsets(self):
+        pair = {variant: ml_model.model_registry.get(variant) for variant in ('full', 'reduced')}
+        report = unified_model.compare(self.model, self.scaler, pair, self.X_test, self.y_test)
+
+        self.assertEqual(
+            [(r['serving'], r['subset'], r['variant']) for r in report['rows']],
+            [('pair', 'full', 'full'), ('unified', 'full', 'unified'),
+             ('pair', 'partial', 'reduced'), ('unified', 'partial', 'unified')],
+        )
+        for row in report['rows']:
+            self.assertTrue(0.5 <= row['auc'] <= 1)
+        self.assertLess(report['memory_bytes']['unified'], report['memory_bytes']['pair'])
+
+    def test_boosted_versions_are_published_without_a_packed_copy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ModelStore(tmp)
+            version = store.publish('unified', self.model, self.scaler, ml_model.FEATURE_COLUMNS)
+            self.assertFalse((store.version_dir('unified', version) / 'packed').exists())
+
+            entry = ModelRegistry(artifact_format='mmap', store=store).get('unified')
+            self.assertEqual((entry.version, entry.artifact_format), (version, 'joblib'))
+            self.assertTrue(entry.handles_missing)
+            self.assertIsNone(entry.packed_forest)
+
+
+@mock.patch.object(ml_model, 'SERVING_MODE', 'unified')
+class UnifiedServingTest(TestCase):
+    def setUp(self):
+        ml_model.prediction_cache.clear()
+
+    def test_partial_records_route_missing_labs_through_the_same_model(self):
+        entry = ml_model.model_registry.get('unified')
+        complete = np.array([list(SAMPLE_INPUT.values())])
+        partial = dict(SAMPLE_INPUT, **{'CK-MB': 0, 'Troponin': 0})
+
+        risk, shap_dict = predict_risk(partial, use_reduced_model=True)
+        X = unified_model.mask_columns(complete, ml_model.FEATURE_COLUMNS, ml_model.LAB_COLUMNS)
+        self.assertAlmostEqual(risk, entry.model.predict_proba(X)[0, 1] * 100)
+        # SHAP values in probability units, like the pair serves them
+        self.assertAlmostEqual(
+            sum(shap_dict.values()) + ml_model.explainer_cache.get(entry).expected_value,
+            entry.model.predict_proba(X)[0, 1],
+        )
+        # One lab measured: only the other one is missing
+        risk, _ = predict_risk(dict(SAMPLE_INPUT, Troponin=0), explain=False)
+        X = unified_model.mask_columns(complete, ml_model.FEATURE_COLUMNS, ('Troponin',))
+        self.assertAlmostEqual(risk, entry.model.predict_proba(X)[0, 1] * 100)
+
+    def test_api_serves_complete_and_partial_readings_from_one_model(self):
+        user = User.objects.create_user(username='pat@test.com', email='pat@test.com', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        version = ml_model.model_registry.get('unified').version
+
+        for reading, partial in ((FULL_READING, False), (PARTIAL_READING, True)):
+            result = client.post('/api/predict-risk/', reading, format='json').json()
+            self.assertEqual(result['model_version'], version)
+            self.assertEqual(result['is_partial_assessment'], partial)
+            self.assertEqual(len(result['shap_values']), len(ml_model.FEATURE_COLUMNS))
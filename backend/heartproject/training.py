@@ -0,0 +1,315 @@
+"""
+Training pipeline: cached dataset, concurrent hyperparameter search and
+latency-aware model selection.
+
+    python -m heartproject.training [--grid quick] [--cv 5] [--workers N]
+                                    [--latency-budget-ms 5] [--no-save]
+
+1. The CSV is parsed once into a binary columnar cache: one .npy file per
+   column under data/cache/<csv checksum>/. Workers memory-map the cache
+   instead of re-parsing the CSV.
+2. Every (variant, hyperparameters) candidate of both feature sets goes
+   into one process pool. A worker cross-validates its candidate on the
+   training split, refits it and scores it on the held-out split.
+3. The parent measures the serving latency of each candidate one at a
+   time, so concurrent fits do not skew it. This is one row through the
+   scaler, the packed forest and native TreeSHAP. The parent also records
+   the model size.
+4. Per variant, the most accurate candidate (by CV) within the latency
+   budget is published as a new model version (see model_store.py) and
+   made current; serving processes swap it in without a restart. A JSON
+   report of every candidate is written to data/training/.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import StratifiedKFold, cross_val_score, train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from .forest_engine import PackedForest
+from .ml_model import BASE_DIR, DATA_PATH, MODEL_VARIANTS
+from .model_store import ModelStore, file_checksum
+from .tree_shap import NativeTreeShap
+
+DATASET_CACHE_DIR = BASE_DIR / 'data' / 'cache'
+REPORT_DIR = BASE_DIR / 'data' / 'training'
+CACHE_FORMAT_VERSION = 1
+
+# Hyperparameter grids for RandomForestClassifier; 'default' is the
+# configuration train_model() has always used
+GRIDS = {
+    'default': {'n_estimators': [100], 'max_depth': [10]},
+    'quick': {'n_estimators': [50, 100], 'max_depth': [6, 10], 'min_samples_leaf': [1, 5]},
+    'full': {
+        'n_estimators': [25, 50, 100, 200],
+        'max_depth': [4, 6, 8, 10, 14, None],
+        'min_samples_leaf': [1, 2, 5],
+        'max_features': ['sqrt', None],
+    },
+}
+
+# Rows timed per candidate when measuring serving latency
+LATENCY_ROWS = 50
+
+
+# Dataset cache
+
+def cache_dataset(csv_path=DATA_PATH, cache_dir=DATASET_CACHE_DIR):
+    """Parses the CSV into per-column .npy files once per CSV content; returns the cache directory."""
+    cache_dir = Path(cache_dir)
+    target = cache_dir / file_checksum(csv_path)[:16]
+    if (target / 'columns.json').exists():
+        return target
+
+    df = pd.read_csv(csv_path)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir))
+    columns = []
+    for i, name in enumerate(df.columns):
+        values = df[name].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+        np.save(tmp / f'{i}.npy', values)
+        columns.append({'name': name, 'file': f'{i}.npy', 'dtype': str(values.dtype)})
+    (tmp / 'columns.json').write_text(json.dumps({
+        'format_version': CACHE_FORMAT_VERSION,
+        'source': str(csv_path),
+        'rows': len(df),
+        'columns': columns,
+    }, indent=2))
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        # Another process cached the same CSV first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def load_dataset(dataset_dir, columns=None):
+    """{column name: array} from a cache directory, memory-mapped."""
+    dataset_dir = Path(dataset_dir)
+    meta = json.loads((dataset_dir / 'columns.json').read_text())
+    return {
+        column['name']: np.load(dataset_dir / column['file'], mmap_mode='r')
+        for column in meta['columns']
+        if columns is None or column['name'] in columns
+    }
+
+
+def load_xy(dataset_dir, feature_columns):
+    """Features as a DataFrame (like load_and_prepare_data) and the 0/1 target."""
+    data = load_dataset(dataset_dir, [*feature_columns, 'Result'])
+    X = pd.DataFrame({name: np.asarray(data[name]) for name in feature_columns})
+    y = (np.asarray(data['Result']) == 'positive').astype(int)
+    return X, y
+
+
+# Search
+
+def candidate_params(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def split_and_scale(dataset_dir, feature_columns, test_size, random_state):
+    X, y = load_xy(dataset_dir, feature_columns)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=random_state, stratify=y
+    )
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    return scaler, X_train_scaled, X_test_scaled, y_train, y_test, X_test.to_numpy(dtype=float)
+
+
+def evaluate_candidate(variant, params, dataset_dir, cv, test_size, random_state):
+    """Process-pool task: cross-validates, refits and tests one candidate."""
+    feature_columns = MODEL_VARIANTS[variant][0]
+    scaler, X_train, X_test, y_train, y_test, _ = split_and_scale(
+        dataset_dir, feature_columns, test_size, random_state
+    )
+    # One core per candidate; the pool provides the parallelism
+    model = RandomForestClassifier(**params, random_state=random_state, n_jobs=1)
+
+    start = time.perf_counter()
+    folds = StratifiedKFold(n_splits=cv, shuffle=True, random_state=random_state)
+    cv_scores = cross_val_score(model, X_train, y_train, cv=folds)
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    return {
+        'variant': variant,
+        'params': params,
+        'cv_accuracy_mean': float(np.mean(cv_scores)),
+        'cv_accuracy_std': float(np.std(cv_scores)),
+        'test_accuracy': float(accuracy_score(y_test, model.predict(X_test))),
+        'fit_seconds': fit_seconds,
+        'model': model,
+        'scaler': scaler,
+    }
+
+
+def measure_serving(model, scaler, X_rows, packed=None):
+    """
+    Median single-row latency (ms) of packed inference and of native SHAP,
+    both with the scaler folded in as they are served; artifact size.
+    """
+    packed = (packed or PackedForest.from_sklearn(model)).fold_scaler(scaler.mean_, scaler.scale_)
+    explainer = NativeTreeShap.from_sklearn(model).fold_scaler(scaler.mean_, scaler.scale_)
+    infer, shap = [], []
+    for row in X_rows:
+        row = np.asarray(row, dtype=np.float64).reshape(1, -1)
+        start = time.perf_counter()
+        packed.predict_proba(row)
+        middle = time.perf_counter()
+        explainer.shap_values(row)
+        infer.append(middle - start)
+        shap.append(time.perf_counter() - middle)
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return {
+        'infer_ms': float(np.median(infer)) * 1000,
+        'shap_ms': float(np.median(shap)) * 1000,
+        'latency_ms': float(np.median(infer) + np.median(shap)) * 1000,
+        'size_bytes': buffer.tell(),
+        'node_count': int(packed.node_count),
+    }
+
+
+def select(candidates, latency_budget_ms=None):
+    """Most accurate (CV) candidate within the latency budget, else the fastest one."""
+    within = [
+        c for c in candidates
+        if latency_budget_ms is None or c['latency_ms'] <= latency_budget_ms
+    ]
+    if not within:
+        return min(candidates, key=lambda c: c['latency_ms']), False
+    return max(within, key=lambda c: (c['cv_accuracy_mean'], -c['latency_ms'])), True
+
+
+def run_search(variants=None, grid=GRIDS['quick'], cv=5, workers=None, latency_budget_ms=None,
+               test_size=0.2, random_state=42, csv_path=DATA_PATH, cache_dir=DATASET_CACHE_DIR):
+    """
+    Searches `grid` for every variant concurrently.
+
+    Returns:
+        dict: variant -> {'selected': candidate, 'within_budget': bool, 'candidates': [...]},
+        where a candidate holds its params, accuracies, latencies, size, and
+        the fitted 'model' and 'scaler'
+    """
+    variants = list(variants or MODEL_VARIANTS)
+    dataset_dir = cache_dataset(csv_path, cache_dir)
+    tasks = [(variant, params) for variant in variants for params in candidate_params(grid)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(evaluate_candidate, variant, params, dataset_dir, cv, test_size, random_state)
+            for variant, params in tasks
+        ]
+        candidates = [future.result() for future in futures]
+
+    results = {}
+    for variant in variants:
+        _, _, _, _, _, X_test_raw = split_and_scale(
+            dataset_dir, MODEL_VARIANTS[variant][0], test_size, random_state
+        )
+        variant_candidates = [c for c in candidates if c['variant'] == variant]
+        for candidate in variant_candidates:
+            candidate.update(measure_serving(candidate['model'], candidate['scaler'], X_test_raw[:LATENCY_ROWS]))
+        selected, within_budget = select(variant_candidates, latency_budget_ms)
+        results[variant] = {'selected': selected, 'within_budget': within_budget, 'candidates': variant_candidates}
+    return results
+
+
+def _public(candidate):
+    return {k: v for k, v in candidate.items() if k not in ('model', 'scaler')}
+
+
+def write_report(results, report_dir=REPORT_DIR, **settings):
+    report_dir = Path(report_dir)
+    report_dir.mkdir(parents=True, exist_ok=True)
+    path = report_dir / f"report-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    path.write_text(json.dumps({
+        'settings': settings,
+        'variants': {
+            variant: {
+                'selected': _public(result['selected']),
+                'within_budget': result['within_budget'],
+                'candidates': [_public(c) for c in result['candidates']],
+            }
+            for variant, result in results.items()
+        },
+    }, indent=2, default=str))
+    return path
+
+
+def save_selected(results, store=None):
+    """Publishes each variant's selected model as its current version; returns {variant: version}."""
+    store = store or ModelStore()
+    versions = {}
+    for variant, result in results.items():
+        selected = result['selected']
+        model = selected['model']
+        # Serving settings, as train_model() saves them
+        model.n_jobs = -1
+        versions[variant] = store.publish(
+            variant, model, selected['scaler'], MODEL_VARIANTS[variant][0],
+            metrics={k: v for k, v in _public(selected).items() if k not in ('variant', 'params')},
+            params=selected['params'],
+        )
+        print(f"Published {variant} model {versions[variant]} to {store.version_dir(variant, versions[variant])}")
+    return versions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', choices=sorted(GRIDS), default='quick')
+    parser.add_argument('--variants', default=','.join(MODEL_VARIANTS), help="Comma-separated model variants")
+    parser.add_argument('--cv', type=int, default=5, help="Cross-validation folds")
+    parser.add_argument('--workers', type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument('--latency-budget-ms', type=float, default=None,
+                        help="Max single-row inference + SHAP latency of the selected model")
+    parser.add_argument('--no-save', action='store_true', help="Only write the report")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = run_search(
+        args.variants.split(','), GRIDS[args.grid], cv=args.cv, workers=args.workers,
+        latency_budget_ms=args.latency_budget_ms,
+    )
+
+    print(f"{'variant':<8} {'params':<70} {'cv acc':>7} {'test acc':>8} {'infer ms':>8} {'shap ms':>8} {'KiB':>7}")
+    for variant, result in results.items():
+        for c in sorted(result['candidates'], key=lambda c: -c['cv_accuracy_mean']):
+            marker = ' *' if c is result['selected'] else ''
+            print(
+                f"{variant:<8} {json.dumps(c['params']):<70} {c['cv_accuracy_mean']:>7.4f} {c['test_accuracy']:>8.4f} "
+                f"{c['infer_ms']:>8.3f} {c['shap_ms']:>8.3f} {c['size_bytes'] / 1024:>7.0f}{marker}"
+            )
+        if not result['within_budget']:
+            print(f"No {variant} candidate meets {args.latency_budget_ms} ms; selected the fastest")
+
+    report = write_report(results, grid=args.grid, cv=args.cv, latency_budget_ms=args.latency_budget_ms)
+    print(f"Searched in {time.perf_counter() - start:.1f}s; report written to {report}")
+
+    if not args.no_save:
+        save_selected(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""
+Native path-dependent TreeSHAP for the trained Random Forests.
+
+Every leaf of every tree is flattened once into a row of per-feature arrays:
+the interval of values that reaches the leaf (lower < x <= upper) and the
+product of cover ratios of the splits on that feature along its path. With
+those arrays the SHAP value of a sample is a handful of vectorized NumPy
+operations instead of a walk over every node of every tree.
+
+For a leaf l the path-dependent coalition value is
+    v_l(S) = value_l * prod_{f in S} a_lf * prod_{f not in S} b_lf
+where a_lf is 1 when x_f falls inside the leaf interval and b_lf is the
+cover ratio. The Shapley weight of a coalition of size k is the Beta
+integral k!(M-k-1)!/M! = int_0^1 t^k (1-t)^(M-k-1) dt, so the contribution of
+feature i collapses to
+    value_l * (a_li - b_li) * int_0^1 prod_{j != i} (b_lj (1-t) + a_lj t) dt
+The integrand is a polynomial of degree M - 1, which Gauss-Legendre
+quadrature with ceil(M / 2) nodes integrates exactly. This is the same
+quantity the recursive TreeSHAP algorithm computes.
+
+fold_scaler() moves the StandardScaler into the leaf intervals, exactly
+as PackedForest.fold_scaler does for the split thresholds.
+
+SaabasExplainer and LookupTableExplainer are cheaper approximations
+of the exact values, for callers that trade precision for latency (see
+explain_modes.py for their measured error).
+
+BoostedTreeShap applies the same computation to the trees of a
+HistGradientBoostingClassifier. There every leaf also records, per feature,
+whether a missing (NaN) value reaches it through the splits'
+missing_go_to_left routing.
+"""
+import numpy as np
+
+from .forest_engine import CHUNK_ROWS, fold_thresholds
+
+# Value bins per feature of LookupTableExplainer
+TABLE_BINS = 32
+
+
+def _leaf_paths(tree, n_features, class_index):
+    """Flattens one sklearn tree into (values, lower, upper, cover_ratio) per leaf."""
+    left = tree.children_left
+    right = tree.children_right
+    feature = tree.feature
+    threshold = tree.threshold
+    cover = tree.weighted_n_node_samples
+    node_values = tree.value[:, 0, :]
+
+    values, lowers, uppers, ratios = [], [], [], []
+    stack = [(0, np.full(n_features, -np.inf), np.full(n_features, np.inf), np.ones(n_features))]
+    while stack:
+        node, lower, upper, ratio = stack.pop()
+        if left[node] == -1:
+            totals = node_values[node].sum()
+            values.append(node_values[node, class_index] / (totals if totals else 1.0))
+            lowers.append(lower)
+            uppers.append(upper)
+            ratios.append(ratio)
+            continue
+
+        f = feature[node]
+        t = threshold[node]
+        for child, goes_left in ((left[node], True), (right[node], False)):
+            child_lower, child_upper, child_ratio = lower.copy(), upper.copy(), ratio.copy()
+            if goes_left:
+                child_upper[f] = min(child_upper[f], t)
+            else:
+                child_lower[f] = max(child_lower[f], t)
+            child_ratio[f] *= cover[child] / cover[node]
+            stack.append((child, child_lower, child_upper, child_ratio))
+
+    return values, lowers, uppers, ratios
+
+
+def _boosted_leaf_paths(nodes, n_features):
+    """Flattens one HistGradientBoosting predictor into (values, lower, upper, cover_ratio, missing) per leaf."""
+    values, lowers, uppers, ratios, missings = [], [], [], [], []
+    stack = [(0, np.full(n_features, -np.inf), np.full(n_features, np.inf), np.ones(n_features),
+              np.ones(n_features, dtype=bool))]
+    while stack:
+        node, lower, upper, ratio, missing = stack.pop()
+        if nodes['is_leaf'][node]:
+            values.append(nodes['value'][node])
+            lowers.append(lower)
+            uppers.append(upper)
+            ratios.append(ratio)
+            missings.append(missing)
+            continue
+
+        f = nodes['feature_idx'][node]
+        t = nodes['num_threshold'][node]
+        missing_left = nodes['missing_go_to_left'][node]
+        for child, goes_left in ((nodes['left'][node], True), (nodes['right'][node], False)):
+            child_lower, child_upper, child_ratio = lower.copy(), upper.copy(), ratio.copy()
+            child_missing = missing.copy()
+            if goes_left:
+                child_upper[f] = min(child_upper[f], t)
+            else:
+                child_lower[f] = max(child_lower[f], t)
+            child_missing[f] &= bool(missing_left) == goes_left
+            child_ratio[f] *= nodes['count'][child] / nodes['count'][node]
+            stack.append((child, child_lower, child_upper, child_ratio, child_missing))
+
+    return values, lowers, uppers, ratios, missings
+
+
+class NativeTreeShap:
+    """
+    Exact path-dependent TreeSHAP for a fitted RandomForestClassifier.
+
+    Explains the probability of `class_index` (the positive class by
+    default), matching shap.TreeExplainer(model).shap_values(X)[..., 1].
+    """
+
+    # Arrays that fully describe the explainer (see arrays() / packed_artifacts.py)
+    ARRAY_NAMES = ('leaf_values', 'lower', 'upper', 'cover_ratio', 'outside', 'inside')
+
+    def __init__(self, leaf_values, lower, upper, cover_ratio, outside=None, inside=None, raw_input=False):
+        # Averaging over trees is folded into the leaf values. Per-feature arrays
+        # are stored feature-major, (n_features, n_leaves), so every operation
+        # below runs along the long contiguous leaf axis.
+        self.leaf_values = leaf_values
+        self.lower = lower
+        self.upper = upper
+        self.cover_ratio = cover_ratio
+        self.n_features = cover_ratio.shape[0]
+        # True once fold_scaler() has rewritten the intervals for unscaled float64 input
+        self.raw_input = bool(raw_input)
+        self.expected_value = float(leaf_values @ cover_ratio.prod(axis=0))
+
+        # Gauss-Legendre nodes/weights mapped from [-1, 1] onto [0, 1]
+        nodes, weights = np.polynomial.legendre.leggauss(max(1, (self.n_features + 1) // 2))
+        t = ((nodes + 1.0) / 2.0)[:, None, None]
+        self._quad_weights = weights / 2.0
+        # Integrand factors when x_f is outside / inside the leaf interval
+        self.outside = cover_ratio * (1.0 - t) if outside is None else outside
+        self.inside = self.outside + t if inside is None else inside
+
+    @classmethod
+    def from_sklearn(cls, model, class_index=1):
+        n_features = model.n_features_in_
+        n_trees = len(model.estimators_)
+
+        values, lowers, uppers, ratios = [], [], [], []
+        for estimator in model.estimators_:
+            v, lo, up, r = _leaf_paths(estimator.tree_, n_features, class_index)
+            values.extend(v)
+            lowers.extend(lo)
+            uppers.extend(up)
+            ratios.extend(r)
+
+        return cls(
+            leaf_values=np.asarray(values) / n_trees,
+            lower=np.ascontiguousarray(np.asarray(lowers).T),
+            upper=np.ascontiguousarray(np.asarray(uppers).T),
+            cover_ratio=np.ascontiguousarray(np.asarray(ratios).T),
+        )
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    def fold_scaler(self, mean, scale):
+        """Returns a copy that explains unscaled features with identical SHAP values."""
+        if self.raw_input:
+            return self
+        features = np.broadcast_to(np.arange(self.n_features)[:, None], self.lower.shape)
+        bounds = []
+        for bound in (self.lower, self.upper):
+            bound = np.array(bound, dtype=np.float64)
+            finite = np.isfinite(bound)
+            bound[finite] = fold_thresholds(bound[finite], features[finite], mean, scale)
+            bounds.append(bound)
+        return NativeTreeShap(
+            self.leaf_values, bounds[0], bounds[1], self.cover_ratio,
+            outside=self.outside, inside=self.inside, raw_input=True,
+        )
+
+    def _inside(self, x):
+        return (x[:, None] > self.lower) & (x[:, None] <= self.upper)
+
+    def _explain_row(self, x):
+        inside = self._inside(x)
+        g = np.where(inside, self.inside, self.outside)
+        integrand = g.prod(axis=1, keepdims=True) / g
+        integral = np.tensordot(self._quad_weights, integrand, axes=1)
+        return ((inside - self.cover_ratio) * integral) @ self.leaf_values
+
+    def shap_values(self, X):
+        """Returns an (n_samples, n_features) array of SHAP values."""
+        if self.raw_input:
+            X = np.asarray(X, dtype=np.float64)
+        else:
+            # Trees compare float32 inputs against float64 thresholds
+            X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        return np.vstack([self._explain_row(row) for row in X])
+
+
+class BoostedTreeShap(NativeTreeShap):
+    """
+    Exact path-dependent TreeSHAP for a fitted binary
+    HistGradientBoostingClassifier, with NaN allowed in any feature.
+
+    Explains the raw (log-odds) output like shap.TreeExplainer(model): the
+    SHAP values plus expected_value sum to decision_function(X). The trees
+    are fitted on raw float64 inputs, so rows are not cast to float32 and,
+    as for any raw_input explainer, fold_scaler() returns it unchanged.
+    ml_model.ProbabilityExplainer converts the values to probability units
+    for serving.
+    """
+
+    ARRAY_NAMES = NativeTreeShap.ARRAY_NAMES + ('missing',)
+
+    def __init__(self, leaf_values, lower, upper, cover_ratio, missing, base_value=0.0, outside=None, inside=None):
+        super().__init__(leaf_values, lower, upper, cover_ratio, outside=outside, inside=inside, raw_input=True)
+        self.missing = missing
+        self.base_value = float(base_value)
+        self.expected_value += self.base_value
+
+    @classmethod
+    def from_sklearn(cls, model, class_index=1):
+        if len(model.classes_) != 2:
+            raise ValueError("BoostedTreeShap explains binary classifiers only")
+        n_features = model.n_features_in_
+
+        values, lowers, uppers, ratios, missings = [], [], [], [], []
+        for predictors in model._predictors:
+            v, lo, up, r, m = _boosted_leaf_paths(predictors[0].nodes, n_features)
+            values.extend(v)
+            lowers.extend(lo)
+            uppers.extend(up)
+            ratios.extend(r)
+            missings.extend(m)
+
+        return cls(
+            leaf_values=np.asarray(values, dtype=np.float64),
+            lower=np.ascontiguousarray(np.asarray(lowers).T),
+            upper=np.ascontiguousarray(np.asarray(uppers).T),
+            cover_ratio=np.ascontiguousarray(np.asarray(ratios).T),
+            missing=np.ascontiguousarray(np.asarray(missings).T),
+            base_value=np.ravel(model._baseline_prediction)[0],
+        )
+
+    def _inside(self, x):
+        return np.where(np.isnan(x)[:, None], self.missing, super()._inside(x))
+
+
+class SaabasExplainer:
+    """
+    Saabas path attribution on a PackedForest: every split on a sample's
+    path credits its feature with the change of the expected positive-class
+    probability from the node to the child taken.
+
+    One pass down each tree, like PackedForest.apply, instead of the
+    per-leaf integrals of TreeSHAP. The contributions plus expected_value
+    still sum to the predicted probability, but a feature's credit depends
+    on how deep in the trees it is split on.
+    """
+
+    def __init__(self, forest, class_index=1):
+        self.forest = forest
+        self.n_features = forest.n_features
+        # leaf_proba holds the class distribution of internal nodes too
+        self.node_value = np.asarray(forest.leaf_proba[:, class_index], dtype=np.float64)
+        self.expected_value = float(self.node_value[forest.roots].mean())
+
+    def _explain_chunk(self, X):
+        forest = self.forest
+        n_samples = X.shape[0]
+        flat_X = np.ascontiguousarray(X).ravel()
+        row_offsets = (np.arange(n_samples) * self.n_features)[:, np.newaxis]
+
+        contributions = np.zeros(n_samples * self.n_features)
+        nodes = np.broadcast_to(forest.roots, (n_samples, forest.n_trees))
+        for _ in range(forest.max_depth):
+            cells = row_offsets + forest.feature[nodes]
+            children = forest.children[2 * nodes + (flat_X[cells] <= forest.threshold[nodes])]
+            # Leaves point at themselves and add nothing
+            contributions += np.bincount(
+                cells.ravel(), weights=(self.node_value[children] - self.node_value[nodes]).ravel(),
+                minlength=len(contributions),
+            )
+            nodes = children
+        return contributions.reshape(n_samples, self.n_features) / forest.n_trees
+
+    def shap_values(self, X):
+        """Returns an (n_samples, n_features) array of path attributions."""
+        X = np.asarray(X, dtype=np.float64 if self.forest.raw_input else np.float32)
+        if X.shape[0] <= CHUNK_ROWS:
+            return self._explain_chunk(X)
+        return np.vstack([self._explain_chunk(X[i:i + CHUNK_ROWS]) for i in range(0, X.shape[0], CHUNK_ROWS)])
+
+
+class LookupTableExplainer:
+    """
+    Precomputed per-feature lookup of SHAP values.
+
+    Every feature's range is cut into quantile bins of a reference dataset.
+    A feature value is explained by the mean exact SHAP value of that
+    feature over the reference rows in its bin. The approximation is
+    additive: a lookup per feature, with no interactions between features.
+    Its error is measured on the reference rows when the table is built.
+    """
+
+    def __init__(self, edges, table, expected_value):
+        # edges[f]: ascending inner bin edges; table[f]: one value per bin (len(edges[f]) + 1)
+        self.edges = edges
+        self.table = table
+        self.n_features = len(edges)
+        self.expected_value = float(expected_value)
+        self.error = None
+
+    @classmethod
+    def fit(cls, X, shap_values, expected_value, n_bins=TABLE_BINS):
+        """Builds the table from reference rows and their exact SHAP values."""
+        X = np.asarray(X, dtype=np.float64)
+        edges, table = [], []
+        for f in range(X.shape[1]):
+            inner = np.unique(np.quantile(X[:, f], np.linspace(0, 1, n_bins + 1)[1:-1]))
+            bins = np.searchsorted(inner, X[:, f])
+            counts = np.bincount(bins, minlength=len(inner) + 1)
+            sums = np.bincount(bins, weights=shap_values[:, f], minlength=len(inner) + 1)
+            # Bins without reference rows (e.g. above a constant feature) take their neighbours' values
+            filled = np.flatnonzero(counts)
+            edges.append(inner)
+            table.append(np.interp(np.arange(len(counts)), filled, sums[filled] / counts[filled]))
+
+        explainer = cls(edges, table, expected_value)
+        explainer.error = float(np.abs(explainer.shap_values(X) - shap_values).mean())
+        return explainer
+
+    def shap_values(self, X):
+        """Returns an (n_samples, n_features) array of looked-up SHAP values."""
+        X = np.asarray(X, dtype=np.float64)
+        return np.column_stack([
+            self.table[f][np.searchsorted(self.edges[f], X[:, f])] for f in range(self.n_features)
+        ])
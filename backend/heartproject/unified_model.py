@@ -0,0 +1,217 @@
+"""
+One missing-value-aware model in place of the full/reduced model pair.
+
+    python -m heartproject.unified_model [--max-iter 100] [--max-depth 4] [--learning-rate 0.1]
+                                         [--save] [--publish]
+
+Records without CK-MB and Troponin are scored by a second, 6-feature
+forest, so every worker keeps two forests, two scalers and two explainers
+resident. The unified model is a single HistGradientBoostingClassifier over
+all eight features. Each of its splits learns which side a missing (NaN)
+value goes to. Unmeasured labs (stored as 0, see ml_model.is_partial_record)
+are passed as NaN, and a record with only one of the two labs uses the one
+it has.
+
+The CSV has no missing labs, so the training rows are repeated with
+CK-MB, with Troponin and with both masked. The model is fitted on raw
+features. Its pass-through scaler only keeps the (model, scaler) artifact
+layout. SHAP values come from tree_shap.BoostedTreeShap, which is exact,
+path-dependent and NaN-aware. Like shap.TreeExplainer on boosted models,
+it explains the log-odds. ml_model.ProbabilityExplainer rescales the values
+to probability units, so stored and returned SHAP values have the same
+units in both serving modes.
+
+compare() scores both serving modes on the held-out split that training.py
+uses. Every test row is scored twice: complete (where the pair uses the full
+model) and with both labs removed (where the pair uses the reduced model).
+It reports resident memory (models, explainers and packed forests
+as allocated by a worker), median single-row inference and SHAP
+latency, AUC and accuracy. The report is written to data/training/.
+
+--save writes the model to the unversioned paths. They are served until a
+version is published. --publish makes the model the current 'unified'
+version (see model_store.py). Serve it with HEART_SERVING_MODE=unified.
+"""
+import argparse
+import io
+import json
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+from .compression import scores
+from .ml_model import (
+    FEATURE_COLUMNS, FOLD_SCALER, INFERENCE_BACKEND, LAB_COLUMNS, MODEL_PATH_UNIFIED, SCALER_PATH_UNIFIED,
+    ExplainerCache, LoadedModel, ModelRegistry, positive_class_shap,
+)
+from .model_store import ModelStore
+from .training import LATENCY_ROWS, REPORT_DIR, cache_dataset, load_xy
+
+PARAMS = {'max_iter': 100, 'max_depth': 4, 'learning_rate': 0.1}
+
+# Lab columns masked in the repeated training rows
+MASKS = ((), ('CK-MB',), ('Troponin',), LAB_COLUMNS)
+
+
+def mask_columns(X, feature_columns, columns):
+    """Copy of X with `columns` set to NaN."""
+    X = np.array(X, dtype=np.float64)
+    for col in columns:
+        X[:, list(feature_columns).index(col)] = np.nan
+    return X
+
+
+def augment(X, y, feature_columns=FEATURE_COLUMNS, masks=MASKS):
+    """Every row once per mask, so the trees learn where missing labs go."""
+    X = np.vstack([mask_columns(X, feature_columns, columns) for columns in masks])
+    return X, np.tile(np.asarray(y), len(masks))
+
+
+def train_unified(X_raw, y, params=None, random_state=42):
+    """Fits the unified model on complete rows; returns (model, scaler)."""
+    X, y = augment(X_raw, y)
+    # A fixed number of iterations: early stopping would hold out augmented copies of training rows
+    model = HistGradientBoostingClassifier(
+        **{**PARAMS, **(params or {})}, early_stopping=False, random_state=random_state
+    )
+    model.fit(X, y)
+    scaler = StandardScaler(with_mean=False, with_std=False).fit(X_raw)
+    return model, scaler
+
+
+def split(feature_columns=FEATURE_COLUMNS, test_size=0.2, random_state=42):
+    """The train/test rows of training.split_and_scale, unscaled."""
+    X, y = load_xy(cache_dataset(), feature_columns)
+    return train_test_split(X.to_numpy(dtype=float), y, test_size=test_size, random_state=random_state, stratify=y)
+
+
+def load_for_serving(variant, model, scaler, feature_columns, explainers):
+    """What a worker builds for one variant: model, packed forest and explainer."""
+    buffer = io.BytesIO()
+    joblib.dump((model, scaler), buffer)
+    buffer.seek(0)
+
+    tracemalloc.start()
+    try:
+        model, scaler = joblib.load(buffer)
+        loaded = LoadedModel(variant, scaler, feature_columns, {'model': variant}, None, model=model,
+                             fold_scaler=FOLD_SCALER and not isinstance(model, HistGradientBoostingClassifier))
+        if INFERENCE_BACKEND == 'packed':
+            loaded.packed_forest
+        explainers.get(loaded)
+        resident, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return loaded, resident
+
+
+def latency(loaded, explainers, rows):
+    """Median single-row inference and SHAP latency in ms, as predict_risk runs them."""
+    infer, shap = [], []
+    explainer = explainers.get(loaded)
+    for row in rows:
+        start = time.perf_counter()
+        X = loaded.model_input(row.reshape(1, -1))
+        loaded.predict_positive(X)
+        middle = time.perf_counter()
+        positive_class_shap(explainer, X)
+        infer.append(middle - start)
+        shap.append(time.perf_counter() - middle)
+    return float(np.median(infer)) * 1000, float(np.median(shap)) * 1000
+
+
+def compare(model, scaler, pair, X_test, y_test):
+    """
+    Scores the unified model and the pair on complete and lab-less test rows.
+
+    Args:
+        pair (dict): {'full': LoadedModel, 'reduced': LoadedModel} of the live pair
+
+    Returns:
+        dict: {'memory_bytes': {serving mode: bytes}, 'rows': [per (serving mode, subset) scores]}
+    """
+    explainers = ExplainerCache(ModelRegistry())
+    served = {'unified': {'unified': load_for_serving('unified', model, scaler, FEATURE_COLUMNS, explainers)}}
+    served['pair'] = {
+        variant: load_for_serving(variant, entry.model, entry.scaler, entry.feature_columns, explainers)
+        for variant, entry in pair.items()
+    }
+
+    # Unmeasured labs arrive as 0, like model_input_from_record builds them
+    X_partial = X_test.copy()
+    X_partial[:, [FEATURE_COLUMNS.index(col) for col in LAB_COLUMNS]] = 0
+    subsets = {
+        'full': (X_test, {'pair': 'full', 'unified': 'unified'}),
+        'partial': (X_partial, {'pair': 'reduced', 'unified': 'unified'}),
+    }
+
+    rows = []
+    for subset, (X, variants) in subsets.items():
+        for mode, variant in variants.items():
+            loaded, _ = served[mode][variant]
+            X_variant = X[:, [FEATURE_COLUMNS.index(col) for col in loaded.feature_columns]]
+            auc, accuracy = scores(loaded.predict_positive(loaded.model_input(X_variant)), y_test)
+            infer_ms, shap_ms = latency(loaded, explainers, X_variant[:LATENCY_ROWS])
+            rows.append({
+                'serving': mode, 'subset': subset, 'variant': variant, 'auc': auc, 'accuracy': accuracy,
+                'infer_ms': infer_ms, 'shap_ms': shap_ms,
+            })
+
+    memory = {mode: sum(resident for _, resident in variants.values()) for mode, variants in served.items()}
+    return {'memory_bytes': memory, 'rows': rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-iter', type=int, default=PARAMS['max_iter'], help="Boosting iterations")
+    parser.add_argument('--max-depth', type=int, default=PARAMS['max_depth'], help="Depth of every tree")
+    parser.add_argument('--learning-rate', type=float, default=PARAMS['learning_rate'])
+    parser.add_argument('--save', action='store_true', help="Write the model to the unversioned artifact paths")
+    parser.add_argument('--publish', action='store_true', help="Publish the model as the current 'unified' version")
+    args = parser.parse_args(argv)
+    params = {'max_iter': args.max_iter, 'max_depth': args.max_depth, 'learning_rate': args.learning_rate}
+
+    X_train, X_test, y_train, y_test = split()
+    start = time.perf_counter()
+    model, scaler = train_unified(X_train, y_train, params)
+    print(f"Trained the unified model in {time.perf_counter() - start:.1f}s")
+
+    store = ModelStore()
+    registry = ModelRegistry(artifact_format='joblib', store=store)
+    pair = {variant: registry.get(variant) for variant in ('full', 'reduced')}
+    report = compare(model, scaler, pair, X_test, y_test)
+
+    print(f"{'serving':<8} {'subset':<8} {'model':<8} {'AUC':>7} {'acc':>7} {'infer ms':>8} {'shap ms':>8}")
+    for row in report['rows']:
+        print(f"{row['serving']:<8} {row['subset']:<8} {row['variant']:<8} {row['auc']:>7.4f} {row['accuracy']:>7.4f} "
+              f"{row['infer_ms']:>8.3f} {row['shap_ms']:>8.3f}")
+    for mode, resident in report['memory_bytes'].items():
+        print(f"{mode}: {resident / 2 ** 20:.1f} MiB resident")
+
+    full = next(r for r in report['rows'] if r['serving'] == 'unified' and r['subset'] == 'full')
+    if args.save:
+        joblib.dump(model, MODEL_PATH_UNIFIED)
+        joblib.dump(scaler, SCALER_PATH_UNIFIED)
+        print(f"Model saved to {MODEL_PATH_UNIFIED}")
+    if args.publish:
+        version = store.publish(
+            'unified', model, scaler, FEATURE_COLUMNS,
+            metrics={'test_accuracy': full['accuracy'], 'test_auc': full['auc']}, params=params,
+        )
+        report['version'] = version
+        print(f"Published unified model {version}")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = REPORT_DIR / f"unified-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    path.write_text(json.dumps({'settings': vars(args), **report}, indent=2))
+    print(f"Report written to {path}")
+
+
+if __name__ == '__main__':
+    main()
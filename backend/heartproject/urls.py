@@ -18,6 +18,7 @@ urlpatterns = [
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/me/', views.get_profile, name='get_profile'),
     path('api/predict-risk/', views.predict_heart_risk, name='predict_risk'),
+    path('api/predict-risk/batch/', views.predict_heart_risk_batch, name='predict_risk_batch'),
     path('api/history/', views.get_patient_history, name='get_patient_history'),
     path('api/result/<int:record_id>/', views.get_assessment_detail, name='get_assessment_detail'),
     path('predict/', views.predict_page, name='predict_page'),
@@ -27,6 +28,8 @@ urlpatterns = [
     path('api/patients/add/', views.add_patient, name='add_patient'),
     path('api/patients/', views.get_doctor_patients, name='get_doctor_patients'),
     path('api/patients/<int:patient_id>/history/', views.get_specific_patient_history, name='get_specific_patient_history'),
+    path('api/patients/<int:patient_id>/history/export/', views.export_patient_history, name='export_patient_history'),
     path('doctor/patient/<int:patient_id>/', views.patient_history_dashboard, name='patient_history_dashboard'),
+    path('metrics', views.metrics_view, name='metrics'),
     
 ]
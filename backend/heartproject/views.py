@@ -21,9 +21,8 @@ def get_profile(request):
     full_name = user.get_full_name().strip()
     
     # Determine role
-    # If this user has added patients, they are a doctor
-    is_doctor = Patient.objects.filter(doctor=user).exists()
-    role = 'doctor' if is_doctor else 'patient'
+    # If this user has added patients, they are a doctor (cached, see predictor/access.py)
+    role = get_access_context(user).role
 
     return Response({
         "full_name": full_name,
@@ -36,87 +35,108 @@ def get_profile(request):
 
 from predictor.serializers import MedicalRecordSerializer
 from predictor.serializers import MedicalRecordSerializer, PatientSerializer
+from predictor.access import get_access_context
 from predictor.models import MedicalRecord, Patient
-from .ml_model import predict_risk
+from predictor.risk import summarize_risk
+from predictor.rollups import record_assessments
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from . import explanations, metrics
+from .exports import EXPORT_FORMATS
+from .pagination import InvalidPageRequest, keyset_page
+from .ml_model import (
+    SHAP_METHOD, SHAP_METHODS, is_partial_record, model_input_from_record, predict_risk, predict_risk_batch,
+    shap_rows_to_dicts, timed_phase
+)
+
+# Upper bound on records scored by one batch request
+MAX_BATCH_SIZE = 1000
+
+
+def requested_shap_method(request):
+    """SHAP method from ?shap_method= (default: the deployment's), or None if it is not one of SHAP_METHODS."""
+    shap_method = request.query_params.get('shap_method') or SHAP_METHOD
+    return shap_method if shap_method in SHAP_METHODS else None
+
+
+def invalid_shap_method_response():
+    return Response({"error": f"shap_method must be one of {', '.join(SHAP_METHODS)}"}, status=400)
+
+
+def prediction_user_id(request):
+    """
+    User.id a prediction is recorded for: the caller's, or that of the
+    patient request.data['patient_id'] names if the caller added them
+    (None otherwise). Uses the cached access context, not a Patient query.
+    """
+    patient_id = request.data.get('patient_id')
+    if not patient_id:
+        return request.user.pk
+    try:
+        return get_access_context(request.user).patients.get(int(patient_id))
+    except (TypeError, ValueError):
+        return None
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def predict_heart_risk(request):
     # Determine target user
-    target_user = request.user
-    patient_id = request.data.get('patient_id')
-    
-    if patient_id:
-        try:
-            patient = Patient.objects.get(id=patient_id, doctor=request.user)
-            target_user = patient.user
-        except Patient.DoesNotExist:
-            return Response({"error": "Invalid patient ID or permission denied"}, status=403)
-            
+    target_user_id = prediction_user_id(request)
+    if target_user_id is None:
+        return Response({"error": "Invalid patient ID or permission denied"}, status=403)
+
+    # Approximate SHAP for quick-look views: ?shap_method=saabas|table
+    shap_method = requested_shap_method(request)
+    if shap_method is None:
+        return invalid_shap_method_response()
+
     serializer = MedicalRecordSerializer(data=request.data)
-    if serializer.is_valid():
+    with timed_phase('validate'):
+        is_valid = serializer.is_valid()
+    if is_valid:
         try:
             # 1. Prepare data for model
             # We need to map model fields to the keys expected by predict_risk
             # Note: models.py fields are lowercase, but ml_model.py expects specific Capitalized keys
             data = serializer.validated_data
-            
-            model_input = {
-                'Age': data['age'],
-                'Gender': 1 if data['gender'].lower() == 'male' else 0, # Assuming 'male'/'female' input, model likely trained on specific format. ADJUST THIS.
-                # Actually, let's double check what the model expects for Gender. 
-                # For now let's assume the frontend sends numeric or we handle conversion. 
-                # If model expects 0/1, we should probably ensure frontend sends that or we convert.
-                # Let's assume frontend sends 1 for Male, 0 for Female for simplicity based on previous context or common ML datasets.
-                # If 'gender' is text, we need a map. Let's assume direct mapping for now but we might need to revisit.
-                
-                # REVISION during coding: simple mapping based on common dataset encoding: 
-                # Let's trust the input for now but cast to int/float as needed.
-                # Actually proper mapping is safer:
-                # 'Age', 'Gender', 'Heart rate', 'Systolic blood pressure', 'Diastolic blood pressure', 'Blood sugar', 'CK-MB', 'Troponin'
-                
-                # Careful mapping:
-                'Heart rate': data['heart_rate'],
-                'Systolic blood pressure': data['systolic_bp'],
-                'Diastolic blood pressure': data['diastolic_bp'],
-                'Blood sugar': data['blood_sugar'],
-                'CK-MB': data.get('ck_mb', 0) or 0,
-                'Troponin': data.get('troponin', 0) or 0
-            }
-            
-            # Helper to handle gender if it's a string, otherwise pass through
-            if isinstance(data['gender'], str):
-                 model_input['Gender'] = 1 if data['gender'].lower() in ['male', '1'] else 0
-            else:
-                 model_input['Gender'] = int(data['gender'])
-
-            
+            model_input = model_input_from_record(data)
             
             # 2. Get Prediction and Explanations
             
             # Check if we should use the reduced model
             # Logic: If CK-MB and Troponin are effectively 0 (not provided), use 6-feature model
-            use_reduced = False
-            ck_mb_val = data.get('ck_mb', 0)
-            trop_val = data.get('troponin', 0)
-            
-            if (ck_mb_val == 0 or ck_mb_val is None) and (trop_val == 0 or trop_val is None):
-                use_reduced = True
+            use_reduced = is_partial_record(data)
                 
-            risk_percentage, shap_values = predict_risk(model_input, use_reduced_model=use_reduced)
-            
-            # 3. Save to DB
-            record = serializer.save(
-                user=target_user, 
-                result=risk_percentage,
-                shap_values=shap_values
+            # In deferred mode SHAP is left to the background worker (see explanations.py)
+            deferred = explanations.is_deferred()
+            risk_percentage, shap_values, model_version = predict_risk(
+                model_input, use_reduced_model=use_reduced, explain=not deferred, return_version=True,
+                shap_method=shap_method
             )
             
+            # 3. Save to DB and update the patient's dashboard rollup
+            with timed_phase('db_save'), transaction.atomic():
+                record = serializer.save(
+                    user_id=target_user_id,
+                    result=risk_percentage,
+                    shap_values=shap_values,
+                    explanation_status=MedicalRecord.EXPLANATION_PENDING if deferred else MedicalRecord.EXPLANATION_READY,
+                    model_version=model_version,
+                    shap_method=shap_method
+                )
+                record_assessments(target_user_id, [record])
+                if deferred:
+                    explanations.schedule([record])
+            metrics.assessments.inc('partial' if use_reduced else 'full')
+            
             return Response({
                 "status": "success",
                 "risk_percentage": risk_percentage,
                 "shap_values": shap_values, 
+                "explanation_status": record.explanation_status,
                 "record_id": record.id,
+                "model_version": model_version,
+                "shap_method": shap_method,
                 "is_partial_assessment": use_reduced
             })
         
@@ -125,6 +145,96 @@ def predict_heart_risk(request):
     
     return Response(serializer.errors, status=400)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def predict_heart_risk_batch(request):
+    """
+    Scores many readings in one request: {"records": [...], "patient_id": optional}.
+    Rows are routed to the full or reduced model like predict_heart_risk, each
+    group is scored with a single vectorized call and all rows are saved with
+    one bulk_create. Deferred SHAP and ?shap_method= behave like in
+    predict_heart_risk.
+    """
+    target_user_id = prediction_user_id(request)
+    if target_user_id is None:
+        return Response({"error": "Invalid patient ID or permission denied"}, status=403)
+
+    # Approximate SHAP for quick-look views: ?shap_method=saabas|table
+    shap_method = requested_shap_method(request)
+    if shap_method is None:
+        return invalid_shap_method_response()
+
+    records_data = request.data.get('records')
+    if not isinstance(records_data, list) or not records_data:
+        return Response({"error": "records must be a non-empty list"}, status=400)
+    if len(records_data) > MAX_BATCH_SIZE:
+        return Response({"error": f"At most {MAX_BATCH_SIZE} records per batch"}, status=400)
+
+    serializer = MedicalRecordSerializer(data=records_data, many=True)
+    with timed_phase('validate'):
+        is_valid = serializer.is_valid()
+    if not is_valid:
+        return Response(serializer.errors, status=400)
+
+    try:
+        rows = serializer.validated_data
+        partial = [is_partial_record(data) for data in rows]
+        risks = [None] * len(rows)
+        shap_dicts = [None] * len(rows)
+        versions = [''] * len(rows)
+        deferred = explanations.is_deferred()
+        status = MedicalRecord.EXPLANATION_PENDING if deferred else MedicalRecord.EXPLANATION_READY
+
+        for use_reduced in (False, True):
+            indices = [i for i, p in enumerate(partial) if p == use_reduced]
+            if not indices:
+                continue
+            model_inputs = [model_input_from_record(rows[i]) for i in indices]
+            group_risks, shap_matrix, columns, version = predict_risk_batch(
+                model_inputs, use_reduced_model=use_reduced, explain=not deferred, return_version=True,
+                shap_method=shap_method
+            )
+            for i, risk in zip(indices, group_risks.tolist()):
+                risks[i] = risk
+                versions[i] = version
+            if not deferred:
+                for i, shap_dict in zip(indices, shap_rows_to_dicts(shap_matrix, columns)):
+                    shap_dicts[i] = shap_dict
+
+        with timed_phase('db_save'), transaction.atomic():
+            records = MedicalRecord.objects.bulk_create([
+                MedicalRecord(
+                    user_id=target_user_id, result=risk, shap_values=shap_dict, explanation_status=status,
+                    model_version=version, shap_method=shap_method, **data
+                )
+                for data, risk, shap_dict, version in zip(rows, risks, shap_dicts, versions)
+            ])
+            record_assessments(target_user_id, records)
+            if deferred:
+                explanations.schedule(records)
+        n_partial = sum(partial)
+        metrics.assessments.inc('partial', amount=n_partial)
+        metrics.assessments.inc('full', amount=len(partial) - n_partial)
+
+        return Response({
+            "status": "success",
+            "shap_method": shap_method,
+            "results": [
+                {
+                    "record_id": record.id,
+                    "risk_percentage": risk,
+                    "shap_values": shap_dict,
+                    "explanation_status": status,
+                    "model_version": record.model_version,
+                    "is_partial_assessment": is_partial
+                }
+                for record, risk, shap_dict, is_partial in zip(records, risks, shap_dicts, partial)
+            ]
+        })
+
+    except Exception as e:
+        return Response({"error": str(e)}, status=400)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_patient_history(request):
@@ -140,28 +250,31 @@ def get_patient_history(request):
 def get_assessment_detail(request, record_id):
     """
     API endpoint to fetch a specific assessment details and history.
+    The chart history is the patient's most recent page of assessments
+    (?limit=, capped), in chronological order; next_cursor (passed as
+    ?cursor=) fetches the page of older assessments before it.
     """
-    record = get_object_or_404(MedicalRecord, id=record_id)
+    record = get_object_or_404(MedicalRecord.objects.select_related('user'), id=record_id)
+    access = get_access_context(request.user)
     
     # Check permissions: User owns record OR User is doctor of the record owner
-    has_permission = False
-    if record.user == request.user:
-        has_permission = True
-    elif Patient.objects.filter(doctor=request.user, user=record.user).exists():
-        has_permission = True
-        
-    if not has_permission:
+    if not access.can_view(record.user_id):
         return Response({"error": "Permission denied"}, status=403)
 
-    # Fetch history for chart (all records for this user)
-    history = MedicalRecord.objects.filter(user=record.user).order_by('created_at')
+    # Fetch history for chart, newest page first
+    try:
+        history, next_cursor = keyset_page(
+            MedicalRecord.objects.filter(user=record.user).only('id', 'created_at', 'result'), request
+        )
+    except InvalidPageRequest as e:
+        return Response({"error": str(e)}, status=400)
     
     # Serialize
     serializer = MedicalRecordSerializer(record)
     
-    # Simple history data for chart
+    # Simple history data for chart, in chronological order
     history_data = []
-    for h in history:
+    for h in reversed(history):
         history_data.append({
             'id': h.id,
             'date': h.created_at.strftime("%Y-%m-%d"),
@@ -172,7 +285,7 @@ def get_assessment_detail(request, record_id):
     viewer_role = 'patient'
     patient_name = record.user.get_full_name() or record.user.email
     
-    if record.user != request.user:
+    if record.user_id != request.user.pk:
         # If the viewer is not the owner, they must be the doctor (checked above)
         viewer_role = 'doctor'
 
@@ -185,23 +298,19 @@ def get_assessment_detail(request, record_id):
     # Get Patient ID if doctor
     patient_id = None
     if viewer_role == 'doctor':
-        try:
-            p = Patient.objects.get(user=record.user, doctor=request.user)
-            patient_id = p.id
-        except Patient.DoesNotExist:
-            pass
+        patient_id = access.patient_id_for(record.user_id)
 
     # Check if the current user is a doctor (generic check)
-    is_doctor_user = False
-    if request.user.groups.filter(name='Doctor').exists() or Patient.objects.filter(doctor=request.user).exists():
-        is_doctor_user = True
+    is_doctor_user = access.is_doctor_user
 
     return Response({
         "record": serializer.data,
         "history": history_data,
+        "next_cursor": next_cursor,
         "viewer_role": viewer_role,
         "patient_name": patient_name.strip(),
         "is_partial_assessment": is_partial,
+        "explanation_status": record.explanation_status,
         "patient_id": patient_id,
         "is_doctor_user": is_doctor_user
     })
@@ -293,6 +402,7 @@ def auth(request):
 
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import token_claims
 from rest_framework.decorators import permission_classes
 from rest_framework.permissions import AllowAny
 
@@ -318,15 +428,17 @@ def api_login(request):
             # Check if user belongs to the requested role group
             # We assume group names are 'Doctor' and 'Patient'
             group_name = role.capitalize()
-            user_groups = list(user.groups.values_list('name', flat=True))
-            print(f"DEBUG LOGIN: User groups: {user_groups}. Required: {group_name}")
+            access = get_access_context(user)
+            print(f"DEBUG LOGIN: User groups: {sorted(access.groups)}. Required: {group_name}")
             
-            if not user.groups.filter(name=group_name).exists():
+            if not access.in_group(group_name):
                 print(f"DEBUG LOGIN: Role mismatch!")
                 return Response({'error': f'Access denied: You are not registered as a {role}.'}, status=403)
         
-        # Generate tokens
+        # Generate tokens; the claims let StatelessJWTAuthentication skip the user lookup
         refresh = RefreshToken.for_user(user)
+        for claim, value in token_claims(user, get_access_context(user).role).items():
+            refresh[claim] = value
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -370,12 +482,17 @@ def add_patient(request):
 
     # Create link
     # We can optionally accept age/patient_id if sent, but mainly just email is used now.
-    patient = Patient.objects.create(
-        doctor=request.user,
-        user=user,
-        patient_id=request.data.get('patient_id'),
-        age=request.data.get('age')
-    )
+    try:
+        with transaction.atomic():
+            patient = Patient.objects.create(
+                doctor=request.user,
+                user=user,
+                patient_id=request.data.get('patient_id'),
+                age=request.data.get('age')
+            )
+    except IntegrityError:
+        # Concurrent request added the same patient (unique doctor/user constraint)
+        return Response({"error": "Patient already added"}, status=400)
     
     serializer = PatientSerializer(patient)
     return Response(serializer.data, status=201)
@@ -383,45 +500,29 @@ def add_patient(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_doctor_patients(request):
-    """API to get list of patients for the logged-in doctor."""
-    patients = Patient.objects.filter(doctor=request.user).order_by('-created_at')
-    
-    # Calculate risk stats for each patient
+    """
+    API to get list of patients for the logged-in doctor.
+    Risk stats come from the PatientRiskSummary rollup maintained on every
+    new assessment, so the whole list is a single query.
+    """
+    patients = (
+        Patient.objects.filter(doctor=request.user)
+        .select_related('user', 'user__risk_summary')
+        .order_by('-created_at')
+    )
+
     patient_data = []
     for patient in patients:
-        # Get patient serializer data
         p_data = PatientSerializer(patient).data
-        
-        # Fetch last 5 records
-        records = MedicalRecord.objects.filter(user=patient.user).order_by('-created_at')[:5]
-        
-        if records.exists():
-            latest_score = records[0].result or 0
-            
-            # Calculate average of last 5
-            # Filter out None results just in case
-            valid_scores = [r.result for r in records if r.result is not None]
-            avg_score = sum(valid_scores) / len(valid_scores) if valid_scores else 0
-            
-            # Determine Risk Status
-            # Logic: High Risk if (Avg > 70) OR (Latest > 70)
-            if latest_score > 70 or avg_score > 70:
-                risk_status = 'High'
-            elif avg_score > 30:
-                risk_status = 'Moderate'
-            else:
-                risk_status = 'Low'
-                
-            p_data['risk_status'] = risk_status
-            p_data['latest_score'] = round(latest_score, 1)
-            p_data['average_score'] = round(avg_score, 1)
+        summary = getattr(patient.user, 'risk_summary', None)
+        if summary is not None:
+            p_data['risk_status'] = summary.risk_status
+            p_data['latest_score'] = summary.latest_score
+            p_data['average_score'] = summary.average_score
         else:
-            p_data['risk_status'] = 'Unknown'
-            p_data['latest_score'] = 0
-            p_data['average_score'] = 0
-            
+            p_data.update(summarize_risk([]))
         patient_data.append(p_data)
-        
+
     return Response(patient_data)
 
 @api_view(['GET'])
@@ -430,21 +531,62 @@ def get_specific_patient_history(request, patient_id):
     """
     API for DOCTORS to view the history of a specific patient they have added.
     patient_id is the ID of the Patient record (not the User ID).
+    History is returned newest first, one page of ?limit= records (default
+    DEFAULT_PAGE_SIZE, capped at MAX_PAGE_SIZE); pass the returned
+    next_cursor as ?cursor= for older ones.
     """
     # Verify the patient belongs to this doctor
     patient_record = get_object_or_404(Patient, id=patient_id, doctor=request.user)
     target_user = patient_record.user
     
-    records = MedicalRecord.objects.filter(user=target_user).order_by('-created_at')
+    # Newest first, one page at a time
+    try:
+        records, next_cursor = keyset_page(MedicalRecord.objects.filter(user=target_user), request)
+    except InvalidPageRequest as e:
+        return Response({"error": str(e)}, status=400)
     history_serializer = MedicalRecordSerializer(records, many=True)
     patient_serializer = PatientSerializer(patient_record)
     
     return Response({
         "patient": patient_serializer.data,
-        "history": history_serializer.data
+        "history": history_serializer.data,
+        "next_cursor": next_cursor
     })
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_patient_history(request, patient_id):
+    """
+    API for DOCTORS to download a patient's full history as CSV (default)
+    or NDJSON (?output=ndjson), streamed row by row with SHAP values
+    flattened into shap_<feature> columns.
+    """
+    patient_record = get_object_or_404(Patient, id=patient_id, doctor=request.user)
+
+    output = request.query_params.get('output', 'csv')
+    if output not in EXPORT_FORMATS:
+        return Response({"error": f"output must be one of: {', '.join(EXPORT_FORMATS)}"}, status=400)
+    stream, content_type = EXPORT_FORMATS[output]
+
+    records = MedicalRecord.objects.filter(user=patient_record.user)
+    response = StreamingHttpResponse(stream(records), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="patient_{patient_record.id}_history.{output}"'
+    return response
+
 def patient_history_dashboard(request, patient_id):
     """Render the detailed patient history dashboard."""
     # We pass the patient_id to the template so it can fetch data via JS
     return render(request, 'doctor dashboard 2.html', {'patient_id': patient_id})
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, summed over all workers when HEART_METRICS_DIR
+    is set. Plain Django view: scrapers do not carry a JWT, so access is
+    limited to an IP allowlist or a bearer token (see metrics.scrape_allowed).
+    """
+    if not metrics.METRICS_ENABLED:
+        raise Http404
+    if not metrics.scrape_allowed(request):
+        return HttpResponse("Forbidden", status=403, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
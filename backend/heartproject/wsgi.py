@@ -1,9 +1,29 @@
 """
 WSGI config for heartproject.
 """
+import logging
 import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'heartproject.settings')
 application = get_wsgi_application()
 
+# Load model artifacts and build SHAP explainers before the first request.
+# HEART_PRELOAD=1 additionally freezes them for sharing with forked workers;
+# use it with a pre-forking server that imports this module in the master
+# (e.g. gunicorn --preload heartproject.wsgi).
+if os.environ.get('HEART_WARMUP', '1') == '1':
+    from heartproject.ml_model import preload_for_fork, warm_up
+    try:
+        if os.environ.get('HEART_PRELOAD', '0') == '1':
+            preload_for_fork()
+        else:
+            warm_up()
+    except FileNotFoundError as e:
+        logging.getLogger(__name__).warning("Model warmup skipped: %s", e)
+
+# Swap in newly published model versions (HEART_MODEL_POLL_SECONDS); only
+# server processes import this module, so management commands never poll
+from heartproject.ml_model import model_registry  # noqa: E402
+
+model_registry.start_watching()
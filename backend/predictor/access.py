@@ -0,0 +1,140 @@
+"""
+Cached per-user authorization context.
+
+Role, group membership and the doctor-patient links are read on every hot
+endpoint but change rarely. AccessContext bundles them and is kept in the
+Django cache, so permission checks cost no queries after the first one.
+The signal handlers below drop a user's entry when their Patient links or
+groups change. With a per-process cache backend (the default LocMemCache)
+those invalidations do not reach other workers, so entries then live only
+SHORT_CACHE_TTL seconds: a revoked link stops granting access within that
+time everywhere. A shared backend (memcached, Redis, database) sees every
+invalidation and keeps entries for CACHE_TTL. HEART_ACCESS_CACHE_TTL
+overrides both.
+"""
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+
+from .models import Patient
+
+CACHE_KEY = 'access-context:{}'
+CACHE_TTL = 300  # seconds
+SHORT_CACHE_TTL = 5
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class AccessContext:
+    """What one user may see: their groups and, for doctors, their patients."""
+
+    def __init__(self, user_id, groups, patients):
+        self.user_id = user_id
+        self.groups = frozenset(groups)
+        # Patient.id -> the patient's User.id, for the patients this user has added
+        self.patients = dict(patients)
+        self.patient_user_ids = frozenset(self.patients.values())
+        self._patient_ids_by_user = {user_id: patient_id for patient_id, user_id in self.patients.items()}
+
+    @property
+    def role(self):
+        # A user who has added patients is a doctor (see get_profile)
+        return 'doctor' if self.patients else 'patient'
+
+    @property
+    def is_doctor_user(self):
+        return 'Doctor' in self.groups or bool(self.patients)
+
+    def in_group(self, name):
+        return name in self.groups
+
+    def can_view(self, owner_id):
+        """True if records owned by owner_id are visible: their own, or a linked patient's."""
+        return owner_id == self.user_id or owner_id in self.patient_user_ids
+
+    def patient_id_for(self, patient_user_id):
+        """The Patient.id linking this doctor to the given user, or None."""
+        return self._patient_ids_by_user.get(patient_user_id)
+
+
+def load_access_context(user_id):
+    groups = Group.objects.filter(user__id=user_id).values_list('name', flat=True)
+    patients = Patient.objects.filter(doctor_id=user_id).values_list('id', 'user_id')
+    return AccessContext(user_id, list(groups), list(patients))
+
+
+def cache_ttl():
+    """Seconds an AccessContext stays cached; see the module docstring."""
+    ttl = os.environ.get('HEART_ACCESS_CACHE_TTL')
+    if ttl is not None:
+        return float(ttl)
+    if settings.CACHES['default']['BACKEND'] in PER_PROCESS_BACKENDS:
+        return SHORT_CACHE_TTL
+    return CACHE_TTL
+
+
+def get_access_context(user):
+    """The cached AccessContext of a user (or user id); two queries on a miss."""
+    user_id = getattr(user, 'pk', user)
+    key = CACHE_KEY.format(user_id)
+    context = cache.get(key)
+    if context is None:
+        context = load_access_context(user_id)
+        cache.set(key, context, cache_ttl())
+    return context
+
+
+def invalidate_access_context(*user_ids):
+    cache.delete_many([CACHE_KEY.format(user_id) for user_id in user_ids])
+
+
+# Invalidation
+
+def _patient_saving(sender, instance, raw=False, **kwargs):
+    # A reassigned patient leaves the previous doctor's context too
+    instance._previous_doctor_id = None
+    if instance.pk is not None and not raw:
+        instance._previous_doctor_id = (
+            Patient.objects.filter(pk=instance.pk).values_list('doctor_id', flat=True).first()
+        )
+
+
+def _patient_changed(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_doctor_id', None)
+    invalidate_access_context(*{instance.doctor_id, previous} - {None})
+
+
+def _user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_access_context(instance.pk)
+    elif action == 'pre_clear':
+        invalidate_access_context(*instance.user_set.values_list('id', flat=True))
+    else:
+        invalidate_access_context(*pk_set)
+
+
+def _group_changed(sender, instance, **kwargs):
+    # Renamed or deleted group: every member's group names change
+    invalidate_access_context(*instance.user_set.values_list('id', flat=True))
+
+
+def _user_deleted(sender, instance, **kwargs):
+    # Group rows of a deleted user go without m2m signals; ids can be reused
+    invalidate_access_context(instance.pk)
+
+
+def connect_signals():
+    pre_save.connect(_patient_saving, sender=Patient, dispatch_uid='access_context_patient_saving')
+    post_save.connect(_patient_changed, sender=Patient, dispatch_uid='access_context_patient_saved')
+    post_delete.connect(_patient_changed, sender=Patient, dispatch_uid='access_context_patient_deleted')
+    m2m_changed.connect(_user_groups_changed, sender=User.groups.through, dispatch_uid='access_context_groups')
+    post_save.connect(_group_changed, sender=Group, dispatch_uid='access_context_group_saved')
+    pre_delete.connect(_group_changed, sender=Group, dispatch_uid='access_context_group_deleted')
+    post_delete.connect(_user_deleted, sender=User, dispatch_uid='access_context_user_deleted')
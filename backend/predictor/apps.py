@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class PredictorConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'predictor'
+
+    def ready(self):
+        from .access import connect_signals
+        connect_signals()
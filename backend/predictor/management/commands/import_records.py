@@ -0,0 +1,201 @@
+"""
+Bulk import of historical readings from a CSV shaped like data/Medicaldataset.csv.
+
+    python manage.py import_records readings.csv --user patient@example.com
+
+The file is streamed in chunks. Each row is validated with
+MedicalRecordSerializer, each chunk is scored with one vectorized call per
+model (reduced when CK-MB and Troponin are missing) and saved with
+bulk_create inside its own transaction, together with the patient's
+risk rollup and the number of consumed rows (an ImportCheckpoint row).
+A crash therefore loses a chunk and its checkpoint together, and an
+interrupted import continues where it stopped, without duplicates, when
+re-run with --resume. A Result column, when present, is stored as each
+record's confirmed outcome, the label used by `manage.py
+retrain_from_records`. A Timestamp column, when present, dates each record
+(naive values are in TIME_ZONE); without it records are dated at import.
+"""
+import time
+from pathlib import Path
+
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from heartproject.ml_model import is_partial_record, model_input_from_record, predict_risk_batch, shap_rows_to_dicts
+from predictor.models import ImportCheckpoint, MedicalRecord
+from predictor.rollups import record_assessments
+from predictor.serializers import MedicalRecordSerializer
+
+# CSV column -> MedicalRecord field
+CSV_COLUMNS = {
+    'Age': 'age',
+    'Gender': 'gender',
+    'Heart rate': 'heart_rate',
+    'Systolic blood pressure': 'systolic_bp',
+    'Diastolic blood pressure': 'diastolic_bp',
+    'Blood sugar': 'blood_sugar',
+    'CK-MB': 'ck_mb',
+    'Troponin': 'troponin',
+    'Result': 'outcome',
+}
+OPTIONAL_COLUMNS = {'CK-MB', 'Troponin', 'Result'}
+# When the assessment was taken; becomes MedicalRecord.created_at
+TIMESTAMP_COLUMN = 'Timestamp'
+
+
+def row_to_record_data(row):
+    data = {}
+    for column, field in CSV_COLUMNS.items():
+        value = row.get(column)
+        if pd.isna(value):
+            value = None
+        elif field == 'gender':
+            # The dataset encodes gender as 1 (male) / 0 (female)
+            value = str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+        elif field == 'outcome':
+            # Confirmed diagnosis, the label used for retraining
+            value = str(value).strip().lower()
+        data[field] = value
+    return data
+
+
+def row_outcome(data):
+    """The row's confirmed outcome, validated here: the API serializer keeps outcome read-only."""
+    outcome = data.get('outcome')
+    if outcome is not None and outcome not in dict(MedicalRecord.OUTCOME_CHOICES):
+        raise ValueError(f"{outcome!r} is not one of {', '.join(dict(MedicalRecord.OUTCOME_CHOICES))}")
+    return outcome
+
+
+def row_timestamp(row):
+    """The aware datetime of a row's Timestamp column, or None when it has none."""
+    value = row.get(TIMESTAMP_COLUMN)
+    if value is None or pd.isna(value):
+        return None
+    value = pd.Timestamp(value).to_pydatetime()
+    return value if timezone.is_aware(value) else timezone.make_aware(value)
+
+
+class Command(BaseCommand):
+    help = "Stream-import historical medical records from a CSV file, scoring them in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help="CSV with the columns of data/Medicaldataset.csv")
+        parser.add_argument('--user', required=True, help="Username or email of the patient who owns the records")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows read, scored and committed together")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per INSERT inside bulk_create")
+        parser.add_argument('--resume', action='store_true', help="Skip rows already imported according to the checkpoint")
+
+    def handle(self, *args, **options):
+        csv_path = Path(options['csv_path'])
+        if not csv_path.exists():
+            raise CommandError(f"CSV file not found: {csv_path}")
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        user = User.objects.filter(username=options['user']).first() or User.objects.filter(email=options['user']).first()
+        if user is None:
+            raise CommandError(f"User not found: {options['user']}")
+
+        checkpoint = self._checkpoint(csv_path, user, options['resume'])
+        rows_done = checkpoint.rows_done
+        if rows_done:
+            self.stdout.write(f"Resuming after {rows_done} rows")
+
+        missing = set(CSV_COLUMNS) - OPTIONAL_COLUMNS - set(pd.read_csv(csv_path, nrows=0).columns)
+        if missing:
+            raise CommandError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+
+        start = time.perf_counter()
+        processed = 0
+        reader = pd.read_csv(
+            csv_path, chunksize=chunk_size,
+            skiprows=range(1, rows_done + 1) if rows_done else None
+        )
+        for chunk in reader:
+            self._import_chunk(chunk, user, options['batch_size'], checkpoint)
+            processed += len(chunk)
+
+            totals = checkpoint.totals
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{checkpoint.rows_done} rows read, {totals['imported']} imported, {totals['invalid']} invalid "
+                f"({processed / elapsed:.0f} rows/s)"
+            )
+
+        totals = checkpoint.totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['imported']} records for {user.username} "
+            f"({totals['partial']} partial assessments, {totals['invalid']} invalid rows skipped)"
+        ))
+
+    def _import_chunk(self, chunk, user, batch_size, checkpoint):
+        rows, outcomes, timestamps = [], [], []
+        invalid = 0
+        for raw in chunk.to_dict('records'):
+            data = row_to_record_data(raw)
+            serializer = MedicalRecordSerializer(data=data)
+            errors = dict(serializer.errors) if not serializer.is_valid() else {}
+            outcome = timestamp = None
+            try:
+                outcome = row_outcome(data)
+            except ValueError as e:
+                errors['Result'] = [str(e)]
+            try:
+                timestamp = row_timestamp(raw)
+            except ValueError as e:
+                errors[TIMESTAMP_COLUMN] = [str(e)]
+            if not errors:
+                rows.append(serializer.validated_data)
+                outcomes.append(outcome)
+                timestamps.append(timestamp)
+            else:
+                invalid += 1
+                if invalid <= 3:
+                    self.stderr.write(f"Skipping invalid row: {errors}")
+
+        partial = [is_partial_record(data) for data in rows]
+        records = [None] * len(rows)
+        for use_reduced in (False, True):
+            indices = [i for i, p in enumerate(partial) if p == use_reduced]
+            if not indices:
+                continue
+            risks, shap_matrix, columns, version = predict_risk_batch(
+                [model_input_from_record(rows[i]) for i in indices], use_reduced_model=use_reduced,
+                return_version=True
+            )
+            for i, risk, shap_dict in zip(indices, risks.tolist(), shap_rows_to_dicts(shap_matrix, columns)):
+                records[i] = MedicalRecord(
+                    user=user, result=risk, shap_values=shap_dict, model_version=version, outcome=outcomes[i],
+                    **rows[i]
+                )
+                if timestamps[i] is not None:
+                    records[i].created_at = timestamps[i]
+
+        counts = {'imported': len(records), 'invalid': invalid, 'partial': sum(partial)}
+        with transaction.atomic():
+            created = MedicalRecord.objects.bulk_create(records, batch_size=batch_size)
+            record_assessments(user, created)
+            # Committed with the records, so --resume never imports a chunk twice
+            checkpoint.rows_done += len(chunk)
+            checkpoint.totals = {key: checkpoint.totals[key] + value for key, value in counts.items()}
+            checkpoint.save()
+
+    def _checkpoint(self, csv_path, user, resume):
+        """The ImportCheckpoint of this file and user; reset unless resuming."""
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(
+            user=user, csv_path=str(csv_path.resolve()),
+            defaults={'csv_size': csv_path.stat().st_size},
+        )
+        if resume and not created and checkpoint.csv_size != csv_path.stat().st_size:
+            raise CommandError(f"{csv_path} changed since the checkpoint was written")
+        if not resume or created:
+            checkpoint.csv_size = csv_path.stat().st_size
+            checkpoint.rows_done = 0
+            checkpoint.totals = {'imported': 0, 'invalid': 0, 'partial': 0}
+            checkpoint.save()
+        return checkpoint
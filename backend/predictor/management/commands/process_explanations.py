@@ -0,0 +1,43 @@
+"""
+Computes SHAP explanations for records saved with explanation_status='pending'
+(HEART_SHAP_MODE=queue, or thread-mode work lost to a worker restart).
+
+    python manage.py process_explanations [--batch-size N] [--loop] [--poll-interval S] [--retry-failed]
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from heartproject.explanations import EXPLAIN_BATCH_SIZE, process_pending
+from predictor.models import MedicalRecord
+
+
+class Command(BaseCommand):
+    help = "Fill in SHAP values for medical records whose explanation is pending."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXPLAIN_BATCH_SIZE, help="Records explained per batch")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new pending records")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--retry-failed', action='store_true', help="Requeue records whose explanation failed")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            requeued = MedicalRecord.objects.filter(explanation_status=MedicalRecord.EXPLANATION_FAILED).update(
+                explanation_status=MedicalRecord.EXPLANATION_PENDING
+            )
+            self.stdout.write(f"Requeued {requeued} failed explanations")
+
+        total_done = total_failed = 0
+        while True:
+            done, failed = process_pending(batch_size=options['batch_size'])
+            total_done += done
+            total_failed += failed
+            if done or failed:
+                self.stdout.write(f"Explained {done} records ({failed} failed)")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Explained {total_done} records, {total_failed} failed"))
@@ -0,0 +1,48 @@
+"""
+Recomputes PatientRiskSummary rows from MedicalRecord to repair drift
+(e.g. after records were edited or deleted outside the API).
+
+    python manage.py rebuild_risk_rollups [--dry-run]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from predictor.models import PatientRiskSummary
+from predictor.rollups import compute_summaries
+
+COMPARED_FIELDS = (
+    'recent_results', 'latest_score', 'average_score', 'risk_status', 'record_count', 'last_assessment_at'
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-patient risk rollups from the medical records."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report how many rollups drifted")
+
+    def handle(self, *args, **options):
+        expected = compute_summaries()
+        existing = {s.user_id: s for s in PatientRiskSummary.objects.all()}
+
+        drifted = [
+            summary for user_id, summary in expected.items()
+            if user_id not in existing
+            or any(getattr(existing[user_id], f) != getattr(summary, f) for f in COMPARED_FIELDS)
+        ]
+        orphaned = [user_id for user_id in existing if user_id not in expected]
+
+        self.stdout.write(
+            f"{len(expected)} patients with records, {len(drifted)} rollups missing or drifted, "
+            f"{len(orphaned)} rollups without records"
+        )
+        if options['dry_run']:
+            return
+
+        with transaction.atomic():
+            PatientRiskSummary.objects.filter(user_id__in=orphaned).delete()
+            PatientRiskSummary.objects.bulk_create(
+                drifted, batch_size=500,
+                update_conflicts=True, unique_fields=['user'], update_fields=[*COMPARED_FIELDS, 'updated_at'],
+            )
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(drifted) + len(orphaned)} rollups"))
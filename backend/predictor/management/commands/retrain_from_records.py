@@ -0,0 +1,59 @@
+"""
+Retrains the served models from labelled medical records and publishes the
+result as a new model version (see heartproject.retraining).
+
+    python manage.py retrain_from_records [--variant full] [--mode incremental|window|full]
+                                          [--chunk-size N] [--trees-per-chunk N] [--max-trees N]
+                                          [--window N] [--compare] [--no-publish]
+"""
+from django.core.management.base import BaseCommand
+
+from heartproject import retraining
+from heartproject.ml_model import MODEL_VARIANTS
+
+
+class Command(BaseCommand):
+    help = "Retrain the risk models from labelled medical records, streamed from the database in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variant', choices=sorted(MODEL_VARIANTS), action='append',
+                            help="Model variant to retrain (repeatable; default: all)")
+        parser.add_argument('--mode', choices=retraining.MODES, default='incremental')
+        parser.add_argument('--chunk-size', type=int, default=retraining.CHUNK_SIZE, help="Records read per query")
+        parser.add_argument('--trees-per-chunk', type=int, default=retraining.TREES_PER_CHUNK,
+                            help="Trees added per chunk in incremental mode")
+        parser.add_argument('--max-trees', type=int, default=retraining.MAX_TREES,
+                            help="Oldest trees beyond this are dropped in incremental mode (0: no limit)")
+        parser.add_argument('--window', type=int, default=retraining.WINDOW, help="Newest records used in window mode")
+        parser.add_argument('--compare', action='store_true',
+                            help="Compare every mode on a holdout split instead of retraining")
+        parser.add_argument('--no-publish', action='store_true', help="Retrain without publishing a new version")
+
+    def handle(self, *args, **options):
+        train_options = {key: options[key] for key in ('chunk_size', 'trees_per_chunk', 'max_trees', 'window')}
+        for variant in options['variant'] or MODEL_VARIANTS:
+            if options['compare']:
+                self._compare(variant, train_options)
+                continue
+
+            stats = retraining.retrain(
+                variant, options['mode'], publish=not options['no_publish'], **train_options
+            )
+            if not stats['rows']:
+                self.stdout.write(f"{variant}: no new labelled records")
+                continue
+            published = f", published as {stats['version']}" if stats['version'] else ""
+            self.stdout.write(self.style.SUCCESS(
+                f"{variant}: {options['mode']} retrain on {stats['rows']} records in {stats['seconds']:.1f}s, "
+                f"{stats['n_trees']} trees{published}"
+            ))
+
+    def _compare(self, variant, train_options):
+        self.stdout.write(f"{variant}: every {retraining.HOLDOUT_MODULUS}th record held out")
+        self.stdout.write(f"{'mode':<12} {'records':>8} {'trees':>6} {'seconds':>8} {'peak MiB':>9} {'accuracy':>9}")
+        for row in retraining.compare(variant, **train_options):
+            accuracy = 'n/a' if row['holdout_accuracy'] is None else f"{row['holdout_accuracy']:.4f}"
+            self.stdout.write(
+                f"{row['mode']:<12} {row['rows']:>8} {row['n_trees']:>6} {row['seconds']:>8.2f} "
+                f"{row['peak_bytes'] / 2 ** 20:>9.1f} {accuracy:>9}"
+            )
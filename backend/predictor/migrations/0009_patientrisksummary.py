@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of predictor.risk as of this migration; app code may change later
+RECENT_WINDOW = 5
+
+
+def summarize_risk(recent_results):
+    if not recent_results:
+        return {'risk_status': 'Unknown', 'latest_score': 0, 'average_score': 0}
+    latest_score = recent_results[0] or 0
+    valid_scores = [r for r in recent_results if r is not None]
+    avg_score = sum(valid_scores) / len(valid_scores) if valid_scores else 0
+    if latest_score > 70 or avg_score > 70:
+        risk_status = 'High'
+    elif avg_score > 30:
+        risk_status = 'Moderate'
+    else:
+        risk_status = 'Low'
+    return {
+        'risk_status': risk_status,
+        'latest_score': round(latest_score, 1),
+        'average_score': round(avg_score, 1),
+    }
+
+
+def build_rollups(apps, schema_editor):
+    MedicalRecord = apps.get_model('predictor', 'MedicalRecord')
+    PatientRiskSummary = apps.get_model('predictor', 'PatientRiskSummary')
+
+    user_ids = MedicalRecord.objects.filter(user__isnull=False).values_list('user_id', flat=True).distinct()
+    summaries = []
+    for user_id in user_ids:
+        records = MedicalRecord.objects.filter(user_id=user_id).order_by('-created_at', '-id')
+        recent_results = list(records.values_list('result', flat=True)[:RECENT_WINDOW])
+        stats = summarize_risk(recent_results)
+        summaries.append(PatientRiskSummary(
+            user_id=user_id,
+            recent_results=recent_results,
+            latest_score=stats['latest_score'],
+            average_score=stats['average_score'],
+            risk_status=stats['risk_status'],
+            record_count=records.count(),
+            last_assessment_at=records.values_list('created_at', flat=True).first(),
+        ))
+    PatientRiskSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('predictor', '0008_alter_medicalrecord_ck_mb_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientRiskSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='risk_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recent_results', models.JSONField(default=list)),
+                ('latest_score', models.FloatField(default=0)),
+                ('average_score', models.FloatField(default=0)),
+                ('risk_status', models.CharField(default='Unknown', max_length=10)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('last_assessment_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def merge_duplicate_patients(apps, schema_editor):
+    """
+    Merges duplicate (doctor, user) links so the unique constraint can be added.
+
+    The oldest link is kept and takes the patient_id and age of a duplicate
+    where it has none. No table references Patient, so nothing needs to be
+    repointed. Every removed row is printed in full, so the merge can be
+    reviewed and the rows re-created by hand.
+    """
+    Patient = apps.get_model('predictor', 'Patient')
+    fields = ('id', 'doctor_id', 'user_id', 'patient_id', 'age', 'created_at')
+    groups = {}
+    for row in Patient.objects.order_by('id').values(*fields):
+        groups.setdefault((row['doctor_id'], row['user_id']), []).append(row)
+
+    for (doctor_id, user_id), (kept, *duplicates) in groups.items():
+        if not duplicates:
+            continue
+        updates = {}
+        for field in ('patient_id', 'age'):
+            if kept[field] in (None, ''):
+                value = next((d[field] for d in duplicates if d[field] not in (None, '')), None)
+                if value is not None:
+                    updates[field] = value
+        if updates:
+            Patient.objects.filter(id=kept['id']).update(**updates)
+        Patient.objects.filter(id__in=[d['id'] for d in duplicates]).delete()
+
+        print(f"\n  Merged duplicate Patient links of doctor {doctor_id} and user {user_id} into "
+              f"Patient {kept['id']}" + (f" (took {updates})" if updates else ""))
+        for d in duplicates:
+            print(f"    removed {dict(d, created_at=d['created_at'].isoformat())}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictor', '0009_patientrisksummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='record_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['doctor', 'created_at'], name='patient_doctor_created_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_patients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='patient',
+            constraint=models.UniqueConstraint(fields=('doctor', 'user'), name='unique_doctor_patient'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictor', '0010_record_and_patient_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='explanation_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('pending', 'Pending'), ('failed', 'Failed')], db_index=True, default='ready', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictor', '0011_medicalrecord_explanation_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='model_version',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictor', '0014_import_checkpoint_and_record_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='explanation_claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='shap_method',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+    ]
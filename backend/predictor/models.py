@@ -1,7 +1,26 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class MedicalRecord(models.Model):
+    # SHAP explanation lifecycle; 'pending' records are explained by heartproject.explanations
+    EXPLANATION_READY = 'ready'
+    EXPLANATION_PENDING = 'pending'
+    EXPLANATION_FAILED = 'failed'
+    EXPLANATION_STATUS_CHOICES = [
+        (EXPLANATION_READY, 'Ready'),
+        (EXPLANATION_PENDING, 'Pending'),
+        (EXPLANATION_FAILED, 'Failed'),
+    ]
+
+    # Confirmed diagnosis, when known; labelled records are used for retraining
+    OUTCOME_POSITIVE = 'positive'
+    OUTCOME_NEGATIVE = 'negative'
+    OUTCOME_CHOICES = [
+        (OUTCOME_POSITIVE, 'Positive'),
+        (OUTCOME_NEGATIVE, 'Negative'),
+    ]
+
     # Link record to a user (optional, if you want to track who the record belongs to)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     
@@ -19,8 +38,25 @@ class MedicalRecord(models.Model):
     
     # Store SHAP values for explainability
     shap_values = models.JSONField(blank=True, null=True)
+    explanation_status = models.CharField(
+        max_length=10, choices=EXPLANATION_STATUS_CHOICES, default=EXPLANATION_READY, db_index=True
+    )
+    # Artifact version of the model that scored the record (see heartproject.model_store)
+    model_version = models.CharField(max_length=32, blank=True, default='')
+    outcome = models.CharField(max_length=8, choices=OUTCOME_CHOICES, blank=True, null=True)
+    # SHAP method of the explanation (heartproject.ml_model.SHAP_METHODS; '' for the deployment's)
+    shap_method = models.CharField(max_length=8, blank=True, default='')
+    # Until when a processor holds this pending explanation (see heartproject.explanations.claim_pending)
+    explanation_claimed_until = models.DateTimeField(blank=True, null=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Time of the assessment: now for new records, the source timestamp for imported ones
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Every history read filters by user and orders by (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id'], name='record_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Record {self.id} - {self.result}"
@@ -35,5 +71,58 @@ class Patient(models.Model):
     age = models.IntegerField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # A doctor can add a patient only once; also serves (doctor, user) lookups
+            models.UniqueConstraint(fields=['doctor', 'user'], name='unique_doctor_patient'),
+        ]
+        indexes = [
+            # Doctor dashboard: patients of a doctor, newest first
+            models.Index(fields=['doctor', 'created_at'], name='patient_doctor_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.user.email})"
+
+class PatientRiskSummary(models.Model):
+    """
+    Denormalized dashboard rollup of a patient's assessments.
+    Updated incrementally by predictor.rollups.record_assessments() whenever
+    records are created; `manage.py rebuild_risk_rollups` recomputes it.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="risk_summary")
+
+    # Last 5 results, newest first (None for records without a result)
+    recent_results = models.JSONField(default=list)
+    latest_score = models.FloatField(default=0)
+    average_score = models.FloatField(default=0)
+    risk_status = models.CharField(max_length=10, default='Unknown')
+    record_count = models.PositiveIntegerField(default=0)
+    last_assessment_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} - {self.risk_status}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of `manage.py import_records` through one CSV file for one
+    patient. Saved in the transaction of every imported chunk, so it never
+    disagrees with the records that were committed.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="import_checkpoints")
+    csv_path = models.CharField(max_length=1024)
+    csv_size = models.BigIntegerField()
+    rows_done = models.PositiveIntegerField(default=0)
+    # {'imported': n, 'invalid': n, 'partial': n} over rows_done
+    totals = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'csv_path'], name='unique_import_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"{self.csv_path} - {self.rows_done} rows"
@@ -0,0 +1,45 @@
+"""
+Risk status shown on the doctor dashboard, derived from a patient's most
+recent assessments.
+"""
+
+# Number of most recent assessments the dashboard status is based on
+RECENT_WINDOW = 5
+
+
+def summarize_risk(recent_results):
+    """
+    Summarizes a patient's latest assessments.
+
+    Args:
+        recent_results (list): `result` values of the most recent records,
+            newest first (at most RECENT_WINDOW, may contain None)
+
+    Returns:
+        dict: risk_status ('High'/'Moderate'/'Low'/'Unknown'), latest_score
+        and average_score, both rounded to one decimal
+    """
+    if not recent_results:
+        return {'risk_status': 'Unknown', 'latest_score': 0, 'average_score': 0}
+
+    latest_score = recent_results[0] or 0
+
+    # Calculate average of last 5
+    # Filter out None results just in case
+    valid_scores = [r for r in recent_results if r is not None]
+    avg_score = sum(valid_scores) / len(valid_scores) if valid_scores else 0
+
+    # Determine Risk Status
+    # Logic: High Risk if (Avg > 70) OR (Latest > 70)
+    if latest_score > 70 or avg_score > 70:
+        risk_status = 'High'
+    elif avg_score > 30:
+        risk_status = 'Moderate'
+    else:
+        risk_status = 'Low'
+
+    return {
+        'risk_status': risk_status,
+        'latest_score': round(latest_score, 1),
+        'average_score': round(avg_score, 1),
+    }
@@ -0,0 +1,80 @@
+"""
+Maintenance of PatientRiskSummary, the per-patient dashboard rollup.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Window
+from django.db.models.functions import RowNumber
+
+from .models import MedicalRecord, PatientRiskSummary
+from .risk import RECENT_WINDOW, summarize_risk
+
+
+def _apply(summary, recent_results):
+    summary.recent_results = recent_results
+    stats = summarize_risk(recent_results)
+    summary.latest_score = stats['latest_score']
+    summary.average_score = stats['average_score']
+    summary.risk_status = stats['risk_status']
+
+
+def record_assessments(user, records):
+    """
+    Folds newly created records of one user (or user id) into their rollup.
+
+    Costs O(len(records)) regardless of how many records the user already
+    has: only the stored last-5 window, count and timestamp are touched.
+    Records dated before the last assessment (imported history) do not
+    belong at the front of the window; the rollup is then recomputed.
+    """
+    user_id = getattr(user, 'pk', user)
+    records = sorted(records, key=lambda r: (r.created_at, r.id))
+    if not records:
+        return None
+
+    with transaction.atomic():
+        summary, _ = PatientRiskSummary.objects.select_for_update().get_or_create(user_id=user_id)
+        if summary.last_assessment_at is not None and records[0].created_at < summary.last_assessment_at:
+            rebuilt = compute_summaries([user_id])[user_id]
+            rebuilt.save()
+            return rebuilt
+        recent_results = list(summary.recent_results)
+        for record in records:
+            recent_results.insert(0, record.result)
+        _apply(summary, recent_results[:RECENT_WINDOW])
+        summary.record_count += len(records)
+        latest = records[-1].created_at
+        if summary.last_assessment_at is None or latest > summary.last_assessment_at:
+            summary.last_assessment_at = latest
+        summary.save()
+    return summary
+
+
+def compute_summaries(user_ids=None):
+    """Recomputes rollups from MedicalRecord rows (all users with records by default)."""
+    records = MedicalRecord.objects.filter(user__isnull=False)
+    if user_ids is not None:
+        records = records.filter(user_id__in=user_ids)
+
+    summaries = {}
+    for row in records.values('user_id').annotate(count=Count('id'), last=Max('created_at')):
+        summaries[row['user_id']] = PatientRiskSummary(
+            user_id=row['user_id'], record_count=row['count'], last_assessment_at=row['last']
+        )
+
+    recent = {user_id: [] for user_id in summaries}
+    ranked = (
+        records.annotate(rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        ))
+        .filter(rank__lte=RECENT_WINDOW)
+        .order_by('user_id', 'rank')
+        .values_list('user_id', 'result')
+    )
+    for user_id, result in ranked:
+        recent[user_id].append(result)
+
+    for user_id, summary in summaries.items():
+        _apply(summary, recent[user_id])
+    return summaries
@@ -8,9 +8,12 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
             'id', 'age', 'gender', 'heart_rate', 
             'systolic_bp', 'diastolic_bp', 
             'blood_sugar', 'ck_mb', 'troponin',
-            'result', 'created_at', 'shap_values'
+            'result', 'created_at', 'shap_values', 'explanation_status', 'model_version', 'outcome'
+        ]
+        # outcome is a ground-truth label for retraining: only import_records sets it
+        read_only_fields = [
+            'id', 'result', 'created_at', 'shap_values', 'explanation_status', 'model_version', 'outcome'
         ]
-        read_only_fields = ['id', 'result', 'created_at', 'shap_values']
 
 class PatientSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(source='user.first_name', read_only=True)